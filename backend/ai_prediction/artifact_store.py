@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+模型制品存储 - 保存训练好的模型和预处理器，服务启动时直接加载
+
+每次保存生成一个版本目录，包含：
+    models.pkl        ModelManager.save_models 保存的模型、性能指标和最佳模型
+    preprocessor.pkl  DataPreprocessor.save_scalers 保存的特征/目标缩放器和特征列
+    manifest.json     版本号、特征列、训练指标、训练数据指纹、库版本和各文件的 SHA-256
+LATEST 文件记录最新版本号。加载时从 LATEST 开始依次尝试各版本（新到旧），跳过文件缺失、
+校验和不符、特征列或 scikit-learn 版本不一致、训练数据指纹不符的版本。
+
+新版本先写到临时目录再改名，LATEST 用 os.replace 原子更新，读取方不会看到写了一半的版本。
+"""
+
+import os
+import sys
+import json
+import uuid
+import shutil
+import hashlib
+import platform
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 制品格式版本，目录结构或文件内容变化时递增，旧格式的版本不再加载
+ARTIFACT_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+LATEST_NAME = 'LATEST'
+MODELS_FILE = 'models.pkl'
+PREPROCESSOR_FILE = 'preprocessor.pkl'
+
+
+def data_fingerprint(df, columns=None):
+    """训练数据指纹：列名、列类型和逐行内容的 SHA-256
+
+    Args:
+        df: 训练数据DataFrame
+        columns: 参与计算的列，None 表示全部列
+
+    Returns:
+        str: 十六进制摘要
+    """
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[col, str(dtype)] for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def library_versions():
+    """影响模型反序列化的库版本"""
+    import sklearn
+
+    versions = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scikit-learn': sklearn.__version__,
+    }
+    xgboost = sys.modules.get('xgboost')
+    if xgboost is not None:
+        versions['xgboost'] = xgboost.__version__
+    return versions
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _json_safe(value):
+    """将性能指标中的 numpy 数值转为 JSON 可序列化的类型"""
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ModelArtifactStore:
+    """模型制品存储"""
+
+    def __init__(self, root, keep=5):
+        """初始化模型制品存储
+
+        Args:
+            root: 存储根目录，每个版本为其下的一个子目录
+            keep: 保留的版本数，保存新版本后删除更旧的版本
+        """
+        self.root = str(root)
+        self.keep = keep
+        os.makedirs(self.root, exist_ok=True)
+
+    def latest_version(self):
+        """LATEST 记录的版本号，没有时返回 None"""
+        try:
+            with open(os.path.join(self.root, LATEST_NAME), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def list_versions(self):
+        """所有版本号，按创建时间从新到旧"""
+        versions = [
+            entry for entry in os.listdir(self.root)
+            if not entry.startswith('.') and os.path.exists(self._manifest_path(entry))
+        ]
+        # 版本号以创建时间开头
+        return sorted(versions, reverse=True)
+
+    def info(self, version):
+        """版本信息（manifest.json）"""
+        with open(self._manifest_path(version), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, model_manager, preprocessor, data_fingerprint=None, training=None):
+        """保存训练好的模型和预处理器为新版本，并设为最新版本
+
+        Args:
+            model_manager: 已训练的 ModelManager
+            preprocessor: 已拟合的 DataPreprocessor
+            data_fingerprint: 训练数据指纹
+            training: 训练过程信息（数据量、天数、耗时等），原样写入 manifest
+
+        Returns:
+            dict: 版本信息
+        """
+        if not model_manager.is_trained or not preprocessor.is_fitted:
+            raise ValueError("模型未训练或预处理器未拟合，无法保存")
+
+        version = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        temp_path = os.path.join(self.root, f".{version}.tmp")
+        os.makedirs(temp_path)
+        try:
+            if not model_manager.save_models(os.path.join(temp_path, MODELS_FILE)):
+                raise RuntimeError("模型保存失败")
+            preprocessor.save_scalers(os.path.join(temp_path, PREPROCESSOR_FILE))
+
+            manifest = {
+                'format': ARTIFACT_FORMAT,
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'feature_columns': list(preprocessor.feature_columns),
+                'best_model': model_manager.best_model_name,
+                'models': list(model_manager.models),
+                'performance': _json_safe(model_manager.performance),
+                'training': _json_safe(training or {}),
+                'data_fingerprint': data_fingerprint,
+                'libraries': library_versions(),
+                'files': {
+                    name: {
+                        'sha256': _file_sha256(os.path.join(temp_path, name)),
+                        'size': os.path.getsize(os.path.join(temp_path, name)),
+                    }
+                    for name in (MODELS_FILE, PREPROCESSOR_FILE)
+                },
+            }
+            with open(os.path.join(temp_path, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.rename(temp_path, self._version_path(version))
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+        self._set_latest(version)
+        self._prune()
+        print(f"💾 模型制品已保存: {version}")
+        return manifest
+
+    def validate(self, version, feature_columns=None, data_fingerprint=None):
+        """检查版本是否可以加载
+
+        Returns:
+            tuple: (是否有效, 无效原因)
+        """
+        try:
+            manifest = self.info(version)
+        except (OSError, ValueError) as e:
+            return False, f"manifest 无法读取: {e}"
+
+        if manifest.get('format') != ARTIFACT_FORMAT:
+            return False, f"制品格式 {manifest.get('format')} 与当前格式 {ARTIFACT_FORMAT} 不一致"
+        if feature_columns is not None and manifest.get('feature_columns') != list(feature_columns):
+            return False, "特征列不一致"
+        if data_fingerprint is not None and manifest.get('data_fingerprint') != data_fingerprint:
+            return False, "训练数据已变化"
+
+        # 跨 scikit-learn 版本反序列化的模型可能无法使用或结果不同
+        saved_sklearn = manifest.get('libraries', {}).get('scikit-learn')
+        current_sklearn = library_versions()['scikit-learn']
+        if saved_sklearn != current_sklearn:
+            return False, f"scikit-learn 版本不一致: {saved_sklearn} != {current_sklearn}"
+
+        for name, meta in manifest.get('files', {}).items():
+            path = os.path.join(self._version_path(version), name)
+            if not os.path.exists(path):
+                return False, f"缺少文件 {name}"
+            if os.path.getsize(path) != meta['size'] or _file_sha256(path) != meta['sha256']:
+                return False, f"文件 {name} 校验和不符"
+        return True, None
+
+    def load(self, model_manager, preprocessor, data_fingerprint=None, version=None):
+        """加载最新的有效版本到 model_manager 和 preprocessor
+
+        Args:
+            model_manager: ModelManager，加载后为已训练状态
+            preprocessor: DataPreprocessor，加载后为已拟合状态
+            data_fingerprint: 只加载用该指纹的数据训练的版本，None 表示不检查
+            version: 只加载指定版本，None 表示从 LATEST 开始依次尝试
+
+        Returns:
+            dict: 加载的版本信息，没有有效版本时返回 None
+        """
+        if version is not None:
+            candidates = [version]
+        else:
+            latest = self.latest_version()
+            candidates = [latest] if latest else []
+            candidates += [v for v in self.list_versions() if v != latest]
+
+        for candidate in candidates:
+            valid, reason = self.validate(candidate, preprocessor.feature_columns, data_fingerprint)
+            if not valid:
+                print(f"⚠️ 跳过模型制品 {candidate}: {reason}")
+                continue
+            path = self._version_path(candidate)
+            try:
+                preprocessor.load_scalers(os.path.join(path, PREPROCESSOR_FILE))
+            except Exception as e:
+                print(f"⚠️ 跳过模型制品 {candidate}: 预处理器加载失败: {e}")
+                continue
+            if not model_manager.load_models(os.path.join(path, MODELS_FILE)):
+                preprocessor.is_fitted = False
+                continue
+            return self.info(candidate)
+        return None
+
+    def delete(self, version):
+        """删除版本"""
+        shutil.rmtree(self._version_path(version), ignore_errors=True)
+
+    def _version_path(self, version):
+        return os.path.join(self.root, version)
+
+    def _manifest_path(self, version):
+        return os.path.join(self._version_path(version), MANIFEST_NAME)
+
+    def _set_latest(self, version):
+        temp_file = os.path.join(self.root, f".{LATEST_NAME}.{uuid.uuid4().hex}")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(temp_file, os.path.join(self.root, LATEST_NAME))
+
+    def _prune(self):
+        """只保留最新的 keep 个版本（LATEST 指向的版本始终保留）"""
+        if not self.keep:
+            return
+        latest = self.latest_version()
+        for version in self.list_versions()[self.keep:]:
+            if version != latest:
+                self.delete(version)
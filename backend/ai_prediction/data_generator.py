@@ -2,157 +2,273 @@
 # -*- coding: utf-8 -*-
 """
 数据生成器 - 生成电力负荷训练数据
+
+按列向量化生成：时、星期、月等字段直接取自时间索引，各项随机噪声用 np.random.Generator
+一次性整列抽取，负荷规则用 np.select/np.where 按整列计算。
+
+iter_feeder_batches 为多条馈线流式生成多年数据：按固定行数的时间窗口逐批产出各馈线的列数据，
+每个 (馈线, 窗口) 使用由种子、馈线编号和窗口序号派生的独立随机序列（SeedSequence），
+结果与产出顺序、是否多进程生成无关；内存占用只与批大小和并行度有关，与数据总量无关。
+write_feeder_dataset 把这些批逐批写入列式数据集（DatasetStore.write_batches），
+可用 benchmarks/bench_feeder_stream.py 检查峰值内存。
 """
 
-import pandas as pd
-import numpy as np
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import random
 
+import pandas as pd
+import numpy as np
+
+# 各月基准温度，按月份(1-12)下标取值
+MONTHLY_TEMPERATURE = np.array([np.nan, 5, 8, 12, 18, 23, 28, 32, 31, 27, 21, 14, 7])
+
+# 数据时间间隔
+INTERVAL = pd.Timedelta(minutes=15)
+
+# 馈线负荷特征，generate_training_data 使用默认值
+DEFAULT_FEEDER_PROFILE = {
+    'load_scale': 1.0,           # 负荷整体缩放
+    'weekend_factor': 0.8,       # 周末负荷系数
+    'temperature_offset': 0.0,   # 所在区域的温度偏移（℃）
+    'noise_scale': 1.0,          # 负荷随机波动缩放
+}
+
+
+def feeder_key(feeder_id) -> int:
+    """馈线编号对应的稳定整数，用于派生该馈线的随机序列"""
+    return zlib.crc32(str(feeder_id).encode('utf-8'))
+
+
+def feeder_profile(feeder_id, seed=42, overrides=None):
+    """馈线负荷特征：未指定的项由种子和馈线编号确定地随机生成"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(feeder_key(feeder_id), 0)))
+    profile = {
+        'load_scale': float(rng.lognormal(0, 0.5)),
+        'weekend_factor': float(rng.uniform(0.6, 1.0)),
+        'temperature_offset': float(rng.normal(0, 3)),
+        'noise_scale': float(rng.uniform(0.5, 1.5)),
+    }
+    profile.update(overrides or {})
+    return profile
+
+
+def generate_load_columns(time_points, rng, profile=None):
+    """按时间点生成负荷及气象数据列
+
+    Args:
+        time_points: pandas.DatetimeIndex
+        rng: np.random.Generator
+        profile: 馈线负荷特征，缺省项使用 DEFAULT_FEEDER_PROFILE
+
+    Returns:
+        dict: 列名 -> numpy 数组
+    """
+    profile = {**DEFAULT_FEEDER_PROFILE, **(profile or {})}
+    n = len(time_points)
+    hour = time_points.hour.to_numpy(dtype=np.int64)
+    weekday = time_points.weekday.to_numpy(dtype=np.int64)  # 0=Monday, 6=Sunday
+    month = time_points.month.to_numpy(dtype=np.int64)
+    day = time_points.day.to_numpy(dtype=np.int64)
+    noise_scale = profile['noise_scale']
+
+    # 负荷基准值（考虑时段特征）：早晚高峰、日间、夜间的均值和波动不同
+    peak = ((hour >= 6) & (hour <= 8)) | ((hour >= 18) & (hour <= 20))
+    daytime = (hour >= 9) & (hour <= 17)
+    noise = rng.standard_normal(n) * noise_scale
+    base_load = np.select([peak, daytime], [120 + 10 * noise, 90 + 8 * noise], 60 + 5 * noise)
+
+    # 周末调整
+    is_weekend = weekday >= 5
+    base_load = np.where(is_weekend, base_load * profile['weekend_factor'], base_load)
+
+    # 气象参数
+    temperature = _generate_temperature(hour, month, rng, profile['temperature_offset'])
+    humidity = _generate_humidity(temperature, rng)
+    wind_speed = rng.uniform(0, 15, n)
+    rainfall = np.where(rng.random(n) < 0.3, rng.exponential(0.1, n), 0.0)
+
+    # 温度对负荷的影响：高温增加空调负荷，低温增加取暖负荷
+    base_load += np.select(
+        [temperature > 25, temperature < 10], [(temperature - 25) * 2, (10 - temperature) * 1.5], 0.0
+    )
+
+    # 湿度影响
+    base_load += np.where(humidity > 80, 5, 0)
+
+    # 添加随机噪声
+    load = np.maximum(20, base_load + rng.normal(0, 3 * noise_scale, n)) * profile['load_scale']
+
+    # 节假日判断（简化）
+    is_holiday = ((month == 1) & (day <= 3)) | ((month == 5) & (day == 1)) | ((month == 10) & (day <= 3))
+
+    return {
+        'timestamp': time_points.to_numpy(),
+        'hour': hour,
+        'minute': time_points.minute.to_numpy(dtype=np.int64),
+        'weekday': weekday,
+        'is_weekend': is_weekend.astype(np.int64),
+        'is_holiday': is_holiday.astype(np.int64),
+        'temperature': temperature.round(1),
+        'humidity': humidity.round(1),
+        'wind_speed': wind_speed.round(1),
+        'rainfall': rainfall.round(1),
+        'load': load.round(2)
+    }
+
+
+def _generate_temperature(hour, month, rng, offset=0.0):
+    """生成温度数据（按月份基准温度加日内变化）"""
+    # 日内温度变化：白天升温、下午高温、夜间降温
+    temp_adj = np.select(
+        [(hour >= 6) & (hour <= 14), (hour >= 15) & (hour <= 18)], [(hour - 6) * 2, 16 - (hour - 14) * 2], -5
+    )
+    temperature = MONTHLY_TEMPERATURE[month] + temp_adj + offset + rng.normal(0, 2, len(hour))
+    return np.clip(temperature, -10, 40)
+
+
+def _generate_humidity(temperature, rng):
+    """生成湿度数据（与温度相关）"""
+    # 高温低湿，低温高湿
+    base_humidity = 80 - (temperature - 10) * 1.5
+    humidity = base_humidity + rng.normal(0, 10, len(temperature))
+    return np.clip(humidity, 20, 100)
+
+
+def _generate_feeder_batch(seed, feeder_id, profile, batch_index, start, rows):
+    """生成一条馈线一个时间窗口的数据（可在子进程中执行）"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(feeder_key(feeder_id), 1, batch_index)))
+    time_points = pd.date_range(start=start, periods=rows, freq=INTERVAL)
+    return {
+        'feeder_id': feeder_id,
+        'batch_index': batch_index,
+        'columns': generate_load_columns(time_points, rng, profile),
+    }
+
+
+def feeder_batch_frame(batch):
+    """iter_feeder_batches 产出的一批数据转为 DataFrame，首列为 feeder_id"""
+    df = pd.DataFrame(batch['columns'])
+    df.insert(0, 'feeder_id', batch['feeder_id'])
+    return df
+
+
 class DataGenerator:
     """电力负荷数据生成器"""
-    
+
     def __init__(self, seed=42):
         """初始化数据生成器"""
+        # 全局随机状态仍然设置种子，预测器生成未来气象数据时使用
         np.random.seed(seed)
         random.seed(seed)
-        
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
     def generate_training_data(self, days=30):
         """生成训练数据
-        
+
         Args:
             days: 生成数据的天数
-            
+
         Returns:
             pandas.DataFrame: 训练数据
         """
-
-        
-        # 生成时间序列
+        # 15分钟间隔的时间点
         start_date = datetime(2024, 1, 1)
         end_date = start_date + timedelta(days=days)
-        
-        # 15分钟间隔的时间点
-        time_points = pd.date_range(start=start_date, end=end_date, freq='15T')
-        
-        data = []
-        for timestamp in time_points:
-            # 基础负荷模式
-            hour = timestamp.hour
-            minute = timestamp.minute
-            weekday = timestamp.weekday()  # 0=Monday, 6=Sunday
-            
-            # 负荷基准值（考虑时段特征）
-            if 6 <= hour <= 8 or 18 <= hour <= 20:  # 早晚高峰
-                base_load = 120 + np.random.normal(0, 10)
-            elif 9 <= hour <= 17:  # 日间
-                base_load = 90 + np.random.normal(0, 8)
-            else:  # 夜间
-                base_load = 60 + np.random.normal(0, 5)
-            
-            # 周末调整
-            if weekday >= 5:  # 周末
-                base_load *= 0.8
-            
-            # 气象参数
-            temperature = self._generate_temperature(timestamp)
-            humidity = self._generate_humidity(temperature)
-            wind_speed = np.random.uniform(0, 15)
-            rainfall = np.random.exponential(0.1) if np.random.random() < 0.3 else 0
-            
-            # 温度对负荷的影响
-            if temperature > 25:  # 高温增加空调负荷
-                base_load += (temperature - 25) * 2
-            elif temperature < 10:  # 低温增加取暖负荷
-                base_load += (10 - temperature) * 1.5
-            
-            # 湿度影响
-            if humidity > 80:
-                base_load += 5
-            
-            # 添加随机噪声
-            load = max(20, base_load + np.random.normal(0, 3))
-            
-            # 节假日判断（简化）
-            is_holiday = 1 if (timestamp.month == 1 and timestamp.day <= 3) or \
-                            (timestamp.month == 5 and timestamp.day == 1) or \
-                            (timestamp.month == 10 and timestamp.day <= 3) else 0
-            
-            data.append({
-                'timestamp': timestamp,
-                'hour': hour,
-                'minute': minute,
-                'weekday': weekday,
-                'is_weekend': 1 if weekday >= 5 else 0,
-                'is_holiday': is_holiday,
-                'temperature': round(temperature, 1),
-                'humidity': round(humidity, 1),
-                'wind_speed': round(wind_speed, 1),
-                'rainfall': round(rainfall, 1),
-                'load': round(load, 2)
-            })
-        
-        df = pd.DataFrame(data)
-
-        return df
-    
-    def _generate_temperature(self, timestamp):
-        """生成温度数据"""
-        # 基于月份的季节性温度
-        month = timestamp.month
-        hour = timestamp.hour
-        
-        # 月份基准温度
-        monthly_temp = {
-            1: 5, 2: 8, 3: 12, 4: 18, 5: 23, 6: 28,
-            7: 32, 8: 31, 9: 27, 10: 21, 11: 14, 12: 7
+        time_points = pd.date_range(start=start_date, end=end_date, freq=INTERVAL)
+
+        return pd.DataFrame(generate_load_columns(time_points, self.rng))
+
+    def iter_feeder_batches(self, feeders, start, end, batch_size=96 * 30, profiles=None, processes=0):
+        """流式生成多条馈线的数据
+
+        时间范围 [start, end) 按 batch_size 行（默认30天）切分为窗口，按窗口先后、
+        每个窗口内按 feeders 顺序产出 {'feeder_id', 'batch_index', 'columns'}，
+        columns 为列名 -> numpy 数组，可直接构造 DataFrame。
+
+        Args:
+            feeders: 馈线编号列表
+            start: 开始时间
+            end: 结束时间（不含）
+            batch_size: 每批行数（时间点数）
+            profiles: 馈线编号 -> 负荷特征（覆盖 feeder_profile 随机生成的对应项）
+            processes: 生成进程数，0 表示在当前进程生成
+
+        Yields:
+            dict: 一条馈线一个时间窗口的数据
+        """
+        start = pd.Timestamp(start)
+        total_rows = max(0, -(-(pd.Timestamp(end) - start) // INTERVAL))
+        feeder_profiles = {
+            feeder_id: feeder_profile(feeder_id, self.seed, (profiles or {}).get(feeder_id))
+            for feeder_id in feeders
         }
-        
-        base_temp = monthly_temp[month]
-        
-        # 日内温度变化
-        if 6 <= hour <= 14:  # 白天升温
-            temp_adj = (hour - 6) * 2
-        elif 15 <= hour <= 18:  # 下午高温
-            temp_adj = 16 - (hour - 14) * 2
-        else:  # 夜间降温
-            temp_adj = -5
-        
-        temperature = base_temp + temp_adj + np.random.normal(0, 2)
-        return max(-10, min(40, temperature))
-    
-    def _generate_humidity(self, temperature):
-        """生成湿度数据（与温度相关）"""
-        # 高温低湿，低温高湿
-        base_humidity = 80 - (temperature - 10) * 1.5
-        humidity = base_humidity + np.random.normal(0, 10)
-        return max(20, min(100, humidity))
-    
+        tasks = (
+            (self.seed, feeder_id, feeder_profiles[feeder_id], batch_index,
+             start + INTERVAL * (batch_index * batch_size), min(batch_size, total_rows - batch_index * batch_size))
+            for batch_index in range(-(-total_rows // batch_size))
+            for feeder_id in feeders
+        )
+
+        if not processes:
+            for task in tasks:
+                yield _generate_feeder_batch(*task)
+            return
+
+        # spawn 方式启动，避免在多线程的服务进程中 fork；同时在途的批数有上限，避免结果堆积在内存中
+        window = 2 * processes
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pending = []
+            try:
+                for task in tasks:
+                    pending.append(pool.submit(_generate_feeder_batch, *task))
+                    if len(pending) >= window:
+                        yield pending.pop(0).result()
+                while pending:
+                    yield pending.pop(0).result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def write_feeder_dataset(self, store, name, feeders, start, end, batch_size=96 * 30, profiles=None, processes=0):
+        """流式生成多条馈线的数据并逐批写入数据集，已存在时整体替换
+
+        参数与 iter_feeder_batches 相同，store 为 DatasetStore。每批生成后立即写入分区文件，
+        内存中只保留在途的批。
+
+        Returns:
+            dict: 数据集信息
+        """
+        batches = self.iter_feeder_batches(feeders, start, end, batch_size, profiles, processes)
+        return store.write_batches(name, (feeder_batch_frame(batch) for batch in batches))
+
     def generate_test_data(self, start_time, periods=96):
         """生成测试数据
-        
+
         Args:
             start_time: 开始时间
             periods: 生成的时间点数量
-            
+
         Returns:
             pandas.DataFrame: 测试数据
         """
-        time_points = pd.date_range(start=start_time, periods=periods, freq='15T')
-        
-        data = []
-        for timestamp in time_points:
-            data.append({
-                'timestamp': timestamp,
-                'hour': timestamp.hour,
-                'minute': timestamp.minute,
-                'weekday': timestamp.weekday(),
-                'is_weekend': 1 if timestamp.weekday() >= 5 else 0,
-                'is_holiday': 0,  # 简化
-                'temperature': self._generate_temperature(timestamp),
-                'humidity': self._generate_humidity(self._generate_temperature(timestamp)),
-                'wind_speed': np.random.uniform(0, 15),
-                'rainfall': 0
-            })
-        
-        return pd.DataFrame(data)
+        time_points = pd.date_range(start=start_time, periods=periods, freq=INTERVAL)
+        hour = time_points.hour.to_numpy(dtype=np.int64)
+        weekday = time_points.weekday.to_numpy(dtype=np.int64)
+        temperature = _generate_temperature(hour, time_points.month.to_numpy(dtype=np.int64), self.rng)
+
+        return pd.DataFrame({
+            'timestamp': time_points,
+            'hour': hour,
+            'minute': time_points.minute.to_numpy(dtype=np.int64),
+            'weekday': weekday,
+            'is_weekend': (weekday >= 5).astype(np.int64),
+            'is_holiday': np.zeros(periods, dtype=np.int64),  # 简化
+            'temperature': temperature,
+            'humidity': _generate_humidity(temperature, self.rng),
+            'wind_speed': self.rng.uniform(0, 15, periods),
+            'rainfall': np.zeros(periods, dtype=np.int64)
+        })
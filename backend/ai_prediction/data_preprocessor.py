@@ -6,6 +6,7 @@
 
 import pandas as pd
 import numpy as np
+import joblib
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.model_selection import train_test_split
 
@@ -51,6 +52,22 @@ class DataPreprocessor:
         
         return X, y
     
+    def load_dataset(self, store, name, start=None, end=None):
+        """从列式数据集读取数据，只读取特征列和目标列
+        
+        Args:
+            store: DatasetStore
+            name: 数据集名称
+            start: 开始时间（含），None 表示不限
+            end: 结束时间（不含），None 表示不限
+            
+        Returns:
+            pandas.DataFrame: 数据（数值列为 float32/int8）
+        """
+        available = store.info(name)['columns']
+        columns = [col for col in self.feature_columns + ['load'] if col in available]
+        return store.read(name, columns=columns, start=start, end=end)
+    
     def fit_transform(self, df):
         """拟合并转换训练数据
         
@@ -115,6 +132,33 @@ class DataPreprocessor:
         
         return self.target_scaler.inverse_transform(y_scaled.reshape(-1, 1)).flatten()
     
+    def save_scalers(self, filepath='preprocessor.pkl'):
+        """保存拟合好的特征/目标缩放器和特征列
+        
+        Args:
+            filepath: 保存路径
+        """
+        if not self.is_fitted:
+            raise ValueError("预处理器未训练，无法保存")
+        
+        joblib.dump({
+            'scaler': self.scaler,
+            'target_scaler': self.target_scaler,
+            'feature_columns': self.feature_columns
+        }, filepath)
+    
+    def load_scalers(self, filepath='preprocessor.pkl'):
+        """加载 save_scalers 保存的缩放器，加载后为已拟合状态
+        
+        Args:
+            filepath: 文件路径
+        """
+        data = joblib.load(filepath)
+        self.scaler = data['scaler']
+        self.target_scaler = data['target_scaler']
+        self.feature_columns = data['feature_columns']
+        self.is_fitted = True
+    
     def get_feature_names(self):
         """获取特征名称"""
         return self.feature_columns
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据集存储 - 按日期分区的列式训练数据文件（Parquet 或 Feather）
+
+每个数据集是一个目录：按 timestamp 所在的月（或日）分区，每个分区目录下一个或多个列式文件，
+dataset.json 记录格式、列类型和各分区的时间范围与行数。写入时数值列降为 float32、
+取值很小的整数列降为 int8；读取时只打开与时间范围重叠的分区，只读取需要的列。
+
+同一数据集同时只应有一个写入者；写入新数据集时先写到临时目录再改名，读取方不会看到写了一半的数据。
+"""
+
+import os
+import json
+import uuid
+import base64
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 各列的存储类型，未列出的列保持原类型
+COLUMN_TYPES = {
+    'hour': 'int8',
+    'minute': 'int8',
+    'weekday': 'int8',
+    'is_weekend': 'int8',
+    'is_holiday': 'int8',
+    'temperature': 'float32',
+    'humidity': 'float32',
+    'wind_speed': 'float32',
+    'rainfall': 'float32',
+    'load': 'float32',
+}
+
+# 分区粒度 -> numpy 日期单位
+PARTITION_UNITS = {'month': 'M', 'day': 'D'}
+FILE_SUFFIXES = {'parquet': '.parquet', 'feather': '.feather'}
+MANIFEST_NAME = 'dataset.json'
+
+
+class DatasetStore:
+    """列式训练数据集存储"""
+
+    def __init__(self, root, file_format='parquet', partition='month'):
+        """初始化数据集存储
+
+        Args:
+            root: 存储根目录，每个数据集为其下的一个子目录
+            file_format: 'parquet'（压缩，体积小）或 'feather'（不压缩，可内存映射，读取更快）
+            partition: 分区粒度，'month' 或 'day'
+        """
+        if not PYARROW_AVAILABLE:
+            raise ImportError("数据集存储需要安装 pyarrow")
+        if file_format not in FILE_SUFFIXES:
+            raise ValueError(f"不支持的文件格式: {file_format}")
+        if partition not in PARTITION_UNITS:
+            raise ValueError(f"不支持的分区粒度: {partition}")
+        self.root = str(root)
+        self.file_format = file_format
+        self.partition = partition
+        os.makedirs(self.root, exist_ok=True)
+
+    def exists(self, name):
+        """数据集是否存在"""
+        return os.path.exists(self._manifest_path(name))
+
+    def list_datasets(self):
+        """所有数据集名称"""
+        return sorted(entry for entry in os.listdir(self.root) if self.exists(entry))
+
+    def info(self, name):
+        """数据集信息（格式、列类型、分区、行数）"""
+        with open(self._manifest_path(name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write(self, name, df):
+        """写入数据集，已存在时整体替换
+
+        Args:
+            name: 数据集名称
+            df: 含 timestamp 列的 DataFrame
+
+        Returns:
+            dict: 数据集信息
+        """
+        return self.write_batches(name, [df])
+
+    def write_batches(self, name, frames):
+        """逐批写入数据集，已存在时整体替换
+
+        每批转换后立即按分区写成文件，内存中只保留当前一批，用于写入流式生成的大数据集
+        （如 DataGenerator.write_feeder_dataset）。各批的列和类型必须一致，同一分区内按批的写入顺序保存。
+
+        Args:
+            name: 数据集名称
+            frames: 含 timestamp 列的 DataFrame 的可迭代对象
+
+        Returns:
+            dict: 数据集信息
+        """
+        path = self._dataset_path(name)
+        temp_path = os.path.join(self.root, f".{name}.tmp-{uuid.uuid4().hex}")
+        os.makedirs(temp_path)
+        try:
+            manifest = {
+                'format': self.file_format,
+                'partition': self.partition,
+                'columns': None,
+                'schema': None,
+                'partitions': {},
+                'rows': 0,
+                'created_at': datetime.now().isoformat(),
+            }
+            for df in frames:
+                table = self._to_table(df)
+                columns = {field.name: str(field.type) for field in table.schema}
+                if manifest['columns'] is None:
+                    manifest['columns'] = columns
+                    manifest['schema'] = base64.b64encode(
+                        table.schema.remove_metadata().serialize().to_pybytes()
+                    ).decode('ascii')
+                elif columns != manifest['columns']:
+                    raise ValueError(f"数据集 {name} 各批的列不一致: {columns} != {manifest['columns']}")
+                self._write_partitions(temp_path, table, manifest)
+            if manifest['columns'] is None:
+                raise ValueError(f"数据集 {name} 没有要写入的数据")
+            self._save_manifest(temp_path, manifest)
+
+            # 旧数据集先改名再删除，新数据集改名后才可见
+            old_path = None
+            if os.path.exists(path):
+                old_path = os.path.join(self.root, f".{name}.old-{uuid.uuid4().hex}")
+                os.rename(path, old_path)
+            os.rename(temp_path, path)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        if old_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+        return manifest
+
+    def append(self, name, df):
+        """向数据集追加数据（按分区新增文件），数据集不存在时新建
+
+        Returns:
+            dict: 数据集信息
+        """
+        if not self.exists(name):
+            return self.write(name, df)
+        manifest = self.info(name)
+        table = self._to_table(df)
+        columns = {field.name: str(field.type) for field in table.schema}
+        if columns != manifest['columns']:
+            raise ValueError(f"追加数据的列与数据集 {name} 不一致: {columns} != {manifest['columns']}")
+        self._write_partitions(self._dataset_path(name), table, manifest)
+        self._save_manifest(self._dataset_path(name), manifest)
+        return manifest
+
+    def read(self, name, columns=None, start=None, end=None):
+        """读取数据集
+
+        Args:
+            name: 数据集名称
+            columns: 需要的列，None 表示全部列
+            start: 开始时间（含），None 表示不限
+            end: 结束时间（不含），None 表示不限
+
+        Returns:
+            pandas.DataFrame: 按分区时间顺序排列的数据（逐批写入的数据集中，同一分区内按批的写入顺序），
+            列类型与存储类型相同
+        """
+        manifest = self.info(name)
+        columns = list(columns) if columns is not None else list(manifest['columns'])
+        missing = [column for column in columns if column not in manifest['columns']]
+        if missing:
+            raise KeyError(f"数据集 {name} 中没有列: {missing}")
+
+        start = pd.Timestamp(start).to_datetime64() if start is not None else None
+        end = pd.Timestamp(end).to_datetime64() if end is not None else None
+        read_columns = columns if 'timestamp' in columns or (start is None and end is None) \
+            else columns + ['timestamp']
+
+        tables = []
+        for key in sorted(manifest['partitions']):
+            partition = manifest['partitions'][key]
+            first, last = np.datetime64(partition['start']), np.datetime64(partition['end'])
+            if (start is not None and last < start) or (end is not None and first >= end):
+                continue
+            for file_name in partition['files']:
+                table = self._read_file(os.path.join(self._dataset_path(name), key, file_name), read_columns)
+                # 只有部分落在时间范围内的分区才需要逐行过滤
+                if (start is not None and first < start) or (end is not None and last >= end):
+                    table = table.filter(self._time_mask(table['timestamp'], start, end))
+                tables.append(table)
+
+        if not tables:
+            return self._empty_frame(manifest, columns)
+        table = pa.concat_tables(tables).select(columns)
+        return table.to_pandas()
+
+    def delete(self, name):
+        """删除数据集"""
+        shutil.rmtree(self._dataset_path(name), ignore_errors=True)
+
+    def _dataset_path(self, name):
+        return os.path.join(self.root, name)
+
+    def _manifest_path(self, name):
+        return os.path.join(self._dataset_path(name), MANIFEST_NAME)
+
+    def _save_manifest(self, path, manifest):
+        temp_file = os.path.join(path, f".{MANIFEST_NAME}.{uuid.uuid4().hex}")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, os.path.join(path, MANIFEST_NAME))
+
+    def _to_table(self, df):
+        """按存储类型转换为按时间排序的 Arrow 表"""
+        if 'timestamp' not in df.columns:
+            raise ValueError("数据集需要 timestamp 列")
+        df = df.sort_values('timestamp', kind='stable')
+        df = df.astype({column: dtype for column, dtype in COLUMN_TYPES.items() if column in df.columns})
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def _write_partitions(self, path, table, manifest):
+        """按时间分区写入文件，并更新 manifest 中的分区信息"""
+        if table.num_rows == 0:
+            return
+        timestamps = table['timestamp'].to_numpy()
+        keys = timestamps.astype(f"datetime64[{PARTITION_UNITS[self.partition]}]")
+        # 表已按时间排序，各分区为连续的行
+        boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(keys)]])
+
+        for first, last in zip(starts, ends):
+            key = str(keys[first])
+            os.makedirs(os.path.join(path, key), exist_ok=True)
+            file_name = f"part-{uuid.uuid4().hex}{FILE_SUFFIXES[self.file_format]}"
+            self._write_file(os.path.join(path, key, file_name), table.slice(first, last - first))
+
+            partition = manifest['partitions'].setdefault(
+                key, {'files': [], 'rows': 0, 'start': str(timestamps[first]), 'end': str(timestamps[last - 1])}
+            )
+            partition['files'].append(file_name)
+            partition['rows'] += int(last - first)
+            partition['start'] = str(min(np.datetime64(partition['start']), timestamps[first]))
+            partition['end'] = str(max(np.datetime64(partition['end']), timestamps[last - 1]))
+            manifest['rows'] += int(last - first)
+
+    def _write_file(self, file_path, table):
+        if self.file_format == 'parquet':
+            pq.write_table(table, file_path, compression='snappy')
+        else:
+            feather.write_feather(table, file_path, compression='uncompressed')
+
+    def _read_file(self, file_path, columns):
+        if file_path.endswith(FILE_SUFFIXES['parquet']):
+            return pq.read_table(file_path, columns=columns, memory_map=True)
+        return feather.read_table(file_path, columns=columns, memory_map=True)
+
+    @staticmethod
+    def _time_mask(timestamps, start, end):
+        mask = None
+        if start is not None:
+            mask = pc.greater_equal(timestamps, pa.scalar(start, type=timestamps.type))
+        if end is not None:
+            upper = pc.less(timestamps, pa.scalar(end, type=timestamps.type))
+            mask = upper if mask is None else pc.and_(mask, upper)
+        return mask
+
+    @staticmethod
+    def _empty_frame(manifest, columns):
+        schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(manifest['schema'])))
+        return schema.empty_table().select(columns).to_pandas()
@@ -2,8 +2,17 @@
 # -*- coding: utf-8 -*-
 """
 模型管理器 - 管理多种机器学习模型
+
+train_core_models 可以用专用的 loky 进程池并行训练各模型：每个模型至少分配一个核，
+CPU 预算中其余的核分给 n_jobs=-1（可多线程训练）的模型；可设置训练期限，到期后返回
+期限内已完成的模型中最好的一个。进程池在进程内复用，首次使用时每个工作进程需导入
+scikit-learn（单核约 2.3 s），只有训练数据较大或多次训练时并行才划算。
 """
 
+import time
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+
 import numpy as np
 import joblib
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
@@ -19,6 +28,99 @@ try:
 except ImportError:
     XGBOOST_AVAILABLE = False
 
+# 并行训练使用的进程池（不使用 joblib 全局共享的进程池，期限到期时可以直接结束其工作进程）
+_training_executor = None
+_training_executor_lock = threading.Lock()
+
+# train_core_models 按此顺序训练（并行时按此顺序提交）
+CORE_MODEL_PRIORITY = [
+    'LinearRegression',    # 最稳定
+    'RandomForest',        # 通常很可靠
+    'GradientBoosting',    # 可能有问题的模型
+    'SVR',                 # 可能有问题的模型
+    'XGBoost'              # 可能有问题的模型
+]
+
+
+def _get_training_executor(processes):
+    """并行训练进程池，工作进程数变化或已关闭时重新创建"""
+    global _training_executor
+    from joblib.externals.loky import ProcessPoolExecutor
+
+    with _training_executor_lock:
+        if _training_executor is None or _training_executor._max_workers != processes:
+            if _training_executor is not None:
+                _training_executor.shutdown(wait=False)
+            _training_executor = ProcessPoolExecutor(max_workers=processes)
+        return _training_executor
+
+
+def _kill_training_executor(executor):
+    """结束进程池的工作进程（放弃仍在训练的模型），下次并行训练时重新创建"""
+    global _training_executor
+    with _training_executor_lock:
+        if _training_executor is executor:
+            _training_executor = None
+    executor.shutdown(wait=False, kill_workers=True)
+
+
+def _fit_and_evaluate(name, model, X_train, y_train, X_test, y_test, threads=None):
+    """训练并评估一个模型（可在子进程中执行）
+    
+    Args:
+        threads: 该模型可用的线程数，None 表示不限制；n_jobs=-1 的模型训练时改用该线程数
+        
+    Returns:
+        tuple: (模型名称, 训练好的模型, 性能指标)
+    """
+    if threads is not None:
+        from threadpoolctl import threadpool_limits
+        
+        n_jobs = model.get_params().get('n_jobs')
+        if n_jobs == -1:
+            model.set_params(n_jobs=threads)
+        try:
+            with threadpool_limits(limits=threads):
+                return _fit_and_evaluate(name, model, X_train, y_train, X_test, y_test)
+        finally:
+            if n_jobs == -1:
+                model.set_params(n_jobs=n_jobs)
+    
+    # 训练模型
+    start_time = time.perf_counter()
+    model.fit(X_train, y_train)
+    training_time = time.perf_counter() - start_time
+    
+    # 预测
+    y_pred = model.predict(X_test)
+    
+    # 验证预测结果
+    if np.any(np.isnan(y_pred)) or np.any(np.isinf(y_pred)):
+        raise ValueError("预测结果包含NaN或无穷值")
+    
+    # 评估性能
+    mse = mean_squared_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
+    rmse = np.sqrt(mse)
+    
+    # 计算MAE和MAPE
+    mae = np.mean(np.abs(y_test - y_pred))
+    mape = np.mean(np.abs((y_test - y_pred) / np.maximum(np.abs(y_test), 1e-8))) * 100
+    
+    # 验证性能指标
+    if np.isnan(mse) or np.isnan(r2) or mse < 0:
+        raise ValueError("性能指标异常")
+    
+    return name, model, {
+        'mse': mse,
+        'r2': r2,
+        'rmse': rmse,
+        'mae': mae,
+        'mape': mape,
+        'training_time': training_time
+    }
+
+
 class ModelManager:
     """机器学习模型管理器"""
     
@@ -123,7 +225,9 @@ class ModelManager:
         for name, model in self.models.items():
             try:
                 # 训练模型
+                start_time = time.perf_counter()
                 model.fit(X_train, y_train)
+                training_time = time.perf_counter() - start_time
                 
                 # 预测
                 y_pred = model.predict(X_test)
@@ -143,7 +247,7 @@ class ModelManager:
                     'rmse': rmse,
                     'mae': mae,
                     'mape': mape,
-                    'training_time': 0
+                    'training_time': training_time
                 }
                 
 
@@ -167,7 +271,7 @@ class ModelManager:
         else:
             print("❌ 所有模型训练失败")
     
-    def train_core_models(self, X_train, y_train, X_test, y_test):
+    def train_core_models(self, X_train, y_train, X_test, y_test, processes=0, cpu_budget=None, deadline=None):
         """训练核心模型 - 快速版本，只训练关键模型
         
         Args:
@@ -175,71 +279,35 @@ class ModelManager:
             y_train: 训练目标
             X_test: 测试特征
             y_test: 测试目标
+            processes: 并行训练的进程数，None 表示CPU核数（单核时不使用进程池），0 表示在当前进程依次训练
+            cpu_budget: 并行训练时所有模型共用的CPU核数，None 表示CPU核数
+            deadline: 训练期限（秒），到期后未完成的模型被放弃；期限内没有模型完成时等到第一个模型完成
+            
+        Returns:
+            bool: 是否有模型训练成功
         """
         print("🚀 快速训练核心模型...")
         
-        # 按优先级排序的模型列表
-        model_priority = [
-            'LinearRegression',    # 最稳定
-            'RandomForest',        # 通常很可靠
-            'GradientBoosting',    # 可能有问题的模型
-            'SVR',                 # 可能有问题的模型
-            'XGBoost'              # 可能有问题的模型
-        ]
+        names = [name for name in CORE_MODEL_PRIORITY if name in self.models]
+        if processes is None:
+            processes = joblib.cpu_count() if joblib.cpu_count() > 1 else 0
+        processes = min(processes, len(names))
+        deadline_at = time.perf_counter() + deadline if deadline is not None else None
         
-        successful_models = []
+        if processes:
+            successful_models, unfinished = self._train_parallel(
+                names, X_train, y_train, X_test, y_test, processes, cpu_budget, deadline_at
+            )
+        else:
+            successful_models, unfinished = self._train_sequential(
+                names, X_train, y_train, X_test, y_test, deadline_at
+            )
         
-        for name in model_priority:
-            if name in self.models:
-                print(f"  训练 {name}...")
-                try:
-                    model = self.models[name]
-                    
-                    # 训练模型
-                    model.fit(X_train, y_train)
-                    
-                    # 预测
-                    y_pred = model.predict(X_test)
-                    
-                    # 验证预测结果
-                    if np.any(np.isnan(y_pred)) or np.any(np.isinf(y_pred)):
-                        raise ValueError("预测结果包含NaN或无穷值")
-                    
-                    # 评估性能
-                    mse = mean_squared_error(y_test, y_pred)
-                    r2 = r2_score(y_test, y_pred)
-                    rmse = np.sqrt(mse)
-                    
-                    # 计算MAE和MAPE
-                    mae = np.mean(np.abs(y_test - y_pred))
-                    mape = np.mean(np.abs((y_test - y_pred) / np.maximum(np.abs(y_test), 1e-8))) * 100
-                    
-                    # 验证性能指标
-                    if np.isnan(mse) or np.isnan(r2) or mse < 0:
-                        raise ValueError("性能指标异常")
-                    
-                    self.performance[name] = {
-                        'mse': mse,
-                        'r2': r2,
-                        'rmse': rmse,
-                        'mae': mae,
-                        'mape': mape,
-                        'training_time': 0  # 可以后续添加计时功能
-                    }
-                    
-                    successful_models.append(name)
-                    print(f"    ✅ {name}: MSE={mse:.6f}, R²={r2:.6f}")
-                    
-                except Exception as e:
-                    print(f"    ❌ {name} 训练失败: {e}")
-                    # 从模型字典中移除失败的模型
-                    if name in self.models:
-                        try:
-                            del self.models[name]
-                            print(f"    🗑️ 已移除故障模型: {name}")
-                        except:
-                            pass
-                    continue
+        # 未在期限内完成的模型没有训练，从模型字典中移除
+        if unfinished:
+            print(f"⏱️ 超过训练期限，放弃未完成的模型: {unfinished}")
+            for name in unfinished:
+                self.models.pop(name, None)
         
         # 检查是否有成功的模型
         if successful_models:
@@ -254,6 +322,85 @@ class ModelManager:
             self.is_trained = False
         
         return self.is_trained
+    
+    def _train_sequential(self, names, X_train, y_train, X_test, y_test, deadline_at):
+        """在当前进程依次训练，返回 (成功的模型, 因超过期限未训练的模型)"""
+        successful_models = []
+        for index, name in enumerate(names):
+            if deadline_at is not None and successful_models and time.perf_counter() >= deadline_at:
+                return successful_models, names[index:]
+            
+            print(f"  训练 {name}...")
+            try:
+                _, model, metrics = _fit_and_evaluate(name, self.models[name], X_train, y_train, X_test, y_test)
+            except Exception as e:
+                self._discard_failed_model(name, e)
+                continue
+            self._record_trained_model(name, model, metrics)
+            successful_models.append(name)
+        return successful_models, []
+    
+    def _train_parallel(self, names, X_train, y_train, X_test, y_test, processes, cpu_budget, deadline_at):
+        """在 loky 进程池中并行训练，返回 (成功的模型, 因超过期限未完成的模型)"""
+        # 每个模型至少一个核，其余的核平均分给 n_jobs=-1 的模型
+        budget = max(cpu_budget or joblib.cpu_count(), processes)
+        multithreaded = [name for name in names if self.models[name].get_params().get('n_jobs') == -1]
+        extra = (budget - processes) // len(multithreaded) if multithreaded else 0
+        threads = {name: 1 + extra if name in multithreaded else 1 for name in names}
+        print(f"  并行训练 {len(names)} 个模型: {processes} 个进程, 线程分配 {threads}")
+        
+        executor = _get_training_executor(processes)
+        futures = {
+            executor.submit(
+                _fit_and_evaluate, name, self.models[name], X_train, y_train, X_test, y_test, threads[name]
+            ): name
+            for name in names
+        }
+        
+        successful_models = []
+        pending = set(futures)
+        while pending:
+            # 已有模型完成后才按期限等待
+            timeout = None
+            if deadline_at is not None and successful_models:
+                timeout = max(0.0, deadline_at - time.perf_counter())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in sorted(done, key=lambda f: names.index(futures[f])):
+                name = futures[future]
+                try:
+                    _, model, metrics = future.result()
+                except Exception as e:
+                    self._discard_failed_model(name, e)
+                    continue
+                self._record_trained_model(name, model, metrics)
+                successful_models.append(name)
+        
+        if pending:
+            # 正在训练的模型无法单独取消，结束进程池的工作进程，下次训练时重新创建
+            for future in pending:
+                future.cancel()
+            _kill_training_executor(executor)
+        unfinished = [name for name in names if any(futures[future] == name for future in pending)]
+        return successful_models, unfinished
+    
+    def _record_trained_model(self, name, model, metrics):
+        """保存训练好的模型及其性能指标"""
+        self.models[name] = model
+        self.performance[name] = metrics
+        print(f"    ✅ {name}: MSE={metrics['mse']:.6f}, R²={metrics['r2']:.6f}, "
+              f"耗时 {metrics['training_time']:.3f}s")
+    
+    def _discard_failed_model(self, name, error):
+        """从模型字典中移除训练失败的模型"""
+        print(f"    ❌ {name} 训练失败: {error}")
+        if name in self.models:
+            try:
+                del self.models[name]
+                print(f"    🗑️ 已移除故障模型: {name}")
+            except:
+                pass
 
     def predict(self, X):
         """使用最佳模型进行预测
@@ -6,6 +6,7 @@ import secrets
 from typing import Any
 
 import jwt
+from asgiref.sync import sync_to_async
 from ninja.security import HttpBearer
 
 from apps.user.models import User
@@ -80,4 +81,12 @@ class AuthBearer(HttpBearer):
             raise AuthenticationError()
 
 
+class AsyncAuthBearer(AuthBearer):
+    """异步视图使用的认证：在线程中解析token并查询用户，避免在事件循环中访问ORM"""
+
+    async def __call__(self, request):
+        return await sync_to_async(super().__call__, thread_sensitive=False)(request)
+
+
 auth = dict(auth=AuthBearer())
+async_auth = dict(auth=AsyncAuthBearer())
@@ -1,16 +1,16 @@
 from django.contrib import admin
 from .models import (
     KnowledgeBase, Document, DocumentChunk, 
-    QASession, QARecord, ModelConfig, EmbeddingConfig
+    QASession, QARecord, ModelConfig, EmbeddingConfig, CachedAnswer
 )
 
 
 @admin.register(KnowledgeBase)
 class KnowledgeBaseAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_by', 'created_at', 'is_active']
+    list_display = ['name', 'created_by', 'created_at', 'is_active', 'index_version']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'index_version']
 
 
 @admin.register(Document)
@@ -18,7 +18,7 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ['title', 'knowledge_base', 'file_type', 'status', 'uploaded_at']
     list_filter = ['file_type', 'status', 'uploaded_at']
     search_fields = ['title', 'file_path']
-    readonly_fields = ['uploaded_at', 'processed_at', 'file_size', 'chunk_count']
+    readonly_fields = ['uploaded_at', 'processed_at', 'file_size', 'chunk_count', 'progress', 'error_message', 'content_hash']
 
 
 @admin.register(DocumentChunk)
@@ -39,8 +39,8 @@ class QASessionAdmin(admin.ModelAdmin):
 
 @admin.register(QARecord)
 class QARecordAdmin(admin.ModelAdmin):
-    list_display = ['question_preview', 'session', 'model_used', 'response_time', 'created_at']
-    list_filter = ['model_used', 'created_at', 'feedback_score']
+    list_display = ['question_preview', 'session', 'model_used', 'response_time', 'cache_hit', 'created_at']
+    list_filter = ['model_used', 'created_at', 'feedback_score', 'cache_hit']
     search_fields = ['question', 'answer']
     readonly_fields = ['created_at', 'response_time', 'tokens_used']
     
@@ -57,6 +57,19 @@ class ModelConfigAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
 
 
+@admin.register(CachedAnswer)
+class CachedAnswerAdmin(admin.ModelAdmin):
+    list_display = ['question_preview', 'config', 'knowledge_base', 'hit_count', 'created_at', 'last_hit_at']
+    list_filter = ['config', 'created_at']
+    search_fields = ['question', 'answer']
+    readonly_fields = ['created_at', 'last_hit_at', 'hit_count', 'prompt_hash', 'context_key', 'model_signature']
+    exclude = ['question_vector']
+    
+    def question_preview(self, obj):
+        return obj.question[:50] + "..." if len(obj.question) > 50 else obj.question
+    question_preview.short_description = "问题预览"
+
+
 @admin.register(EmbeddingConfig)
 class EmbeddingConfigAdmin(admin.ModelAdmin):
     list_display = ['name', 'model_name', 'embedding_type', 'dimension', 'is_active', 'is_default']
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大模型回答缓存 - 同一模型配置、同一上下文下重复的问题直接复用已生成的回答
+
+缓存保存在数据库表 CachedAnswer 中，进程重启后仍然有效。精确匹配的键为
+(模型配置, 模型参数签名, 提示词SHA-256, 上下文分块id集合)；提示词已包含上下文全文，
+上下文分块集合用于语义匹配：开启 semantic 时，上下文分块集合相同、且问题向量与缓存问题的
+余弦相似度不低于 similarity_threshold 的回答也会被复用。
+
+条目超过 max_age_seconds 视为过期，总数超过 max_entries 时淘汰最久未使用的条目。
+"""
+
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANSWER_CACHE_CONFIG = {
+    'enabled': True,
+    'semantic': False,              # 是否按问题向量相似度复用回答
+    'similarity_threshold': 0.95,   # 语义匹配的最低余弦相似度
+    'semantic_candidates': 200,     # 语义匹配时最多比较的缓存条目数（按时间倒序）
+    'max_entries': 5000,
+    'max_age_seconds': 7 * 24 * 3600,
+    'evict_interval': 100,          # 每写入多少条执行一次淘汰
+}
+
+
+def get_answer_cache_config() -> Dict:
+    """读取 settings.KNOWLEDGE_ANSWER_CACHE，缺省项使用默认值"""
+    config = dict(DEFAULT_ANSWER_CACHE_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_ANSWER_CACHE', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def context_key(chunk_ids: Iterable[int]) -> str:
+    """上下文分块id集合的哈希（与顺序无关）"""
+    return hash_text(','.join(str(chunk_id) for chunk_id in sorted(set(chunk_ids))))
+
+
+class AnswerCache:
+    """回答缓存（同步方法，访问数据库）"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or get_answer_cache_config()
+        self.enabled = bool(self.config['enabled'])
+        self.semantic = bool(self.config['semantic'])
+        self._writes = 0
+
+    def lookup(self, config_id: int, model_signature: str, prompt: str, chunk_ids: Iterable[int],
+               question_vector: Optional[np.ndarray] = None) -> Optional[Dict]:
+        """查找可复用的回答，命中时返回 {'answer', 'model_used', 'match', 'similarity'}"""
+        from .models import CachedAnswer
+
+        if not self.enabled:
+            return None
+        fresh = CachedAnswer.objects.filter(
+            config_id=config_id, model_signature=model_signature,
+            created_at__gte=timezone.now() - timedelta(seconds=self.config['max_age_seconds']),
+        )
+        entry = fresh.filter(prompt_hash=hash_text(prompt)).order_by('-created_at').first()
+        match, similarity = 'exact', 1.0
+        if entry is None and self.semantic and question_vector is not None:
+            entry, similarity = self._nearest(fresh.filter(context_key=context_key(chunk_ids)), question_vector)
+            match = 'semantic'
+        if entry is None:
+            return None
+
+        CachedAnswer.objects.filter(id=entry.id).update(hit_count=F('hit_count') + 1, last_hit_at=timezone.now())
+        return {
+            'answer': entry.answer,
+            'model_used': entry.model_used,
+            'match': match,
+            'similarity': similarity,
+        }
+
+    def _nearest(self, queryset, question_vector: np.ndarray):
+        """在候选条目中找问题向量余弦相似度最高且达到阈值的一条"""
+        candidates = list(
+            queryset.exclude(question_vector=None).order_by('-created_at')
+            .only('id', 'answer', 'model_used', 'question_vector')[:self.config['semantic_candidates']]
+        )
+        query = np.asarray(question_vector, dtype=np.float32).ravel()
+        query_norm = np.linalg.norm(query)
+        vectors = [np.frombuffer(bytes(entry.question_vector), dtype=np.float32) for entry in candidates]
+        kept = [(entry, vector) for entry, vector in zip(candidates, vectors) if len(vector) == len(query)]
+        if not kept or query_norm == 0:
+            return None, 0.0
+        matrix = np.vstack([vector for _, vector in kept])
+        norms = np.linalg.norm(matrix, axis=1) * query_norm
+        similarities = np.divide(matrix @ query, norms, out=np.zeros(len(kept), dtype=np.float32), where=norms > 0)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.config['similarity_threshold']:
+            return None, 0.0
+        return kept[best][0], float(similarities[best])
+
+    def store(self, config_id: int, kb_id: int, model_signature: str, prompt: str, chunk_ids: Iterable[int],
+              question: str, answer: str, model_used: str, question_vector: Optional[np.ndarray] = None):
+        """写入回答缓存，并定期淘汰过期和超量的条目"""
+        from .models import CachedAnswer
+
+        if not self.enabled:
+            return
+        CachedAnswer.objects.create(
+            config_id=config_id,
+            knowledge_base_id=kb_id,
+            model_signature=model_signature,
+            prompt_hash=hash_text(prompt),
+            context_key=context_key(chunk_ids),
+            question=question,
+            question_vector=(
+                np.asarray(question_vector, dtype=np.float32).tobytes() if question_vector is not None else None
+            ),
+            answer=answer,
+            model_used=model_used,
+        )
+        self._writes += 1
+        if self._writes % max(1, self.config['evict_interval']) == 1:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期条目；总数超过上限时按最近使用时间淘汰，返回删除的条目数"""
+        from .models import CachedAnswer
+
+        cutoff = timezone.now() - timedelta(seconds=self.config['max_age_seconds'])
+        removed, _ = CachedAnswer.objects.filter(created_at__lt=cutoff).delete()
+        overflow = CachedAnswer.objects.count() - self.config['max_entries']
+        if overflow > 0:
+            stale_ids = list(
+                CachedAnswer.objects.annotate(last_used=Coalesce('last_hit_at', 'created_at'))
+                .order_by('last_used').values_list('id', flat=True)[:overflow]
+            )
+            removed += CachedAnswer.objects.filter(id__in=stale_ids).delete()[0]
+        if removed:
+            logger.info(f"回答缓存淘汰 {removed} 条")
+        return removed
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+知识库关键词检索 - 基于倒排索引的 BM25
+
+倒排表按词编号以 CSR 形式存放在连续数组中（offsets / rows / tfs），新增分块先写入按词分组的
+小增量表，增量累积到一定比例后再合并进 CSR 数组。检索时只读取问题中各词的倒排表，
+耗时与命中的倒排项数量成正比，与语料规模无关。
+
+行号与 VectorStore 的向量行一一对应；索引持久化在向量文件旁，按分块id对齐。
+"""
+
+import os
+import math
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .tokenizer import TOKENIZER_NAME, tokenize
+from .vector_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HYBRID_CONFIG = {
+    'enabled': True,
+    'k1': 1.5,
+    'b': 0.75,
+    'rrf_k': 60,            # 倒数排名融合的平滑常数
+    'candidates': 20,       # 每路检索参与融合的候选数（不少于 top_k）
+}
+
+
+def get_hybrid_config() -> Dict:
+    """读取 settings.KNOWLEDGE_HYBRID_SEARCH，缺省项使用默认值"""
+    config = dict(DEFAULT_HYBRID_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_HYBRID_SEARCH', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+    """倒数排名融合：按 sum(1 / (k + rank)) 合并多路检索结果，以结果的 index（向量行号）去重"""
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.get(result['index'])
+            if entry is None:
+                entry = fused[result['index']] = dict(result, rrf_score=0.0)
+            entry['rrf_score'] += 1.0 / (k + rank)
+            if 'bm25_score' in result:
+                entry['bm25_score'] = result['bm25_score']
+    return sorted(fused.values(), key=lambda item: item['rrf_score'], reverse=True)[:top_k]
+
+
+class BM25Index:
+    """BM25 倒排索引"""
+
+    FILE_NAME = 'bm25.npz'
+    COMPACT_RATIO = 0.25     # 增量倒排项超过主数组的该比例时合并
+    COMPACT_MIN = 20000
+    SAVE_RATIO = 0.1         # 未持久化的分块超过该比例时保存（未保存的分块下次加载时重新分词）
+    SAVE_MIN = 2000
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._term_ids: Dict[str, int] = {}
+        # (CSR offsets, rows, tfs, 增量表 {词编号: ([行号], [词频])}, 各行文档长度)，
+        # 整体替换以便检索时拿到一致的快照
+        self._state = (
+            np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16),
+            {}, np.zeros(0, dtype=np.int32),
+        )
+        self._delta_size = 0
+        self._n_docs = 0
+        self._total_len = 0
+        self._unsaved = 0
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    def add(self, texts: List[str]):
+        """在末尾追加分块（行号与向量行一致）"""
+        start = self._n_docs
+        self._reserve(start + len(texts))
+        self._index_rows(range(start, start + len(texts)), texts)
+        self._n_docs = start + len(texts)
+        self._unsaved += len(texts)
+        self._maybe_compact()
+
+    def remove(self, keep_mask: np.ndarray):
+        """删除 keep_mask 为 False 的行，其余行号前移以保持与向量行对齐"""
+        self._compact()
+        offsets, rows, tfs, _, doc_lens = self._state
+        keep_mask = np.asarray(keep_mask, dtype=bool)
+        new_rows = np.cumsum(keep_mask, dtype=np.int64) - 1
+        keep = keep_mask[rows]
+        terms = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[keep]
+        counts = np.bincount(terms, minlength=len(offsets) - 1)
+        doc_lens = doc_lens[:self._n_docs][keep_mask].copy()
+        self._state = (
+            np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            new_rows[rows[keep]].astype(np.int32),
+            tfs[keep],
+            {},
+            doc_lens,
+        )
+        self._n_docs = len(doc_lens)
+        self._total_len = int(doc_lens.sum())
+        self._unsaved += 1
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回得分最高的 (行号, BM25得分)，只访问问题中各词的倒排表"""
+        query_terms = Counter(term for term in tokenize(query) if term in self._term_ids)
+        offsets, rows, tfs, delta, doc_lens = self._state
+        n_docs = self._n_docs
+        if not query_terms or not n_docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        avg_len = max(self._total_len / n_docs, 1.0)
+
+        hit_rows, hit_scores = [], []
+        for term, query_tf in query_terms.items():
+            term_id = self._term_ids[term]
+            if term_id + 1 < len(offsets):
+                term_rows = rows[offsets[term_id]:offsets[term_id + 1]]
+                term_tfs = tfs[offsets[term_id]:offsets[term_id + 1]].astype(np.float32)
+            else:
+                term_rows, term_tfs = rows[:0], np.empty(0, dtype=np.float32)
+            if term_id in delta:
+                delta_rows, delta_tfs = delta[term_id]
+                count = len(delta_tfs)  # 先取词频长度，写入方总是先追加行号
+                term_rows = np.concatenate([term_rows, np.asarray(delta_rows[:count], dtype=np.int32)])
+                term_tfs = np.concatenate([term_tfs, np.asarray(delta_tfs[:count], dtype=np.float32)])
+            if not len(term_rows):
+                continue
+            df = len(term_rows)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_lens[term_rows] / avg_len)
+            hit_rows.append(term_rows)
+            hit_scores.append(query_tf * idf * term_tfs * (self.k1 + 1.0) / (term_tfs + norm))
+
+        if not hit_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        unique_rows, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores)).astype(np.float32)
+        top = top_k_indices(scores, top_k)
+        return unique_rows[top].astype(np.int64), scores[top]
+
+    def _reserve(self, size: int):
+        """按倍增策略扩容文档长度数组（复制后整体替换，读取方持有的旧快照仍然有效）"""
+        doc_lens = self._state[4]
+        if size > len(doc_lens):
+            grown = np.zeros(max(size, 2 * len(doc_lens), 64), dtype=np.int32)
+            grown[:self._n_docs] = doc_lens[:self._n_docs]
+            self._state = self._state[:4] + (grown,)
+
+    def _index_rows(self, rows, texts: List[str]):
+        """为指定行写入文档长度和增量倒排项"""
+        delta, doc_lens = self._state[3], self._state[4]
+        for row, text in zip(rows, texts):
+            term_counts = Counter(tokenize(text))
+            length = sum(term_counts.values())
+            doc_lens[row] = length
+            self._total_len += length
+            for term, tf in term_counts.items():
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    term_id = self._term_ids[term] = len(self._term_ids)
+                postings = delta.get(term_id)
+                if postings is None:
+                    postings = delta[term_id] = ([], [])
+                postings[0].append(row)
+                postings[1].append(min(tf, 65535))
+            self._delta_size += len(term_counts)
+
+    def _maybe_compact(self):
+        if self._delta_size > max(self.COMPACT_MIN, self.COMPACT_RATIO * len(self._state[1])):
+            self._compact()
+
+    def _compact(self):
+        """把增量表合并进 CSR 数组"""
+        offsets, rows, tfs, delta, doc_lens = self._state
+        n_terms = len(self._term_ids)
+        if not delta and len(offsets) - 1 == n_terms:
+            return
+        base_terms = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        delta_ids = np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))
+        delta_lens = np.fromiter((len(postings[0]) for postings in delta.values()), dtype=np.int64, count=len(delta))
+        all_terms = np.concatenate([base_terms, np.repeat(delta_ids, delta_lens)])
+        all_rows = np.concatenate([rows] + [np.asarray(p[0], dtype=np.int32) for p in delta.values()])
+        all_tfs = np.concatenate([tfs] + [np.asarray(p[1], dtype=np.uint16) for p in delta.values()])
+        order = np.argsort(all_terms, kind='stable')
+        counts = np.bincount(all_terms, minlength=n_terms)
+        self._state = (
+            np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            all_rows[order],
+            all_tfs[order],
+            {},
+            doc_lens,
+        )
+        self._delta_size = 0
+
+    def maybe_save(self, directory: str, chunk_ids: List[Optional[int]]):
+        """未持久化的分块较多时保存；小知识库每次变更都保存"""
+        if self._unsaved and (self._n_docs <= self.SAVE_MIN or self._unsaved >= self.SAVE_RATIO * self._n_docs):
+            self.save(directory, chunk_ids)
+
+    def save(self, directory: str, chunk_ids: List[Optional[int]]):
+        """持久化倒排表（按分块id记录行），保存在知识库向量文件旁"""
+        self._compact()
+        offsets, rows, tfs, _, doc_lens = self._state
+        terms = sorted(self._term_ids, key=self._term_ids.get)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, 'bm25.tmp.npz')
+        np.savez(
+            tmp_path,
+            tokenizer=np.array(TOKENIZER_NAME),
+            terms=np.frombuffer('\n'.join(terms).encode('utf-8'), dtype=np.uint8),
+            offsets=offsets,
+            rows=rows,
+            tfs=tfs,
+            doc_lens=doc_lens[:self._n_docs],
+            chunk_ids=np.array([-1 if chunk_id is None else chunk_id for chunk_id in chunk_ids], dtype=np.int64),
+        )
+        os.replace(tmp_path, os.path.join(directory, self.FILE_NAME))
+        self._unsaved = 0
+
+    @classmethod
+    def build(cls, texts: List[str], chunk_ids: List[Optional[int]], directory: Optional[str] = None,
+              config: Optional[Dict] = None) -> 'BM25Index':
+        """为给定分块构建索引；目录中已有索引时按分块id复用，只对缺失的分块分词"""
+        config = config or get_hybrid_config()
+        index = cls(k1=config['k1'], b=config['b'])
+        index._reserve(len(texts))
+        index._n_docs = len(texts)
+
+        missing = list(range(len(texts)))
+        if directory:
+            missing = index._load_rows(directory, chunk_ids)
+        if missing:
+            if len(missing) > 1000:
+                logger.info(f"BM25索引分词 {len(missing)} 个分块...")
+            index._index_rows(missing, [texts[row] for row in missing])
+            index._unsaved = len(missing)
+        index._compact()
+        if directory and index._unsaved:
+            index.save(directory, chunk_ids)
+        return index
+
+    def _load_rows(self, directory: str, chunk_ids: List[Optional[int]]) -> List[int]:
+        """从持久化文件恢复仍存在的分块的倒排项，返回需要重新分词的行号"""
+        all_rows = list(range(len(chunk_ids)))
+        try:
+            with np.load(os.path.join(directory, self.FILE_NAME)) as data:
+                if str(data['tokenizer']) != TOKENIZER_NAME:
+                    return all_rows
+                terms = data['terms'].tobytes().decode('utf-8')
+                offsets, rows, tfs = data['offsets'], data['rows'], data['tfs']
+                saved_lens, saved_ids = data['doc_lens'], data['chunk_ids']
+        except (OSError, KeyError, ValueError):
+            return all_rows
+
+        ids = np.array([-1 if chunk_id is None else chunk_id for chunk_id in chunk_ids], dtype=np.int64)
+        # 旧行号 -> 新行号（分块已删除或id为空时为 -1）
+        remap = np.full(len(saved_ids), -1, dtype=np.int64)
+        if len(ids) and len(saved_ids):
+            order = np.argsort(ids)
+            sorted_ids = ids[order]
+            positions = np.minimum(np.searchsorted(sorted_ids, saved_ids), len(sorted_ids) - 1)
+            found = (saved_ids >= 0) & (sorted_ids[positions] == saved_ids)
+            remap[found] = order[positions[found]]
+            # 重复的分块id只保留第一次出现
+            _, first = np.unique(remap[found], return_index=True)
+            duplicate = np.flatnonzero(found)
+            duplicate = np.setdiff1d(duplicate, duplicate[first])
+            remap[duplicate] = -1
+
+        self._term_ids = {term: i for i, term in enumerate(terms.split('\n'))} if terms else {}
+        new_rows = remap[rows]
+        keep = new_rows >= 0
+        post_terms = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[keep]
+        counts = np.bincount(post_terms, minlength=len(self._term_ids))
+        doc_lens = self._state[4]
+        restored = remap >= 0
+        doc_lens[remap[restored]] = saved_lens[restored]
+        self._state = (
+            np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            new_rows[keep].astype(np.int32),
+            tfs[keep].astype(np.uint16),
+            {},
+            doc_lens,
+        )
+        self._total_len = int(doc_lens[:self._n_docs].sum())
+
+        present = np.zeros(len(chunk_ids), dtype=bool)
+        present[remap[restored]] = True
+        return np.flatnonzero(~present).tolist()
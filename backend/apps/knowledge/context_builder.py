@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+问答上下文构建 - 把检索到的分块压缩、打包进固定的词元预算
+
+TextSplitter 的相邻分块之间有重叠句，检索结果中同一文档的相邻分块会重复这部分内容。
+构建上下文时先按文档内的字符区间（char_start/char_end）把重叠或相接的分块合并成一段，
+去掉完全重复或被包含的片段并压缩多余空白，再按相关度从高到低装入词元预算，
+超出预算的最后一段截断到剩余预算。提示词长度因此有上限，大模型的输入开销和延迟也随之有界。
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from .tokenizer import count_tokens, token_spans
+
+DEFAULT_CONTEXT_CONFIG = {
+    'max_tokens': 3000,           # 模型配置未设置 context_max_tokens 时的上下文词元预算
+    'min_fragment_tokens': 64,    # 剩余预算不足一段时，至少剩这么多词元才截断装入
+    'separator': '\n\n',          # 上下文中各段之间的分隔
+}
+
+_SPACES_RE = re.compile(r'[ \t　\xa0]+')
+_BLANK_LINES_RE = re.compile(r'\s*\n\s*')
+
+
+def get_context_config() -> Dict:
+    """读取 settings.KNOWLEDGE_CONTEXT，缺省项使用默认值"""
+    config = dict(DEFAULT_CONTEXT_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_CONTEXT', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def compress_whitespace(text: str) -> str:
+    """连续空白压缩为一个空格，空行压缩为单个换行"""
+    return _BLANK_LINES_RE.sub('\n', _SPACES_RE.sub(' ', text)).strip()
+
+
+def _overlap_length(head: str, tail: str, estimate: int) -> int:
+    """head 末尾与 tail 开头重叠的字符数，estimate 为按字符区间算出的重叠长度
+
+    分块末尾的空白被去掉过，实际重叠可能比估计值略短，从估计值开始向下找第一个吻合的长度。
+    """
+    for length in range(min(estimate, len(head), len(tail)), 0, -1):
+        if head.endswith(tail[:length]):
+            return length
+    return 0
+
+
+class ContextBuilder:
+    """按词元预算构建问答上下文"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or get_context_config()
+
+    def build(self, docs: List[Dict], max_tokens: Optional[int] = None) -> Dict:
+        """构建上下文
+
+        docs 为检索结果（按相关度降序，含 content、score、metadata），返回
+        context（上下文文本）、docs（内容被装入上下文的检索结果）、tokens（上下文词元数）
+        和 truncated（是否有内容因超出预算被截断或舍弃）。
+        """
+        budget = max(1, int(max_tokens or self.config['max_tokens']))
+        separator = self.config['separator']
+        separator_tokens = count_tokens(separator)
+
+        parts = []
+        used = []
+        total = 0
+        truncated = False
+        for segment in self._merge(docs):
+            remaining = budget - total - (separator_tokens if parts else 0)
+            if segment['tokens'] <= remaining:
+                parts.append(segment['text'])
+                total = budget - remaining + segment['tokens']
+                used.extend(segment['docs'])
+                continue
+            truncated = True
+            # 放不下整段时，剩余预算足够（或上下文仍为空）才截断装入，之后预算用尽
+            if remaining > 0 and (remaining >= self.config['min_fragment_tokens'] or not parts):
+                parts.append(segment['text'][:token_spans(segment['text'])[remaining - 1][1]])
+                total = budget
+                used.extend(segment['docs'])
+                break
+
+        return {
+            'context': separator.join(parts),
+            'docs': used,
+            'tokens': total,
+            'truncated': truncated,
+        }
+
+    def _merge(self, docs: List[Dict]) -> List[Dict]:
+        """合并同一文档中重叠或相接的分块，去掉重复内容，按段内最高相关度降序返回"""
+        segments = []
+        by_document = {}
+        for doc in docs:
+            metadata = doc.get('metadata') or {}
+            start, end = metadata.get('char_start'), metadata.get('char_end')
+            if metadata.get('document_id') is not None and start is not None and end is not None:
+                by_document.setdefault(metadata['document_id'], []).append((start, end, doc))
+            else:
+                segments.append({'text': doc['content'], 'score': doc.get('score', 0.0), 'docs': [doc]})
+
+        for spans in by_document.values():
+            spans.sort(key=lambda span: (span[0], span[1]))
+            current = None
+            for start, end, doc in spans:
+                if current is not None and start <= current['end']:
+                    overlap = _overlap_length(current['text'], doc['content'], current['end'] - start)
+                    if end > current['end']:
+                        joiner = '' if overlap else '\n'
+                        current['text'] += joiner + doc['content'][overlap:]
+                        current['end'] = end
+                    current['score'] = max(current['score'], doc.get('score', 0.0))
+                    current['docs'].append(doc)
+                    continue
+                current = {'text': doc['content'], 'end': end,
+                           'score': doc.get('score', 0.0), 'docs': [doc]}
+                segments.append(current)
+
+        # 相关度高的段优先；去掉与已保留段相同或被其包含的段
+        segments.sort(key=lambda segment: segment['score'], reverse=True)
+        kept = []
+        for segment in segments:
+            text = compress_whitespace(segment['text'])
+            duplicate = next((other for other in kept if text in other['text']), None)
+            if duplicate is not None:
+                duplicate['docs'].extend(segment['docs'])
+                continue
+            kept.append({'text': text, 'score': segment['score'], 'docs': segment['docs'],
+                         'tokens': count_tokens(text)})
+        return kept
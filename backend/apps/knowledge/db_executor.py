@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+异步视图的数据库访问 - 在共享的有界线程池中执行同步代码（ORM查询、索引加载等）
+
+异步问答视图运行在 ASGI 服务器的事件循环上，不能直接调用 ORM。run_db 通过 sync_to_async
+把同步调用交给固定大小的线程池执行，多个并发问题共享同一个事件循环和同一组数据库线程，
+不再为每个请求新建事件循环或线程。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+DEFAULT_DB_EXECUTOR_CONFIG = {
+    'workers': 8,   # 执行同步数据库调用的线程数
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor_config() -> Dict:
+    """读取 settings.KNOWLEDGE_DB_EXECUTOR，缺省项使用默认值"""
+    config = dict(DEFAULT_DB_EXECUTOR_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_DB_EXECUTOR', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """数据库线程池（所有异步视图共享），首次使用时创建"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_db_executor_config()['workers'], thread_name_prefix='knowledge-db'
+                )
+    return _executor
+
+
+def _call_with_connections(func, *args, **kwargs):
+    """执行同步调用，前后清理失效或超过 CONN_MAX_AGE 的数据库连接（与请求开始、结束时相同）"""
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_db(func, *args, **kwargs):
+    """在数据库线程池中执行同步函数并等待其结果"""
+    return await sync_to_async(
+        _call_with_connections, thread_sensitive=False, executor=get_db_executor()
+    )(func, *args, **kwargs)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+知识库文本嵌入 - 基于特征哈希的字符 n-gram 向量
+
+每个特征（单字、相邻字二元组，可选 jieba 词）经哈希映射到固定维度的桶和正负号，
+再用 np.bincount 一次性累加整批文本。字符特征使用制表哈希：按码点查两张由固定种子生成的
+随机表得到桶号和符号，二元组的桶号为两表之和取模、符号为两表之积，全程为数组运算。编码结果只取决于文本本身，与语料、加载顺序、进程无关：
+新增文档无需重新计算已有向量，重启后查询与已存向量保持一致。
+"""
+
+import zlib
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .tokenizer import HAS_JIEBA
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_CONFIG = {
+    'vector_size': 512,
+    'word_features': False,   # 是否额外加入 jieba 分词特征（需安装 jieba，编码速度显著下降）
+    'batch_size': 1024,       # 每批编码的文本数，限制 bincount 的临时内存
+}
+
+_MAX_CODE_POINT = 0x110000
+_TABLE_SEED = 20240501
+_hash_tables = {}
+
+
+def get_embedding_config() -> Dict:
+    """读取 settings.KNOWLEDGE_EMBEDDING，缺省项使用默认值"""
+    config = dict(DEFAULT_EMBEDDING_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_EMBEDDING', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def _get_hash_tables(vector_size: int):
+    """按码点索引的桶号表和符号表（首字、次字各一套），按维度缓存
+
+    由固定种子的 PCG64 原始输出生成（跨 NumPy 版本稳定），保证不同进程、不同时间编码结果一致。
+    """
+    tables = _hash_tables.get(vector_size)
+    if tables is None:
+        raw = (np.random.PCG64(_TABLE_SEED).random_raw(2 * _MAX_CODE_POINT) >> np.uint64(32)).reshape(2, -1)
+        buckets = ((raw * np.uint64(vector_size)) >> np.uint64(32)).astype(np.int16)
+        signs = ((raw & np.uint64(1)).astype(np.int8) * 2 - 1).astype(np.int8)
+        tables = _hash_tables[vector_size] = (buckets[0], signs[0], buckets[1], signs[1])
+    return tables
+
+
+def _mix32(keys: np.ndarray) -> np.ndarray:
+    """murmur3 终结函数，把 32 位键打散为均匀分布的哈希（用于分词特征）"""
+    h = keys.astype(np.uint32)
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x85EBCA6B)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0xC2B2AE35)
+    h ^= h >> np.uint32(16)
+    return h
+
+
+class SimpleEmbedding:
+    """哈希字符 n-gram 嵌入模型（无需训练，无词汇表）"""
+
+    STATE_TYPE = 'hashed_ngram'
+    STATE_VERSION = 1
+
+    def __init__(self, vector_size: Optional[int] = None, word_features: Optional[bool] = None):
+        config = get_embedding_config()
+        self.vector_size = int(vector_size or config['vector_size'])
+        self.word_features = bool(config['word_features'] if word_features is None else word_features)
+        if self.word_features and not HAS_JIEBA:
+            logger.warning("未安装jieba，嵌入模型不使用分词特征")
+            self.word_features = False
+        self.batch_size = int(config['batch_size'])
+        self.is_fitted = True
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """编码文本为按行归一化的 float32 向量 (len(texts), vector_size)"""
+        if not texts:
+            return np.empty((0, self.vector_size), dtype=np.float32)
+        return np.vstack([
+            self._encode_batch(texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ])
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """整批文本拼成一个码点数组，向量化提取特征并累加"""
+        dim = self.vector_size
+        n_docs = len(texts)
+        joined = '\x00'.join(texts)
+        lowered = joined.lower()
+        if len(lowered) != len(joined):
+            # 少数字符小写后长度会变化，此时逐段转换以保持偏移对齐
+            texts = [text.lower() for text in texts]
+            lowered = '\x00'.join(texts)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n_docs)
+        # 以 \x00 分隔各文本，分隔符与空白一样权重为0，因此二元组不会跨文本
+        code_points = np.frombuffer(lowered.encode('utf-32-le'), dtype=np.uint32)
+        row_offsets = np.repeat(np.arange(0, n_docs * dim, dim, dtype=np.int64), lengths + 1)[:len(code_points)]
+        valid = ((code_points > 32) & (code_points != 0x3000) & (code_points != 0xA0)).astype(np.float32)
+
+        unigram_buckets, unigram_signs, left_buckets, left_signs = _get_hash_tables(dim)
+        buckets = unigram_buckets[code_points]
+        weights = unigram_signs[code_points] * valid
+        counts = np.bincount(row_offsets + buckets, weights=weights, minlength=n_docs * dim)
+
+        left = code_points[:-1]
+        pair_buckets = left_buckets[left].astype(np.int32) + buckets[1:]
+        pair_buckets -= dim * (pair_buckets >= dim)
+        pair_weights = left_signs[left] * weights[1:] * valid[:-1]
+        counts += np.bincount(row_offsets[:-1] + pair_buckets, weights=pair_weights, minlength=n_docs * dim)
+
+        if self.word_features:
+            word_hashes, word_docs = self._word_features(texts)
+            word_buckets = ((word_hashes.astype(np.uint64) * np.uint64(dim)) >> np.uint64(32)).astype(np.int64)
+            word_weights = (word_hashes & np.uint32(1)).astype(np.float64) * 2.0 - 1.0
+            counts += np.bincount(word_docs * dim + word_buckets, weights=word_weights, minlength=n_docs * dim)
+
+        # 次线性词频，削弱高频字的主导作用
+        counts = counts.reshape(n_docs, dim)
+        vectors = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+    @staticmethod
+    def _word_features(texts: List[str]):
+        """jieba 分词特征（只取多字词，单字已由字符特征覆盖）"""
+        import jieba
+        keys, docs = [], []
+        for doc_id, text in enumerate(texts):
+            for word in jieba.cut(text.lower()):
+                if len(word) > 1 and not word.isspace():
+                    keys.append(zlib.crc32(word.encode('utf-8')))
+                    docs.append(doc_id)
+        return _mix32(np.asarray(keys, dtype=np.uint32)), np.asarray(docs, dtype=np.int64)
+
+    def get_state(self) -> Dict:
+        """嵌入模型签名，随向量文件持久化；签名不一致的向量文件会被重新编码"""
+        return {
+            'type': self.STATE_TYPE,
+            'version': self.STATE_VERSION,
+            'vector_size': self.vector_size,
+            'word_features': self.word_features,
+        }
+
+    def load_state(self, state: Optional[Dict]) -> bool:
+        """检查向量文件中的签名是否与当前模型一致（模型本身无状态，无需恢复）"""
+        return state == self.get_state()
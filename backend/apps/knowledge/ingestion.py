@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+知识库文档入库队列 - 在后台线程池中解析、分块、编码并写入索引
+
+Document 表本身就是持久化的任务队列：上传接口只保存文件并创建 status='pending' 的记录，
+工作线程通过条件更新 pending -> processing 认领任务，因此同一文档不会被重复处理；
+服务进程启动时（start_recovery），pending 的文档和心跳超时的 processing 文档重新入队。
+心跳由后台线程定时写入，与解析进度无关，长时间没有进度回调的文档（如解析大 DOCX）不会被其他进程误判为中断。
+
+处理进度（已解析页数、已编码分块数等）写入 Document.progress，供前端轮询。
+同一知识库的多个文件可以并行解析和分块，只有写入索引的阶段按知识库串行。
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGESTION_CONFIG = {
+    'workers': 4,              # 并行处理的文档数
+    'progress_interval': 1.0,  # 进度写库的最小间隔（秒）
+    'stale_seconds': 600,      # processing 状态超过该时间没有心跳则视为中断，重新入队
+    'heartbeat_interval': 30,  # 处理中文档的心跳间隔（秒），应远小于 stale_seconds
+}
+
+
+def get_ingestion_config() -> Dict:
+    """读取 settings.KNOWLEDGE_INGESTION，缺省项使用默认值"""
+    from django.conf import settings
+    config = dict(DEFAULT_INGESTION_CONFIG)
+    config.update(getattr(settings, 'KNOWLEDGE_INGESTION', {}) or {})
+    return config
+
+
+class ProgressReporter:
+    """把处理进度节流写入 Document.progress，阶段变化时立即写入"""
+
+    def __init__(self, document_id: int, interval: float = 1.0):
+        self.document_id = document_id
+        self.interval = interval
+        self.progress = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: Optional[str] = None, **counts):
+        with self._lock:
+            stage_changed = stage is not None and stage != self.progress.get('stage')
+            if stage is not None:
+                self.progress['stage'] = stage
+            self.progress.update(counts)
+        now = time.monotonic()
+        if stage_changed or now - self._last_write >= self.interval:
+            self.flush()
+
+    def flush(self):
+        from .models import Document
+
+        with self._lock:
+            self._last_write = time.monotonic()
+            self.progress['updated_at'] = timezone.now().isoformat()
+            progress = dict(self.progress)
+        Document.objects.filter(id=self.document_id).update(progress=progress)
+
+
+class IngestionQueue:
+    """文档入库工作线程池"""
+
+    def __init__(self, rag_system, config: Optional[Dict] = None):
+        self.rag_system = rag_system
+        self.config = {**DEFAULT_INGESTION_CONFIG, **(config or get_ingestion_config())}
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config['workers'], thread_name_prefix='kb-ingest'
+        )
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._active = {}  # 本进程正在处理的文档 -> ProgressReporter
+        self._stopped = threading.Event()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat, name='kb-ingest-heartbeat', daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def submit(self, document_id: int):
+        """提交待处理文档（已在队列中的不会重复提交）"""
+        with self._lock:
+            if document_id in self._queued:
+                return
+            self._queued.add(document_id)
+        self._executor.submit(self._run, document_id)
+
+    def recover(self) -> int:
+        """重新提交未完成的文档：pending 的全部提交，processing 且心跳超时的先退回 pending"""
+        from .models import Document
+
+        cutoff = timezone.now() - timedelta(seconds=self.config['stale_seconds'])
+        stale_ids = [
+            document.id for document in Document.objects.filter(status='processing').only('id', 'progress')
+            if (document.progress or {}).get('updated_at', '') < cutoff.isoformat()
+        ]
+        if stale_ids:
+            Document.objects.filter(id__in=stale_ids, status='processing').update(status='pending')
+            logger.warning(f"文档处理中断，重新入队: {stale_ids}")
+
+        pending_ids = list(
+            Document.objects.filter(status='pending', knowledge_base__is_active=True)
+            .order_by('id').values_list('id', flat=True)
+        )
+        for document_id in pending_ids:
+            self.submit(document_id)
+        return len(pending_ids)
+
+    def start_recovery(self):
+        """在工作线程中执行 recover，不阻塞服务启动（ASGI 服务器在事件循环中加载应用，不能直接访问数据库）"""
+        self._executor.submit(self._recover)
+
+    def _recover(self):
+        try:
+            recovered = self.recover()
+            if recovered:
+                logger.info(f"重新提交 {recovered} 个待处理文档")
+        except Exception as e:
+            logger.error(f"重新提交未完成的文档失败: {e}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    def _heartbeat(self):
+        """定时刷新正在处理的文档的 progress.updated_at"""
+        while not self._stopped.wait(self.config['heartbeat_interval']):
+            with self._lock:
+                reporters = list(self._active.values())
+            for reporter in reporters:
+                try:
+                    reporter.flush()
+                except Exception as e:
+                    logger.warning(f"文档 {reporter.document_id} 心跳写入失败: {e}")
+            close_old_connections()
+
+    def _run(self, document_id: int):
+        from .models import Document
+
+        document = None
+        deferred = False
+        try:
+            # 条件更新认领任务，避免多个线程/进程重复处理同一文档
+            claimed = Document.objects.filter(id=document_id, status='pending').update(status='processing')
+            if not claimed:
+                return
+            document = Document.objects.select_related('knowledge_base').get(id=document_id)
+            deferred = self._process(document)
+        except Exception as e:
+            logger.error(f"文档 {document_id} 入库失败: {e}", exc_info=True)
+            Document.objects.filter(id=document_id).update(status='failed', error_message=str(e))
+        finally:
+            with self._lock:
+                self._queued.discard(document_id)
+                self._active.pop(document_id, None)
+            if document is not None and document.content_hash:
+                self._resubmit_copies(document, deferred)
+            close_old_connections()
+
+    def _process(self, document) -> bool:
+        """处理已认领的文档，返回是否因等待内容相同的更早文档而推迟"""
+        from .models import Document, DocumentChunk
+
+        kb_id = document.knowledge_base_id
+        reporter = ProgressReporter(document.id, self.config['progress_interval'])
+        with self._lock:
+            self._active[document.id] = reporter
+        reporter('queued')
+        if DocumentChunk.objects.filter(document_id=document.id).exists():
+            # 上次处理中断时残留的分块，重新处理前清除
+            self.rag_system.remove_document(kb_id, document.id)
+            DocumentChunk.objects.filter(document_id=document.id).delete()
+        source = self._find_processed_copy(document)
+        if source is None and self._defer_to_earlier_copy(document, reporter):
+            return True
+        if source is not None:
+            # 内容相同的文件已处理过，复制其分块和向量，跳过解析和编码
+            logger.info(f"文档 {document.file_name} 与文档 {source.id} 内容相同，复用已有分块")
+            result = self.rag_system.copy_document(kb_id, document.id, source.id, progress=reporter)
+        else:
+            logger.info(f"开始处理文档: {document.file_name}, 文件大小: {document.file_size}")
+            result = self.rag_system.process_document(kb_id, document.file_path, document.id, progress=reporter)
+        logger.info(f"文档处理结果: {result}")
+
+        if result.get('success', False):
+            reporter.progress['stage'] = 'completed'
+            reporter.flush()
+            metadata = {**(document.metadata or {}), **result.get('metadata', {})}
+            metadata.pop('copied_from', None)
+            if source is not None:
+                metadata['copied_from'] = source.id
+            updated = Document.objects.filter(id=document.id).update(
+                status='completed',
+                chunk_count=result.get('chunk_count', 0),
+                processed_at=timezone.now(),
+                error_message='',
+                metadata=metadata,
+            )
+            if updated:
+                self.rag_system.commit_index_change(kb_id, result.get('store_generation'))
+            else:
+                # 处理期间文档已被删除，丢弃已加入内存的索引
+                self.rag_system.invalidate_index(kb_id)
+        else:
+            reporter.progress['stage'] = 'failed'
+            reporter.flush()
+            Document.objects.filter(id=document.id).update(
+                status='failed', error_message=result.get('error', '未知错误')
+            )
+            logger.error(f"文档处理失败: {result.get('error', '未知错误')}")
+        return False
+
+    @staticmethod
+    def _find_processed_copy(document):
+        """查找文件内容相同的已处理文档（任意知识库），没有时返回None"""
+        from .models import Document
+
+        if not document.content_hash:
+            return None
+        return (
+            Document.objects.filter(
+                content_hash=document.content_hash, status='completed',
+                chunk_count__gt=0, knowledge_base__is_active=True,
+            )
+            .exclude(id=document.id).only('id').order_by('-processed_at').first()
+        )
+
+    @staticmethod
+    def _earlier_copies(document):
+        """内容相同、更早上传且尚未处理完的文档"""
+        from .models import Document
+
+        return Document.objects.filter(
+            content_hash=document.content_hash, id__lt=document.id,
+            status__in=('pending', 'processing'), knowledge_base__is_active=True,
+        )
+
+    def _defer_to_earlier_copy(self, document, reporter) -> bool:
+        """内容相同、更早上传的文档尚未处理完时，把本文档退回 pending，待其处理结束后重新提交以复制其分块
+        
+        同时处理的相同文件按ID先后只解析一次，避免两者都写入完整分块；等待期间不占用工作线程。返回是否推迟。
+        """
+        from .models import Document
+
+        if not document.content_hash or not self._earlier_copies(document).exists():
+            return False
+        reporter('waiting')
+        Document.objects.filter(id=document.id, status='processing').update(status='pending')
+        return True
+
+    def _resubmit_copies(self, document, deferred: bool):
+        """文档处理结束后重新提交等待复制它的（内容相同、pending 的）文档
+        
+        本文档被推迟时，如果更早的文档在推迟期间已经处理结束（错过了它的重新提交），重新提交本文档。
+        """
+        from .models import Document
+
+        try:
+            if deferred:
+                if not self._earlier_copies(document).exists():
+                    self.submit(document.id)
+                return
+            waiting_ids = list(
+                Document.objects.filter(
+                    content_hash=document.content_hash, status='pending', knowledge_base__is_active=True,
+                ).order_by('id').values_list('id', flat=True)
+            )
+            for document_id in waiting_ids:
+                self.submit(document_id)
+        except Exception as e:
+            logger.warning(f"重新提交与文档 {document.id} 内容相同的文档失败: {e}")
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        self._stopped.set()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大模型 HTTP 客户端 - 每个模型配置持有一个带连接池的 aiohttp 会话，跨问题复用 TCP/TLS 连接
+
+aiohttp 会话绑定创建它的事件循环，而同步视图每次请求都会新建事件循环，因此所有会话都运行在
+一个常驻的后台事件循环线程上：调用方在自己的事件循环中 await 请求，由后台循环发出请求并把
+结果转回；流式响应逐行经队列转回。进程退出时关闭全部会话。
+
+每个客户端还带有请求限流（并发信号量 + 令牌桶，见 KNOWLEDGE_LLM_LIMITS），并合并进行中的
+相同请求：同一提示词同时被多次请求时只向上游发出一次，所有等待者共享结果（流式响应会先重放
+已收到的行）。限流和合并都只在后台事件循环中进行，因此无需加锁。
+"""
+
+import json
+import time
+import atexit
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_HTTP_CONFIG = {
+    'pool_size': 100,          # 每个模型配置的最大连接数
+    'limit_per_host': 20,      # 对同一主机的最大连接数
+    'keepalive_timeout': 60,   # 空闲连接保持时间（秒）
+    'connect_timeout': 10,     # 建立连接超时（秒）
+    'request_timeout': 30,     # 单次请求总超时（秒）
+}
+
+DEFAULT_LLM_LIMITS_CONFIG = {
+    'max_concurrency': 8,        # 每个模型配置同时进行的上游请求数，None 表示不限
+    'requests_per_minute': None, # 令牌桶速率，None 表示不限
+    'burst': None,               # 令牌桶容量，None 表示等于每分钟请求数
+    'max_wait_seconds': 60,      # 排队等待超过该时间的请求直接失败
+    'coalesce': True,            # 合并进行中的相同请求
+}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_clients = weakref.WeakSet()
+
+
+def get_llm_http_config() -> Dict:
+    """读取 settings.KNOWLEDGE_LLM_HTTP，缺省项使用默认值"""
+    config = dict(DEFAULT_LLM_HTTP_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_LLM_HTTP', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def get_llm_limits_config() -> Dict:
+    """读取 settings.KNOWLEDGE_LLM_LIMITS，缺省项使用默认值"""
+    config = dict(DEFAULT_LLM_LIMITS_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_LLM_LIMITS', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+class LLMQueueTimeoutError(RuntimeError):
+    """请求排队等待限流超时"""
+
+
+class TokenBucket:
+    """令牌桶，允许预支：令牌不足时返回需要等待的时间，等待结束即视为已取得令牌"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RequestLimiter:
+    """单个模型配置的上游请求限流：并发信号量 + 令牌桶，并记录排队指标"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or get_llm_limits_config()
+        self.max_concurrency = config['max_concurrency']
+        self.max_wait_seconds = config['max_wait_seconds']
+        self._semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+        rate = config['requests_per_minute']
+        self._bucket = TokenBucket(rate / 60.0, config['burst'] or rate) if rate else None
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.rejected = 0
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def _acquire(self):
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            delay = self._bucket.reserve() if self._bucket is not None else 0.0
+            if delay:
+                await asyncio.sleep(delay)
+        except BaseException:
+            if self._semaphore is not None:
+                self._semaphore.release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """排队取得一个请求名额，超过 max_wait_seconds 抛出 LLMQueueTimeoutError"""
+        start = time.monotonic()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await asyncio.wait_for(self._acquire(), self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LLMQueueTimeoutError(f"大模型请求排队超过 {self.max_wait_seconds} 秒")
+        finally:
+            self.queued -= 1
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            'active': self.active,
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'avg_wait_seconds': round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            'max_wait_seconds': round(self.max_wait, 4),
+        }
+
+
+class _SharedStream:
+    """被合并的流式请求：缓存已收到的行，并转发给所有订阅者"""
+
+    def __init__(self):
+        self.lines = []
+        self.subscribers = set()
+        self.result = None
+        self.finished = asyncio.Event()
+        self.task = None
+
+    def publish(self, kind, value=None):
+        if kind == 'line':
+            self.lines.append(value)
+        else:
+            self.result = (kind, value)
+        for emit in list(self.subscribers):
+            emit(kind, value)
+        if kind != 'line':
+            self.finished.set()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """后台事件循环（所有大模型会话共享），首次使用时启动"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='llm-http', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+async def _run_on_loop(coro):
+    """在后台事件循环中执行协程，并在当前事件循环中等待结果"""
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+class LLMHttpClient:
+    """单个模型配置的 HTTP 客户端，会话在首次请求时于后台事件循环中创建"""
+
+    def __init__(self, config: Optional[Dict] = None, limits: Optional[Dict] = None):
+        self.config = config or get_llm_http_config()
+        self.limits = limits or get_llm_limits_config()
+        self.requests = 0
+        self.coalesced = 0
+        self._session = None
+        self._limiter = None
+        self._inflight = 0
+        self._closing = False
+        self._pending = {}   # 请求键 -> 进行中的 Task
+        self._streams = {}   # 请求键 -> _SharedStream
+        _clients.add(self)
+
+    async def post_json(self, url: str, headers: Dict, payload: Dict) -> Tuple[int, str]:
+        """POST JSON 请求，返回 (状态码, 响应文本)"""
+        return await _run_on_loop(self._post_json_coalesced(url, headers, payload))
+
+    async def stream_lines(self, url: str, headers: Dict, payload: Dict) -> AsyncIterator[str]:
+        """POST JSON 请求并逐行产生响应内容（用于SSE流式响应），状态码非200时抛出异常"""
+        caller = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(kind, value=None):
+            caller.call_soon_threadsafe(queue.put_nowait, (kind, value))
+
+        future = asyncio.run_coroutine_threadsafe(self._subscribe_stream(url, headers, payload, emit), _get_loop())
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == 'line':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            # 调用方提前结束时取消后台请求，释放连接
+            future.cancel()
+
+    def stats(self) -> Dict:
+        """请求、合并及排队指标"""
+        limiter = self._limiter.stats() if self._limiter is not None else RequestLimiter(self.limits).stats()
+        return {'requests': self.requests, 'coalesced': self.coalesced, **limiter}
+
+    @property
+    def limiter(self) -> RequestLimiter:
+        if self._limiter is None:
+            self._limiter = RequestLimiter(self.limits)
+        return self._limiter
+
+    def _request_key(self, url: str, payload: Dict) -> Optional[str]:
+        if not self.limits['coalesce']:
+            return None
+        return hashlib.sha256(f"{url}\n{json.dumps(payload, sort_keys=True)}".encode('utf-8')).hexdigest()
+
+    async def _post_json_coalesced(self, url: str, headers: Dict, payload: Dict) -> Tuple[int, str]:
+        key = self._request_key(url, payload)
+        task = self._pending.get(key) if key else None
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._post_json(url, headers, payload))
+            if key:
+                self._pending[key] = task
+                task.add_done_callback(lambda _: self._pending.pop(key, None))
+        # 某个等待者取消时不影响共享的请求
+        return await asyncio.shield(task)
+
+    async def _subscribe_stream(self, url: str, headers: Dict, payload: Dict, emit):
+        key = self._request_key(url, payload)
+        shared = self._streams.get(key) if key else None
+        if shared is not None:
+            self.coalesced += 1
+        else:
+            shared = _SharedStream()
+            shared.task = asyncio.ensure_future(self._stream_lines(url, headers, payload, shared.publish))
+            shared.task.add_done_callback(lambda task: self._finish_stream(key, shared, task))
+            if key:
+                self._streams[key] = shared
+        for line in shared.lines:
+            emit('line', line)
+        if shared.result is not None:
+            emit(*shared.result)
+            return
+        shared.subscribers.add(emit)
+        try:
+            await shared.finished.wait()
+        finally:
+            shared.subscribers.discard(emit)
+            # 所有订阅者都已离开时取消上游请求，之后的相同请求重新发起
+            if not shared.subscribers and not shared.finished.is_set():
+                self._forget_stream(key, shared)
+                shared.task.cancel()
+
+    def _forget_stream(self, key: Optional[str], shared: _SharedStream):
+        if key and self._streams.get(key) is shared:
+            del self._streams[key]
+
+    def _finish_stream(self, key: Optional[str], shared: _SharedStream, task: asyncio.Task):
+        """上游请求结束：未发布结果（被取消）时通知仍在等待的订阅者，避免其一直等待"""
+        self._forget_stream(key, shared)
+        if not shared.finished.is_set():
+            shared.publish('error', RuntimeError("大模型流式请求已取消" if task.cancelled() else "大模型流式请求异常结束"))
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config['pool_size'],
+                limit_per_host=self.config['limit_per_host'],
+                keepalive_timeout=self.config['keepalive_timeout'],
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.config['request_timeout'], connect=self.config['connect_timeout']
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def _post_json(self, url: str, headers: Dict, payload: Dict) -> Tuple[int, str]:
+        import aiohttp
+
+        if self._closing:
+            raise RuntimeError("大模型HTTP客户端已关闭")
+        self._inflight += 1
+        try:
+            async with self.limiter.slot():
+                for attempt in range(2):
+                    try:
+                        async with self._get_session().post(url, headers=headers, json=payload) as response:
+                            self.requests += 1
+                            return response.status, await response.text()
+                    except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError) as e:
+                        # 复用的空闲连接可能已被服务端关闭，换一个连接重试一次
+                        if attempt:
+                            raise
+                        logger.info(f"大模型连接已断开，重试请求: {e}")
+        finally:
+            self._inflight -= 1
+            if self._closing and not self._inflight:
+                await self._close_session()
+
+    async def _stream_lines(self, url: str, headers: Dict, payload: Dict, emit):
+        import aiohttp
+
+        if self._closing:
+            emit('error', RuntimeError("大模型HTTP客户端已关闭"))
+            return
+        # 流式响应不限制总时长，只限制两次数据之间的间隔
+        timeout = aiohttp.ClientTimeout(
+            total=None, connect=self.config['connect_timeout'], sock_read=self.config['request_timeout']
+        )
+        self._inflight += 1
+        received = False
+        try:
+            async with self.limiter.slot():
+                for attempt in range(2):
+                    try:
+                        async with self._get_session().post(url, headers=headers, json=payload, timeout=timeout) as response:
+                            self.requests += 1
+                            if response.status != 200:
+                                raise RuntimeError(f"API请求失败 ({response.status}): {await response.text()}")
+                            async for line in response.content:
+                                received = True
+                                emit('line', line.decode('utf-8', errors='replace').rstrip('\r\n'))
+                        emit('end')
+                        return
+                    except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError) as e:
+                        # 尚未收到数据时，复用的空闲连接可能已被服务端关闭，重试一次
+                        if attempt or received:
+                            raise
+                        logger.info(f"大模型连接已断开，重试请求: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            emit('error', e)
+        finally:
+            self._inflight -= 1
+            if self._closing and not self._inflight:
+                await self._close_session()
+
+    async def _close_session(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _close_when_idle(self):
+        self._closing = True
+        if not self._inflight:
+            asyncio.ensure_future(self._close_session())
+
+    def close(self):
+        """关闭会话（不阻塞），正在进行的请求完成后再关闭连接"""
+        if self._session is not None and _loop is not None:
+            _loop.call_soon_threadsafe(self._close_when_idle)
+        else:
+            self._closing = True
+
+
+async def _close_all_sessions():
+    for client in list(_clients):
+        client._closing = True
+        await client._close_session()
+
+
+@atexit.register
+def close_all_clients(timeout: float = 5.0):
+    """关闭所有大模型会话并停止后台事件循环（进程退出时自动调用）"""
+    loop = _loop
+    if loop is None or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_all_sessions(), loop).result(timeout)
+    except Exception as e:
+        logger.warning(f"关闭大模型HTTP会话失败: {e}")
+    loop.call_soon_threadsafe(loop.stop)
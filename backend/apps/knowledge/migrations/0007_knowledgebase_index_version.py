@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0006_remove_modelconfig_provider_alter_api_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='index_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='索引版本'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0007_knowledgebase_index_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='documentchunk',
+            name='embedding',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0008_remove_documentchunk_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='error_message',
+            field=models.TextField(blank=True, default='', verbose_name='错误信息'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict, verbose_name='处理进度'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:11
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_chunk_hashes(apps, schema_editor):
+    """为已有分块计算内容哈希，供知识库内分块去重使用"""
+    DocumentChunk = apps.get_model('knowledge', 'DocumentChunk')
+    batch = []
+    for chunk in DocumentChunk.objects.only('id', 'content').iterator(chunk_size=2000):
+        chunk.content_hash = hashlib.sha256(chunk.content.encode('utf-8')).hexdigest()
+        batch.append(chunk)
+        if len(batch) >= 2000:
+            DocumentChunk.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0009_document_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='文件SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='内容SHA-256'),
+        ),
+        migrations.RunPython(backfill_chunk_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0010_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qarecord',
+            name='cache_hit',
+            field=models.BooleanField(default=False, verbose_name='命中回答缓存'),
+        ),
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_signature', models.CharField(max_length=64, verbose_name='模型参数签名')),
+                ('prompt_hash', models.CharField(db_index=True, max_length=64, verbose_name='提示词SHA-256')),
+                ('context_key', models.CharField(max_length=64, verbose_name='上下文分块集合SHA-256')),
+                ('question', models.TextField(verbose_name='问题')),
+                ('question_vector', models.BinaryField(blank=True, null=True, verbose_name='问题向量(float32)')),
+                ('answer', models.TextField(verbose_name='回答')),
+                ('model_used', models.CharField(max_length=100, verbose_name='使用的模型')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='命中次数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True, verbose_name='最近命中时间')),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cached_answers', to='knowledge.modelconfig', verbose_name='模型配置')),
+                ('knowledge_base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cached_answers', to='knowledge.knowledgebase', verbose_name='知识库')),
+            ],
+            options={
+                'verbose_name': '回答缓存',
+                'verbose_name_plural': '回答缓存',
+                'indexes': [models.Index(fields=['config', 'context_key'], name='knowledge_c_config__a91fa5_idx')],
+            },
+        ),
+    ]
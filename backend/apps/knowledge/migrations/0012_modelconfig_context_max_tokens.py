@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0011_answer_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelconfig',
+            name='context_max_tokens',
+            field=models.IntegerField(blank=True, null=True, verbose_name='上下文最大Token数'),
+        ),
+    ]
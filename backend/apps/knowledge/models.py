@@ -13,6 +13,7 @@ class KnowledgeBase(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
     is_active = models.BooleanField(default=True, verbose_name="是否激活")
     vector_store_path = models.CharField(max_length=500, blank=True, verbose_name="向量库路径")
+    index_version = models.PositiveIntegerField(default=0, verbose_name="索引版本")
     
     class Meta:
         verbose_name = "知识库"
@@ -21,6 +22,12 @@ class KnowledgeBase(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def bump_index_version(cls, kb_id):
+        """递增知识库的索引版本号（文档新增、删除或重新处理时调用），返回新版本号"""
+        cls.objects.filter(id=kb_id).update(index_version=models.F('index_version') + 1)
+        return cls.objects.filter(id=kb_id).values_list('index_version', flat=True).first() or 0
+
 
 class Document(models.Model):
     """文档模型"""
@@ -51,6 +58,9 @@ class Document(models.Model):
     processed_at = models.DateTimeField(null=True, blank=True, verbose_name="处理时间")
     chunk_count = models.IntegerField(default=0, verbose_name="分块数量")
     metadata = models.JSONField(default=dict, verbose_name="元数据")
+    progress = models.JSONField(default=dict, blank=True, verbose_name="处理进度")
+    error_message = models.TextField(blank=True, default="", verbose_name="错误信息")
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True, verbose_name="文件SHA-256")
     
     class Meta:
         verbose_name = "文档"
@@ -65,8 +75,8 @@ class DocumentChunk(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
     chunk_index = models.IntegerField(verbose_name="分块索引")
     content = models.TextField(verbose_name="分块内容")
-    embedding = models.JSONField(null=True, blank=True, verbose_name="向量嵌入")
     metadata = models.JSONField(default=dict, verbose_name="分块元数据")
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True, verbose_name="内容SHA-256")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     
     class Meta:
@@ -107,6 +117,7 @@ class QARecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     feedback_score = models.IntegerField(null=True, blank=True, verbose_name="反馈评分(1-5)")
     feedback_comment = models.TextField(blank=True, verbose_name="反馈评论")
+    cache_hit = models.BooleanField(default=False, verbose_name="命中回答缓存")
     
     class Meta:
         verbose_name = "问答记录"
@@ -131,6 +142,7 @@ class ModelConfig(models.Model):
     api_base_url = models.URLField(verbose_name="API基础URL")
     model_path = models.CharField(max_length=1000, blank=True, verbose_name="本地模型路径")
     max_tokens = models.IntegerField(default=4096, verbose_name="最大Token数")
+    context_max_tokens = models.IntegerField(null=True, blank=True, verbose_name="上下文最大Token数")
     temperature = models.FloatField(default=0.7, verbose_name="温度参数")
     is_active = models.BooleanField(default=True, verbose_name="是否激活")
     is_default = models.BooleanField(default=False, verbose_name="是否默认")
@@ -144,6 +156,34 @@ class ModelConfig(models.Model):
         return f"{self.name} ({self.model_name})"
 
 
+class CachedAnswer(models.Model):
+    """大模型回答缓存
+    
+    按 (模型配置, 模型参数签名, 提示词哈希, 上下文分块id集合) 复用回答；
+    开启语义匹配时，上下文相同且问题向量足够相似的缓存也可复用。
+    """
+    config = models.ForeignKey(ModelConfig, on_delete=models.CASCADE, related_name='cached_answers', verbose_name="模型配置")
+    knowledge_base = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE, related_name='cached_answers', verbose_name="知识库")
+    model_signature = models.CharField(max_length=64, verbose_name="模型参数签名")
+    prompt_hash = models.CharField(max_length=64, db_index=True, verbose_name="提示词SHA-256")
+    context_key = models.CharField(max_length=64, verbose_name="上下文分块集合SHA-256")
+    question = models.TextField(verbose_name="问题")
+    question_vector = models.BinaryField(null=True, blank=True, verbose_name="问题向量(float32)")
+    answer = models.TextField(verbose_name="回答")
+    model_used = models.CharField(max_length=100, verbose_name="使用的模型")
+    hit_count = models.IntegerField(default=0, verbose_name="命中次数")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="创建时间")
+    last_hit_at = models.DateTimeField(null=True, blank=True, verbose_name="最近命中时间")
+    
+    class Meta:
+        verbose_name = "回答缓存"
+        verbose_name_plural = "回答缓存"
+        indexes = [models.Index(fields=['config', 'context_key'])]
+        
+    def __str__(self):
+        return f"{self.config_id}: {self.question[:50]}"
+
+
 class EmbeddingConfig(models.Model):
     """嵌入模型配置"""
     EMBEDDING_TYPES = [
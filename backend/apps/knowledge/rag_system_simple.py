@@ -3,403 +3,749 @@
 """
 import os
 import json
+import codecs
 import logging
 import hashlib
 import asyncio
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Iterable, Iterator
 from datetime import datetime
+from importlib.util import find_spec
 import uuid
 
-# 文档处理
-try:
-    import PyPDF2
-    HAS_PDF = True
-except ImportError:
-    HAS_PDF = False
-
-try:
-    import docx
-    HAS_DOCX = True
-except ImportError:
-    HAS_DOCX = False
-
-try:
-    from markdown import markdown
-    from bs4 import BeautifulSoup
-    HAS_MARKDOWN = True
-except ImportError:
-    HAS_MARKDOWN = False
+# 文档处理 - 解析库导入较慢，启动时只检查是否安装，解析对应格式时才导入
+HAS_PDF = find_spec('PyPDF2') is not None
+HAS_DOCX = find_spec('docx') is not None
+HAS_MARKDOWN = find_spec('markdown') is not None and find_spec('bs4') is not None
 
 # 向量化和检索
 import numpy as np
 
-# 文本处理
-try:
-    import jieba
-    HAS_JIEBA = True
-except ImportError:
-    HAS_JIEBA = False
-
 import re
+import bisect
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .bm25 import BM25Index, get_hybrid_config, reciprocal_rank_fusion
+from .embedding import SimpleEmbedding
+from .retrieval_cache import RetrievalCache, normalize_question
+from .answer_cache import AnswerCache
+from .context_builder import ContextBuilder
+from .llm_http import LLMHttpClient
+from .db_executor import run_db
+from .tokenizer import estimate_tokens, estimate_token_spans
+from .vector_index import (
+    FlatIndex, IVFFlatIndex, build_index, get_index_config, normalize_rows, select_index_kind
+)
+from .vector_storage import MmapVectorStorage
 
 logger = logging.getLogger(__name__)
 
 
+def chunk_content_hash(content: str) -> str:
+    """分块内容的SHA-256，用于文档内分块去重"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+DEFAULT_PARSING_CONFIG = {
+    'processes': None,         # 解析进程数，None 表示CPU核数；0 表示在当前线程解析
+    'pdf_pages_per_task': 32,  # 大PDF按页范围拆分，每个任务的页数
+}
+
+DEFAULT_SPLITTER_CONFIG = {
+    'chunk_tokens': 512,         # 每块的词元数上限（按 estimate_tokens 估计）
+    'overlap_sentences': 2,      # 相邻块重叠的句子数
+    'max_segment_chars': 2000,   # 没有句子边界的长文本每隔该字数强制断开
+}
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parsing_config() -> Dict:
+    """读取 settings.KNOWLEDGE_PARSING，缺省项使用默认值"""
+    config = dict(DEFAULT_PARSING_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_PARSING', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def get_splitter_config() -> Dict:
+    """读取 settings.KNOWLEDGE_TEXT_SPLITTER，缺省项使用默认值"""
+    config = dict(DEFAULT_SPLITTER_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_TEXT_SPLITTER', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """文档解析进程池（所有入库线程共享），配置为0个进程时返回None"""
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                processes = get_parsing_config()['processes']
+                if processes == 0:
+                    return None
+                # spawn 方式启动，避免在多线程的服务进程中 fork
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=processes or os.cpu_count(),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _parse_pool
+
+
+def _reset_parse_pool():
+    """解析进程异常退出后丢弃进程池，下次使用时重建"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = None
+
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """在解析进程中提取PDF第 start 到 end-1 页的文本"""
+    import PyPDF2
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
 class DocumentProcessor:
-    """文档处理器"""
+    """文档处理器
+    
+    iter_blocks 按块流式提取文本（PDF逐页、DOCX逐段、TXT按固定字符数），配合
+    TextSplitter.split_stream 使用时内存占用与分块大小相当，而不是与整个文档相当。
+    """
+    
+    TEXT_BLOCK_CHARS = 1 << 16  # TXT 每次读取的字符数
     
     @staticmethod
-    def process_file(file_path: str) -> Tuple[str, Dict]:
-        """处理单个文件"""
+    def iter_blocks(file_path: str, progress=None) -> Tuple[Iterator[str], Dict]:
+        """流式提取文件文本，返回 (文本块迭代器, 元数据)；按顺序拼接全部文本块即为全文"""
         file_ext = os.path.splitext(file_path)[1].lower()
         
         if file_ext == '.txt':
-            return DocumentProcessor._process_txt(file_path)
+            return DocumentProcessor._iter_txt(file_path), {'source': file_path, 'type': 'txt'}
         elif file_ext == '.md':
-            return DocumentProcessor._process_markdown(file_path)
+            return DocumentProcessor._iter_markdown(file_path), {'source': file_path, 'type': 'markdown'}
         elif file_ext == '.pdf' and HAS_PDF:
-            return DocumentProcessor._process_pdf(file_path)
+            metadata = {'source': file_path, 'type': 'pdf', 'pages': DocumentProcessor._count_pdf_pages(file_path)}
+            return DocumentProcessor._iter_pdf(file_path, progress), metadata
         elif file_ext in ['.docx', '.doc'] and HAS_DOCX:
-            return DocumentProcessor._process_docx(file_path)
+            import docx
+            document = docx.Document(file_path)
+            metadata = {'source': file_path, 'type': 'docx', 'paragraphs': len(document.paragraphs)}
+            return (paragraph.text + "\n" for paragraph in document.paragraphs), metadata
         elif file_ext == '.html':
-            return DocumentProcessor._process_html(file_path)
+            return DocumentProcessor._iter_html(file_path), {'source': file_path, 'type': 'html'}
         else:
             raise ValueError(f"不支持的文件格式: {file_ext}")
     
     @staticmethod
-    def _process_txt(file_path: str) -> Tuple[str, Dict]:
-        """处理TXT文件"""
+    def iter_blocks_parallel(file_path: str, progress=None) -> Tuple[Iterator[str], Dict]:
+        """与 iter_blocks 相同，但CPU密集的解析在解析进程池中执行，不占用入库线程的GIL
+        
+        大PDF按页范围拆分为多个任务并行提取，按页序逐页产出；其他格式整文件交给解析进程。
+        TXT 只是读取文件，仍在当前线程流式读取。进程池不可用时退回当前线程解析。
+        """
+        pool = get_parse_pool()
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if pool is None or file_ext == '.txt':
+            return DocumentProcessor.iter_blocks(file_path, progress)
+        if file_ext == '.pdf' and HAS_PDF:
+            pages_total = DocumentProcessor._count_pdf_pages(file_path)
+            metadata = {'source': file_path, 'type': 'pdf', 'pages': pages_total}
+            return DocumentProcessor._iter_pdf_parallel(pool, file_path, pages_total, progress), metadata
+        try:
+            text, metadata = pool.submit(DocumentProcessor.process_file, file_path).result()
+        except BrokenProcessPool:
+            logger.warning("解析进程池异常，改为在当前线程解析")
+            _reset_parse_pool()
+            return DocumentProcessor.iter_blocks(file_path, progress)
+        return iter([text]), metadata
+    
+    @staticmethod
+    def process_file(file_path: str, progress=None) -> Tuple[str, Dict]:
+        """处理单个文件，返回全文和元数据；progress 为可选的进度回调（PDF按页汇报）"""
+        blocks, metadata = DocumentProcessor.iter_blocks(file_path, progress)
+        text = ''.join(blocks)
+        metadata['size'] = len(text)
+        return text, metadata
+    
+    @staticmethod
+    def _detect_text_encoding(file_path: str) -> str:
+        """按块校验文件是否为UTF-8，否则按GBK读取"""
+        decoder = codecs.getincrementaldecoder('utf-8')()
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            with open(file_path, 'rb') as f:
+                for raw in iter(lambda: f.read(DocumentProcessor.TEXT_BLOCK_CHARS), b''):
+                    decoder.decode(raw)
+            decoder.decode(b'', final=True)
         except UnicodeDecodeError:
-            with open(file_path, 'r', encoding='gbk') as f:
-                content = f.read()
-        
-        metadata = {
-            'source': file_path,
-            'type': 'txt',
-            'size': len(content)
-        }
-        
-        return content, metadata
+            return 'gbk'
+        return 'utf-8'
     
     @staticmethod
-    def _process_markdown(file_path: str) -> Tuple[str, Dict]:
-        """处理Markdown文件"""
+    def _iter_txt(file_path: str) -> Iterator[str]:
+        """按固定字符数流式读取TXT文件"""
+        encoding = DocumentProcessor._detect_text_encoding(file_path)
+        with open(file_path, 'r', encoding=encoding) as f:
+            yield from iter(lambda: f.read(DocumentProcessor.TEXT_BLOCK_CHARS), '')
+    
+    @staticmethod
+    def _iter_markdown(file_path: str) -> Iterator[str]:
+        """处理Markdown文件（转换HTML需要完整文档，整体产出）"""
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
         # 提取纯文本（移除markdown语法）
         if HAS_MARKDOWN:
+            from markdown import markdown
+            from bs4 import BeautifulSoup
             html = markdown(content)
             soup = BeautifulSoup(html, 'html.parser')
-            text = soup.get_text()
+            yield soup.get_text()
         else:
             # 简单的markdown语法移除
-            text = re.sub(r'[#*`_\[\]()]', '', content)
-        
-        metadata = {
-            'source': file_path,
-            'type': 'markdown',
-            'size': len(text)
-        }
-        
-        return text, metadata
+            yield re.sub(r'[#*`_\[\]()]', '', content)
     
     @staticmethod
-    def _process_pdf(file_path: str) -> Tuple[str, Dict]:
-        """处理PDF文件"""
-        text = ""
+    def _count_pdf_pages(file_path: str) -> int:
+        import PyPDF2
+        with open(file_path, 'rb') as f:
+            return len(PyPDF2.PdfReader(f).pages)
+    
+    @staticmethod
+    def _iter_pdf(file_path: str, progress=None, first_page: int = 0) -> Iterator[str]:
+        """逐页提取PDF文本，从 first_page 页开始"""
+        import PyPDF2
         with open(file_path, 'rb') as f:
             reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        
-        metadata = {
-            'source': file_path,
-            'type': 'pdf',
-            'pages': len(reader.pages),
-            'size': len(text)
-        }
-        
-        return text, metadata
+            pages_total = len(reader.pages)
+            for page_number in range(first_page, pages_total):
+                page_text = reader.pages[page_number].extract_text()
+                if progress:
+                    progress(pages_parsed=page_number + 1, pages_total=pages_total)
+                yield page_text + "\n"
     
     @staticmethod
-    def _process_docx(file_path: str) -> Tuple[str, Dict]:
-        """处理DOCX文件"""
-        doc = docx.Document(file_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        
-        metadata = {
-            'source': file_path,
-            'type': 'docx',
-            'paragraphs': len(doc.paragraphs),
-            'size': len(text)
-        }
-        
-        return text, metadata
+    def _iter_pdf_parallel(pool: ProcessPoolExecutor, file_path: str, pages_total: int,
+                           progress=None) -> Iterator[str]:
+        """按页范围并行提取PDF文本，按页序产出；同时在途的任务数有上限，避免结果堆积在内存中"""
+        config = get_parsing_config()
+        step = max(1, config['pdf_pages_per_task'])
+        window = 2 * (config['processes'] or os.cpu_count() or 1)
+        starts = list(range(0, pages_total, step))
+        futures = {}
+        submitted = 0
+        try:
+            for start in starts:
+                while submitted < len(starts) and len(futures) < window:
+                    task_start = starts[submitted]
+                    futures[task_start] = pool.submit(
+                        _extract_pdf_pages, file_path, task_start, min(task_start + step, pages_total)
+                    )
+                    submitted += 1
+                try:
+                    texts = futures.pop(start).result()
+                except BrokenProcessPool:
+                    logger.warning("解析进程池异常，剩余页面改为在当前线程解析")
+                    _reset_parse_pool()
+                    yield from DocumentProcessor._iter_pdf(file_path, progress, first_page=start)
+                    return
+                if progress:
+                    progress(pages_parsed=start + len(texts), pages_total=pages_total)
+                for page_text in texts:
+                    yield page_text + "\n"
+        finally:
+            for future in futures.values():
+                future.cancel()
     
     @staticmethod
-    def _process_html(file_path: str) -> Tuple[str, Dict]:
-        """处理HTML文件"""
+    def _iter_html(file_path: str) -> Iterator[str]:
+        """处理HTML文件（解析需要完整文档，整体产出）"""
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
         if HAS_MARKDOWN:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(content, 'html.parser')
-            text = soup.get_text()
+            yield soup.get_text()
         else:
             # 简单的HTML标签移除
-            text = re.sub(r'<[^>]+>', '', content)
-        
-        metadata = {
-            'source': file_path,
-            'type': 'html',
-            'size': len(text)
-        }
-        
-        return text, metadata
+            yield re.sub(r'<[^>]+>', '', content)
 
 
 class TextSplitter:
-    """文本分块器"""
+    """文本分块器
+    
+    先一次扫描出句子/段落边界（。！？!? 及换行，Markdown 标题另作标记），得到各片段的
+    字符偏移和估计的词元数（estimate_tokens，不调用 jieba）；再在词元数前缀和上二分查找，取不超过 chunk_tokens 的最多整句作为一块，
+    相邻块重叠 overlap_sentences 句。超过预算的长句按词元拆开，没有边界的长文本每
+    max_segment_chars 字强制断开。整体文本与按块流式输入的分块结果完全相同。
+    """
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
-        self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
+    SENTENCE_END_RE = re.compile(r'(?:[。！？!?]+[”’」』）)]*|\n)\s*')
+    HEADING_RE = re.compile(r'\s*#{1,6}\s')
+    
+    def __init__(self, chunk_tokens: Optional[int] = None, overlap_sentences: Optional[int] = None,
+                 max_segment_chars: Optional[int] = None):
+        config = get_splitter_config()
+        self.chunk_tokens = max(1, int(chunk_tokens or config['chunk_tokens']))
+        self.overlap_sentences = max(0, int(config['overlap_sentences'] if overlap_sentences is None
+                                            else overlap_sentences))
+        self.max_segment_chars = max(1, int(max_segment_chars or config['max_segment_chars']))
     
     def split_text(self, text: str, metadata: Dict = None) -> List[Dict]:
         """分割文本为块"""
-        # 简单的文本分割
-        chunks = []
-        start = 0
+        return list(self.split_stream([text], metadata))
+    
+    def split_stream(self, blocks: Iterable[str], metadata: Dict = None) -> Iterator[Dict]:
+        """增量分割文本块流，结果与分割拼接后的全文完全相同"""
+        budget = self.chunk_tokens
+        segments = self._iter_segments(blocks)
+        window = []  # 当前块起点开始的片段 (起点, 终点, 词元数, 是否标题, 文本)
+        cumulative = [0]  # window 的词元数前缀和
+        exhausted = False
+        chunk_index = 0
         
-        while start < len(text):
-            end = start + self.chunk_size
-            chunk = text[start:end]
-            
-            # 尝试在句号处分割
-            if end < len(text):
-                last_period = chunk.rfind('。')
-                if last_period > self.chunk_size // 2:
-                    chunk = chunk[:last_period + 1]
-                    end = start + last_period + 1
+        while True:
+            # 读入片段直到超出预算，才能确定本块的终点
+            while not exhausted and cumulative[-1] <= budget:
+                segment = next(segments, None)
+                if segment is None:
+                    exhausted = True
+                else:
+                    window.append(segment)
+                    cumulative.append(cumulative[-1] + segment[2])
+            if not window:
+                break
             
-            chunk_metadata = {
-                'chunk_index': len(chunks),
-                'chunk_size': len(chunk),
-                'chunk_word_count': len(chunk.split()),
-                **(metadata or {})
-            }
+            end = max(1, bisect.bisect_right(cumulative, budget) - 1)
+            # 块内有新的标题且标题前已有足够内容时，在标题前断开
+            at_heading = False
+            for position in range(end - 1, 0, -1):
+                if window[position][3] and cumulative[position] >= budget // 4:
+                    end, at_heading = position, True
+                    break
             
-            chunks.append({
-                'content': chunk.strip(),
-                'metadata': chunk_metadata
-            })
+            content = ''.join(segment[4] for segment in window[:end]).strip()
+            if content:
+                yield {
+                    'content': content,
+                    'metadata': {
+                        'chunk_index': chunk_index,
+                        'chunk_size': len(content),
+                        'chunk_tokens': cumulative[end],
+                        'char_start': window[0][0],
+                        'char_end': window[end - 1][1],
+                        **(metadata or {})
+                    }
+                }
+                chunk_index += 1
+            if end == len(window):
+                break
             
-            start = end - self.chunk_overlap
-        
-        return chunks
-
-
-class SimpleEmbedding:
-    """简单的嵌入模型实现"""
-    
-    def __init__(self, vector_size=300):
-        self.vector_size = vector_size
-        self.is_fitted = True  # 简化版本，不需要训练
-        # 预定义词汇表和哈希函数
-        self.vocab = {}
-        self.vocab_size = 1000  # 限制词汇表大小
-    
-    def _get_vocab(self, texts):
-        """建立词汇表"""
-        vocab = set()
-        for text in texts:
-            # 简单的中文分词（按字符）
-            chars = list(text)
-            vocab.update(chars)
-        
-        # 限制词汇表大小，选择最常见的字符
-        if len(vocab) > self.vocab_size:
-            from collections import Counter
-            all_chars = []
-            for text in texts:
-                all_chars.extend(list(text))
-            char_counts = Counter(all_chars)
-            vocab = [char for char, count in char_counts.most_common(self.vocab_size)]
-        else:
-            vocab = list(vocab)
-        
-        return vocab
+            # 下一块从末尾的 overlap_sentences 句开始，但不跨过标题，并保证能容纳下一句
+            start = end if at_heading else max(
+                1, end - self.overlap_sentences,
+                bisect.bisect_left(cumulative, cumulative[end + 1] - budget)
+            )
+            for position in range(end - 1, start - 1, -1):
+                if window[position][3]:
+                    start = position
+                    break
+            window = window[start:]
+            cumulative = [count - cumulative[start] for count in cumulative[start:]]
     
-    def encode(self, texts: List[str]) -> np.ndarray:
-        """编码文本为向量"""
-        if not texts:
-            return np.array([])
-        
-        # 如果是第一次编码，建立词汇表
-        if not self.vocab:
-            vocab_list = self._get_vocab(texts)
-            self.vocab = {char: i for i, char in enumerate(vocab_list)}
+    def _iter_segments(self, blocks: Iterable[str]) -> Iterator[Tuple[int, int, int, bool, str]]:
+        """扫描边界产出片段 (起点, 终点, 词元数, 是否标题, 文本)，超过预算的片段按词元拆开"""
+        budget = self.chunk_tokens
+        for start, end, text in self._iter_sentences(blocks):
+            tokens = estimate_tokens(text)
+            heading = bool(self.HEADING_RE.match(text))
+            if tokens <= budget:
+                yield start, end, tokens, heading, text
+                continue
+            spans = estimate_token_spans(text)
+            piece_start = 0
+            for first in range(0, len(spans), budget):
+                piece_end = spans[first + budget][0] if first + budget < len(spans) else len(text)
+                yield (start + piece_start, start + piece_end, min(budget, len(spans) - first),
+                       heading and first == 0, text[piece_start:piece_end])
+                piece_start = piece_end
+    
+    def _iter_sentences(self, blocks: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+        """按句子/段落边界切分文本流，产出 (起点, 终点, 文本)
         
-        vectors = []
-        for text in texts:
-            # 创建固定大小的向量
-            vector = np.zeros(self.vector_size)
-            
-            # 字符级别的简单编码
-            chars = list(text)
-            for i, char in enumerate(chars):
-                if char in self.vocab:
-                    idx = self.vocab[char]
-                    # 使用哈希函数映射到固定大小的向量
-                    pos = idx % self.vector_size
-                    vector[pos] += 1
-            
-            # 归一化
-            norm = np.linalg.norm(vector)
-            if norm > 0:
-                vector = vector / norm
-            
-            vectors.append(vector)
+        片段在 [起点, 起点 + max_segment_chars) 内的第一个边界处结束，没有边界时在窗口末尾结束。
+        边界匹配到缓冲区末尾时可能还会延续，需要读入更多文本后才能确定。
+        """
+        limit = self.max_segment_chars
+        blocks = iter(blocks)
+        buffer = ''
+        offset = 0  # buffer[0] 在全文中的位置
+        position = 0
+        exhausted = False
         
-        return np.array(vectors, dtype=float)
+        while True:
+            available = offset + len(buffer)
+            if exhausted and position >= available:
+                return
+            if not exhausted and available < position + limit:
+                match = self.SENTENCE_END_RE.search(buffer, position - offset)
+                if match is None or match.end() == len(buffer):
+                    block = next(blocks, None)
+                    if block is None:
+                        exhausted = True
+                    else:
+                        buffer = buffer[position - offset:] + block
+                        offset = position
+                    continue
+                end = offset + match.end()
+            else:
+                window_end = min(position + limit, available)
+                match = self.SENTENCE_END_RE.search(buffer, position - offset, window_end - offset)
+                end = offset + match.end() if match else window_end
+            yield position, end, buffer[position - offset:end - offset]
+            position = end
 
 
 class VectorStore:
     """向量存储器"""
     
-    def __init__(self, embedding_model=None):
+    def __init__(self, embedding_model=None, storage: Optional[MmapVectorStorage] = None):
         self.embedding_model = embedding_model or SimpleEmbedding()
         self.chunks = []
-        self.vectors = None
+        self.vectors = None  # 按行归一化的连续 float32 矩阵 (n_chunks, dim)
         self.metadata = []
+        self.chunk_ids = []  # 与向量逐行对应的 DocumentChunk id
+        self._row_by_chunk_id = None  # 分块id -> 行号，按需构建
+        self.storage = storage  # 知识库向量文件，None 表示仅在内存中
+        self.loaded = False  # 是否由 load_chunks 加载了知识库的全部分块；只有完整的索引才持久化IVF/BM25文件
+        self.index_config = get_index_config()
+        self.index = FlatIndex()  # 向量较多时自动切换为IVF近似索引
+        self.hybrid_config = get_hybrid_config()
+        self.lexical_index = BM25Index(k1=self.hybrid_config['k1'], b=self.hybrid_config['b'])
     
-    def add_documents(self, chunks: List[Dict]):
-        """添加文档块并持久化到数据库"""
+    def add_documents(self, chunks: List[Dict], progress=None,
+                      vectors: Optional[np.ndarray] = None) -> int:
+        """添加文档块并持久化到数据库
+        
+        先编码全部新分块，再按批 bulk_create 写入分块行，每个文档只查询一次。
+        所属文档已被删除的分块直接丢弃；与同一文档已写入的分块内容相同的分块按内容哈希跳过
+        （只在文档内去重，文档的分块不依赖其他文档）。vectors 为与 chunks 对应的已有向量
+        （复用时跳过编码），progress 为可选的进度回调（汇报已编码的分块数）。
+        
+        Returns:
+            int: 写入的块数
+        """
+        from django.conf import settings
         from django.db import transaction
         from apps.knowledge.models import DocumentChunk, Document
         
-        with transaction.atomic():
-            for chunk in chunks:
-                self.chunks.append(chunk['content'])
-                self.metadata.append(chunk['metadata'])
-                
-                # 持久化到数据库
-                if 'document_id' in chunk['metadata']:
-                    try:
-                        document = Document.objects.get(id=chunk['metadata']['document_id'])
-                        DocumentChunk.objects.create(
-                            document=document,
-                            chunk_index=chunk['metadata'].get('chunk_index', 0),
-                            content=chunk['content'],
-                            embedding=None,  # 向量将在_update_vectors中更新
-                            metadata=chunk['metadata']
-                        )
-                    except Document.DoesNotExist:
-                        logger.warning(f"Document with ID {chunk['metadata']['document_id']} not found")
+        document_ids = {chunk['metadata']['document_id'] for chunk in chunks if 'document_id' in chunk['metadata']}
+        documents = Document.objects.in_bulk(document_ids) if document_ids else {}
+        for missing_id in document_ids - set(documents):
+            logger.warning(f"Document with ID {missing_id} not found")
+        
+        hashes = [chunk_content_hash(chunk['content']) for chunk in chunks]
+        # 各文档已写入（之前的批次）的内容
+        seen = set(
+            DocumentChunk.objects.filter(document_id__in=documents, content_hash__in=set(hashes))
+            .values_list('document_id', 'content_hash')
+        ) if documents else set()
+        keep = []
+        for position, chunk in enumerate(chunks):
+            document_id = chunk['metadata'].get('document_id')
+            if document_id is not None and document_id not in documents:
+                continue
+            if (document_id, hashes[position]) in seen:
+                continue
+            seen.add((document_id, hashes[position]))
+            keep.append(position)
+        if len(keep) < len(chunks):
+            chunks = [chunks[position] for position in keep]
+            hashes = [hashes[position] for position in keep]
+            if vectors is not None:
+                vectors = vectors[keep]
+        if not chunks:
+            return 0
+        
+        new_vectors = self._encode_chunks(chunks, progress) if vectors is None else normalize_rows(vectors)
+        
+        rows, positions = [], []
+        for position, chunk in enumerate(chunks):
+            document = documents.get(chunk['metadata'].get('document_id'))
+            if document is not None:
+                rows.append(DocumentChunk(
+                    document=document,
+                    chunk_index=chunk['metadata'].get('chunk_index', 0),
+                    content=chunk['content'],
+                    metadata=chunk['metadata'],
+                    content_hash=hashes[position]
+                ))
+                positions.append(position)
         
-        # 重新计算向量
-        self._update_vectors()
+        chunk_ids = [None] * len(chunks)
+        if rows:
+            batch_size = getattr(settings, 'KNOWLEDGE_CHUNK_BATCH_SIZE', 500)
+            with transaction.atomic():
+                created = DocumentChunk.objects.bulk_create(rows, batch_size=batch_size)
+                if any(row.pk is None for row in created):
+                    # 数据库不支持批量插入返回主键时，按 (文档, 分块索引) 回查
+                    id_map = {
+                        (document_id, chunk_index): chunk_id
+                        for chunk_id, document_id, chunk_index in DocumentChunk.objects.filter(
+                            document_id__in=documents
+                        ).values_list('id', 'document_id', 'chunk_index')
+                    }
+                    for row in created:
+                        row.pk = id_map.get((row.document_id, row.chunk_index))
+            for position, row in zip(positions, created):
+                chunk_ids[position] = row.pk
+        
+        # 只追加新增的分块到向量文件，并增量插入索引
+        self._append_vectors(chunks, chunk_ids, vectors=new_vectors)
+        self.index.add(new_vectors)
+        self.lexical_index.add([chunk['content'] for chunk in chunks])
+        self._refresh_index()
+        return len(chunks)
     
-    def _update_vectors(self):
-        """更新向量并持久化到数据库"""
-        if self.chunks:
-            self.vectors = self.embedding_model.encode(self.chunks)
-            
-            # 更新数据库中的向量 - 处理异步环境
-            from apps.knowledge.models import DocumentChunk
-            import asyncio
-            import threading
-            import queue
-            
-            # 检查是否在异步环境中
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 在异步环境中，使用线程来执行同步数据库操作
-                    def sync_update_embeddings():
-                        for i, vector in enumerate(self.vectors):
-                            if i < len(self.metadata) and 'document_id' in self.metadata[i]:
-                                try:
-                                    chunk = DocumentChunk.objects.filter(
-                                        document_id=self.metadata[i]['document_id'],
-                                        chunk_index=self.metadata[i].get('chunk_index', 0)
-                                    ).first()
-                                    if chunk:
-                                        chunk.embedding = vector.tolist()
-                                        chunk.save()
-                                except Exception as e:
-                                    logger.warning(f"Failed to update embedding for chunk {i}: {e}")
-                    
-                    # 在独立线程中执行数据库更新
-                    thread = threading.Thread(target=sync_update_embeddings)
-                    thread.start()
-                    thread.join()
-                    return
-                    
-            except RuntimeError:
-                # 没有事件循环，可以进行同步操作
-                pass
-            
-            # 同步环境中的正常更新
-            for i, vector in enumerate(self.vectors):
-                if i < len(self.metadata) and 'document_id' in self.metadata[i]:
-                    try:
-                        chunk = DocumentChunk.objects.filter(
-                            document_id=self.metadata[i]['document_id'],
-                            chunk_index=self.metadata[i].get('chunk_index', 0)
-                        ).first()
-                        if chunk:
-                            chunk.embedding = vector.tolist()
-                            chunk.save()
-                    except Exception as e:
-                        logger.warning(f"Failed to update embedding for chunk {i}: {e}")
+    def _encode_chunks(self, chunks: List[Dict], progress=None) -> np.ndarray:
+        """分批编码分块并汇报进度"""
+        batch_size = getattr(self.embedding_model, 'batch_size', 1024)
+        batches = []
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            batches.append(normalize_rows(self.embedding_model.encode([chunk['content'] for chunk in batch])))
+            if progress:
+                progress(chunks_embedded=start + len(batch), chunks_total=len(chunks))
+        return np.vstack(batches)
     
-    def similarity_search(self, query: str, top_k: int = 5, threshold: float = 0.1) -> List[Dict]:
-        """相似度搜索"""
-        if not self.chunks or self.vectors is None:
-            return []
+    def _append_vectors(self, chunks: List[Dict], chunk_ids: List[Optional[int]], persist: bool = True,
+                        vectors: Optional[np.ndarray] = None) -> np.ndarray:
+        """追加新增分块到内存矩阵和向量文件（未传入向量时先编码），返回新增的向量"""
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        new_vectors = vectors if vectors is not None else normalize_rows(
+            self.embedding_model.encode([chunk['content'] for chunk in chunks])
+        )
         
-        # 编码查询
-        query_vector = self.embedding_model.encode([query])
+        if persist and self.storage is not None and self._storage_compatible():
+            persisted = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id is not None]
+            if persisted:
+                self.storage.append(
+                    new_vectors[persisted],
+                    [chunk_ids[i] for i in persisted],
+                    self.embedding_model.get_state()
+                )
         
-        # 简单的余弦相似度计算
-        def cosine_sim(a, b):
-            dot_product = np.dot(a, b)
-            norm_a = np.linalg.norm(a)
-            norm_b = np.linalg.norm(b)
-            if norm_a == 0 or norm_b == 0:
-                return 0
-            return dot_product / (norm_a * norm_b)
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            self.chunks.append(chunk['content'])
+            self.metadata.append(chunk['metadata'])
+            self.chunk_ids.append(chunk_id)
+        self._row_by_chunk_id = None
+        self.vectors = new_vectors if self.vectors is None else np.vstack([self.vectors, new_vectors])
+        return new_vectors
+    
+    def _storage_compatible(self) -> bool:
+        """向量文件为空或由相同嵌入模型写入时才能直接追加；否则留待下次加载时整体重新编码"""
+        meta = self.storage.read_meta()
+        if not meta or not meta.get('count') or self.embedding_model.load_state(meta.get('embedding')):
+            return True
+        logger.info(f"向量文件嵌入模型签名不一致，暂不追加，将在下次加载时重建: {self.storage.directory}")
+        return False
+    
+    def load_chunks(self, chunk_data: List[Dict]):
+        """从数据库分块加载索引
+        
+        向量优先以内存映射方式从向量文件读取（零拷贝），只编码文件中缺失的分块；
+        文件中已删除或重复的行会在加载时压缩重写。
+        """
+        self.chunks, self.metadata, self.chunk_ids = [], [], []
+        self._row_by_chunk_id = None
+        self.vectors = None
         
-        similarities = []
-        for vector in self.vectors:
-            sim = cosine_sim(query_vector[0], vector)
-            similarities.append(sim)
-        similarities = np.array(similarities)
+        vectors, file_ids, meta = self.storage.load() if self.storage is not None else (None, None, None)
+        file_valid = vectors is not None and self.embedding_model.load_state(meta.get('embedding'))
+        needs_rewrite = bool(meta and meta.get('count')) and not file_valid
+        if needs_rewrite:
+            # 嵌入模型已变化，旧的IVF质心不再适用
+            IVFFlatIndex.remove_files(self.storage.directory)
+        remaining = {item['id']: item for item in chunk_data}
         
-        # 获取top_k结果
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        if file_valid:
+            # 只保留数据库中仍存在的分块，重复写入的行保留第一次出现的
+            _, first_rows = np.unique(file_ids, return_index=True)
+            rows = np.sort(first_rows[np.isin(file_ids[first_rows], list(remaining))])
+            if len(rows) != len(file_ids):
+                vectors, file_ids = np.ascontiguousarray(vectors[rows]), file_ids[rows]
+                needs_rewrite = True
+            for chunk_id in file_ids.tolist():
+                item = remaining.pop(chunk_id)
+                self.chunks.append(item['content'])
+                self.metadata.append(item['metadata'])
+                self.chunk_ids.append(chunk_id)
+            self.vectors = vectors if len(file_ids) else None
+        
+        missing = list(remaining.values())
+        if missing:
+            # 需要整体重写时无需先追加
+            self._append_vectors(missing, [item['id'] for item in missing], persist=not needs_rewrite)
+        
+        if needs_rewrite and self.storage is not None:
+            self.storage.rewrite(self.vectors, self.chunk_ids, self.embedding_model.get_state())
+            self.vectors, _, _ = self.storage.load()
+        
+        directory = self.storage.directory if self.storage is not None else None
+        self.lexical_index = BM25Index.build(self.chunks, self.chunk_ids, directory, self.hybrid_config)
+        self.loaded = True
+        self._refresh_index(rebuild=True)
+    
+    def _refresh_index(self, rebuild: bool = False):
+        """维护检索索引：向量数跨过阈值时切换索引类型，IVF质心过时则重新训练，并持久化到向量文件旁
+        
+        rebuild=True 时从磁盘加载已有的IVF索引（按分块id对齐），没有则重新构建。
+        未完整加载的索引（冷启动时入库创建的、只含新文档分块的索引）不读写这些文件，以免覆盖知识库完整的索引。
+        """
+        directory = self.storage.directory if self.storage is not None and self.loaded else None
+        n = 0 if self.vectors is None else len(self.vectors)
+        expected_kind = select_index_kind(n, self.index_config)
+        stale = (
+            rebuild or self.index.kind != expected_kind
+            or (isinstance(self.index, IVFFlatIndex) and self.index.needs_retrain(self.index_config['retrain_growth']))
+        )
+        if stale:
+            self.index = build_index(self.vectors, self.chunk_ids, directory, self.index_config)
+        elif directory:
+            self.index.save(directory, self.chunk_ids)
+        if directory:
+            self.lexical_index.maybe_save(directory, self.chunk_ids)
+    
+    def remove_document(self, document_id: int) -> int:
+        """从内存索引和向量文件中移除指定文档的分块，返回移除的块数"""
+        keep = [i for i, meta in enumerate(self.metadata) if meta.get('document_id') != document_id]
+        removed_ids = [
+            chunk_id for meta, chunk_id in zip(self.metadata, self.chunk_ids)
+            if meta.get('document_id') == document_id and chunk_id is not None
+        ]
+        removed = len(self.chunks) - len(keep)
+        if removed:
+            self.chunks = [self.chunks[i] for i in keep]
+            self.metadata = [self.metadata[i] for i in keep]
+            self.chunk_ids = [self.chunk_ids[i] for i in keep]
+            self._row_by_chunk_id = None
+            keep_mask = np.zeros(len(self.vectors), dtype=bool) if self.vectors is not None else None
+            if keep_mask is not None:
+                keep_mask[keep] = True
+                self.index.remove(keep_mask)
+                self.lexical_index.remove(keep_mask)
+            self._set_vectors(self.vectors[keep] if self.vectors is not None and keep else None)
+        if removed_ids and self.storage is not None:
+            self.storage.remove_ids(removed_ids)
+        if removed:
+            self._refresh_index()
+        return removed
+    
+    def similarity_search(self, query: str, top_k: int = 5, threshold: float = 0.1) -> List[Dict]:
+        """相似度搜索"""
+        return self.similarity_search_many([query], top_k=top_k, threshold=threshold)[0]
+    
+    def similarity_search_many(self, queries: List[str], top_k: int = 5, threshold: float = 0.1) -> List[List[Dict]]:
+        """批量相似度搜索：精确索引下所有问题在一次矩阵乘法(GEMM)中完成打分，
+        向量较多时由IVF索引只扫描最接近的倒排列表"""
+        if not queries:
+            return []
+        if not self.chunks or self.vectors is None:
+            return [[] for _ in queries]
         
+        query_matrix = normalize_rows(self.embedding_model.encode(queries))
+        rows, scores = self.index.search(self.vectors, query_matrix, top_k)
+        return [
+            self._collect_results(scores[i], rows[i], threshold)
+            for i in range(len(queries))
+        ]
+    
+    def keyword_search(self, query: str, top_k: int = 5) -> List[Dict]:
+        """BM25关键词检索；结果的 score 仍为与问题的余弦相似度，BM25得分记在 bm25_score"""
+        if not self.chunks or self.vectors is None:
+            return []
+        rows, bm25_scores = self.lexical_index.search(query, top_k)
+        if not len(rows):
+            return []
+        query_vector = normalize_rows(self.embedding_model.encode([query]))[0]
+        similarities = np.asarray(self.vectors[rows]) @ query_vector
+        results = self._collect_results(similarities, rows, threshold=float('-inf'))
+        for result, bm25_score in zip(results, bm25_scores):
+            result['bm25_score'] = float(bm25_score)
+        return results
+    
+    def results_for_chunk_ids(self, entries: List[Tuple[int, Dict]]) -> Optional[List[Dict]]:
+        """按 (分块id, 得分字段) 还原检索结果（用于检索缓存），有分块已不在索引中时返回None"""
+        if self._row_by_chunk_id is None:
+            self._row_by_chunk_id = {chunk_id: row for row, chunk_id in enumerate(self.chunk_ids)}
         results = []
-        for idx in top_indices:
-            score = similarities[idx]
-            if score >= threshold:
+        for chunk_id, scores in entries:
+            row = self._row_by_chunk_id.get(chunk_id)
+            if row is None:
+                return None
+            results.append({
+                'content': self.chunks[row],
+                'metadata': self.metadata[row],
+                'index': row,
+                **scores
+            })
+        return results
+    
+    def _set_vectors(self, vectors: Optional[np.ndarray]):
+        """设置向量矩阵，统一保存为按行归一化的连续 float32 矩阵"""
+        if vectors is None or len(vectors) == 0:
+            self.vectors = None
+        else:
+            self.vectors = normalize_rows(vectors)
+    
+    def _collect_results(self, scores: np.ndarray, indices: np.ndarray, threshold: float) -> List[Dict]:
+        """根据候选下标及其得分构建检索结果（下标为-1表示空位）"""
+        results = []
+        for idx, score in zip(indices, scores):
+            score = float(score)
+            if idx >= 0 and score >= threshold:
                 results.append({
                     'content': self.chunks[idx],
-                    'score': float(score),
+                    'score': score,
                     'metadata': self.metadata[idx],
                     'index': int(idx)
                 })
-        
         return results
 
 
+async def _iter_sse_events(lines):
+    """解析SSE响应行，逐个产生 data 字段的JSON对象，遇到 [DONE] 结束"""
+    try:
+        async for line in lines:
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            if data:
+                yield json.loads(data)
+    finally:
+        await lines.aclose()
+
+
 class LLMInterface:
     """大语言模型接口"""
     
@@ -417,6 +763,7 @@ class LLMInterface:
                 'api_key': model_config.api_key,
                 'api_base_url': model_config.api_base_url,
                 'max_tokens': model_config.max_tokens,
+                'context_max_tokens': model_config.context_max_tokens,
                 'temperature': model_config.temperature,
             }
         else:
@@ -425,27 +772,72 @@ class LLMInterface:
         
         self.model_type = self.model_config.get('model_type', 'mock')
         self.model_name = self.model_config.get('model_name', 'mock')
+        # 该模型配置的连接池，跨问题复用连接
+        self.http = LLMHttpClient()
+    
+    def close(self):
+        """关闭连接池（进行中的请求完成后）"""
+        self.http.close()
+    
+    @property
+    def signature(self) -> str:
+        """影响生成结果的模型参数签名（不含密钥），用于回答缓存"""
+        params = {key: value for key, value in self.model_config.items() if key != 'api_key'}
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
     
     async def generate(self, prompt: str, context: str = "") -> str:
-        """生成回答"""
+        """生成回答（调用失败时返回错误提示文本）"""
+        try:
+            return await self.complete(prompt, context)
+        except Exception as e:
+            logger.error(f"API调用失败: {e}")
+            return f"抱歉，调用AI模型时出现错误：{str(e)}"
+    
+    async def complete(self, prompt: str, context: str = "") -> str:
+        """生成回答，调用失败时抛出异常"""
         if self.model_type == 'mock' or self.model_name == 'mock':
-            return f"基于提供的上下文信息：{context[:100]}...\n\n对于问题「{prompt}」，这是一个模拟回答。请配置真实的大语言模型以获得准确回答。"
+            return self._mock_answer(prompt, context)
         
         # 真实API调用
         if self.model_type == 'api':
-            try:
-                return await self._call_real_api(prompt, context)
-            except Exception as e:
-                logger.error(f"API调用失败: {e}")
-                return f"抱歉，调用AI模型时出现错误：{str(e)}"
+            return await self._call_real_api(prompt, context)
         
         return "请配置大语言模型"
     
+    async def stream(self, prompt: str):
+        """流式生成回答，逐段产生文本片段，调用失败时抛出异常"""
+        if self.model_type == 'mock' or self.model_name == 'mock':
+            answer = self._mock_answer(prompt)
+            for start in range(0, len(answer), 8):
+                yield answer[start:start + 8]
+            return
+        
+        if self.model_type != 'api':
+            yield "请配置大语言模型"
+            return
+        
+        api_key = self.model_config.get('api_key')
+        api_base_url = self.model_config.get('api_base_url')
+        model_name = self.model_config.get('model_name')
+        if not api_key:
+            yield "错误：未配置API密钥"
+            return
+        
+        logger.info(f"流式发送给API的提示预览: {prompt[:200]}...")
+        if 'gemini' in model_name.lower() or 'google' in api_base_url.lower():
+            events = self._stream_gemini_api(prompt, api_key, api_base_url)
+        else:
+            events = self._stream_openai_api(prompt, api_key, api_base_url, model_name)
+        async for text in events:
+            if text:
+                yield text
+    
+    @staticmethod
+    def _mock_answer(prompt: str, context: str = "") -> str:
+        return f"基于提供的上下文信息：{context[:100]}...\n\n对于问题「{prompt}」，这是一个模拟回答。请配置真实的大语言模型以获得准确回答。"
+    
     async def _call_real_api(self, prompt: str, context: str = "") -> str:
         """调用真实的API"""
-        import aiohttp
-        import json
-        
         api_key = self.model_config.get('api_key')
         api_base_url = self.model_config.get('api_base_url')
         model_name = self.model_config.get('model_name')
@@ -460,96 +852,84 @@ class LLMInterface:
         # 记录发送给API的提示内容（截取前200字符）
         logger.info(f"发送给API的提示预览: {full_prompt[:200]}...")
         
-        try:
-            # 支持不同的API格式
-            if 'gemini' in model_name.lower() or 'google' in api_base_url.lower():
-                return await self._call_gemini_api(full_prompt, api_key, api_base_url)
-            elif 'openai' in api_base_url.lower():
-                return await self._call_openai_api(full_prompt, api_key, api_base_url, model_name)
-            else:
-                return await self._call_generic_api(full_prompt, api_key, api_base_url, model_name)
-        except Exception as e:
-            logger.error(f"API调用异常: {e}")
-            return f"API调用失败：{str(e)}"
+        # 支持不同的API格式
+        if 'gemini' in model_name.lower() or 'google' in api_base_url.lower():
+            return await self._call_gemini_api(full_prompt, api_key, api_base_url)
+        elif 'openai' in api_base_url.lower():
+            return await self._call_openai_api(full_prompt, api_key, api_base_url, model_name)
+        else:
+            return await self._call_generic_api(full_prompt, api_key, api_base_url, model_name)
     
-    async def _call_gemini_api(self, prompt: str, api_key: str, api_base_url: str) -> str:
-        """调用Gemini API - 使用同步方式确保稳定性"""
-        import requests
-        import json
-        import asyncio
-        
-        # 在线程池中执行同步请求，避免阻塞事件循环
-        def sync_request():
-            # Gemini API URL格式 - 使用v1beta
-            if not api_base_url.endswith('/'):
-                api_base_url_fixed = api_base_url + '/'
-            else:
-                api_base_url_fixed = api_base_url
-            
-            # 使用配置中的模型名称
-            model_name = self.model_config.get('model_name', 'gemini-pro')
-            url = f"{api_base_url_fixed}v1beta/models/{model_name}:generateContent"
-            
-            # 正确的请求头格式 - 使用x-goog-api-key
-            headers = {
-                'Content-Type': 'application/json',
-                'x-goog-api-key': api_key
-            }
-            
-            # 正确的请求体格式
-            data = {
-                "contents": [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ],
-                "generationConfig": {
-                    "temperature": self.model_config.get('temperature', 0.7),
-                    "maxOutputTokens": self.model_config.get('max_tokens', 4096),
+    def _gemini_request(self, prompt: str, api_key: str, api_base_url: str, method: str = 'generateContent'):
+        """Gemini 请求的 URL、请求头和请求体"""
+        # Gemini API URL格式 - 使用v1beta
+        if not api_base_url.endswith('/'):
+            api_base_url = api_base_url + '/'
+        
+        # 使用配置中的模型名称
+        model_name = self.model_config.get('model_name', 'gemini-pro')
+        url = f"{api_base_url}v1beta/models/{model_name}:{method}"
+        
+        # 正确的请求头格式 - 使用x-goog-api-key
+        headers = {
+            'Content-Type': 'application/json',
+            'x-goog-api-key': api_key
+        }
+        
+        # 正确的请求体格式
+        data = {
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [
+                        {
+                            "text": prompt
+                        }
+                    ]
                 }
+            ],
+            "generationConfig": {
+                "temperature": self.model_config.get('temperature', 0.7),
+                "maxOutputTokens": self.model_config.get('max_tokens', 4096),
             }
-            
-            logger.info(f"Gemini API URL: {url}")
-            logger.info(f"Gemini API Headers: {headers}")
-            
-            try:
-                response = requests.post(url, headers=headers, json=data, timeout=30)
-                logger.info(f"Gemini API Response Status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    candidates = result.get('candidates', [])
-                    if candidates and candidates[0].get('content'):
-                        parts = candidates[0]['content'].get('parts', [])
-                        if parts:
-                            answer = parts[0].get('text', '未获得有效回复')
-                            logger.info(f"Gemini API Success: {answer[:100]}...")
-                            return answer
-                    logger.warning("Gemini API响应格式不正确")
-                    return '未获得有效回复'
-                else:
-                    logger.error(f"Gemini API请求失败 ({response.status_code}): {response.text}")
-                    raise Exception(f"API请求失败 ({response.status_code}): {response.text}")
-                    
-            except Exception as e:
-                logger.error(f"Gemini API调用异常: {e}")
-                raise e
+        }
+        return url, headers, data
+    
+    async def _call_gemini_api(self, prompt: str, api_key: str, api_base_url: str) -> str:
+        """调用Gemini API"""
+        url, headers, data = self._gemini_request(prompt, api_key, api_base_url)
+        logger.info(f"Gemini API URL: {url}")
         
-        # 在线程池中执行同步请求
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, sync_request)
-        return result
+        status, text = await self.http.post_json(url, headers, data)
+        logger.info(f"Gemini API Response Status: {status}")
+        
+        if status == 200:
+            result = json.loads(text)
+            candidates = result.get('candidates', [])
+            if candidates and candidates[0].get('content'):
+                parts = candidates[0]['content'].get('parts', [])
+                if parts:
+                    answer = parts[0].get('text', '未获得有效回复')
+                    logger.info(f"Gemini API Success: {answer[:100]}...")
+                    return answer
+            logger.warning("Gemini API响应格式不正确")
+            return '未获得有效回复'
+        else:
+            logger.error(f"Gemini API请求失败 ({status}): {text}")
+            raise Exception(f"API请求失败 ({status}): {text}")
     
-    async def _call_openai_api(self, prompt: str, api_key: str, api_base_url: str, model_name: str) -> str:
-        """调用OpenAI API"""
-        import aiohttp
-        import json
+    async def _stream_gemini_api(self, prompt: str, api_key: str, api_base_url: str):
+        """流式调用Gemini API（streamGenerateContent，SSE格式）"""
+        url, headers, data = self._gemini_request(prompt, api_key, api_base_url, 'streamGenerateContent')
+        logger.info(f"Gemini API URL: {url}")
         
+        async for event in _iter_sse_events(self.http.stream_lines(url + '?alt=sse', headers, data)):
+            for candidate in event.get('candidates', [])[:1]:
+                for part in (candidate.get('content') or {}).get('parts', []):
+                    yield part.get('text', '')
+    
+    def _openai_request(self, prompt: str, api_key: str, api_base_url: str, model_name: str, stream: bool = False):
+        """OpenAI 兼容接口的 URL、请求头和请求体"""
         url = f"{api_base_url}/chat/completions"
         
         headers = {
@@ -565,31 +945,36 @@ class LLMInterface:
             "temperature": self.model_config.get('temperature', 0.7),
             "max_tokens": self.model_config.get('max_tokens', 4096),
         }
+        if stream:
+            data["stream"] = True
+        return url, headers, data
+    
+    async def _call_openai_api(self, prompt: str, api_key: str, api_base_url: str, model_name: str) -> str:
+        """调用OpenAI API"""
+        url, headers, data = self._openai_request(prompt, api_key, api_base_url, model_name)
         
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, headers=headers, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    choices = result.get('choices', [])
-                    if choices:
-                        return choices[0]['message']['content']
-                    return '未获得有效回复'
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"API请求失败 ({response.status}): {error_text}")
+        status, text = await self.http.post_json(url, headers, data)
+        if status == 200:
+            result = json.loads(text)
+            choices = result.get('choices', [])
+            if choices:
+                return choices[0]['message']['content']
+            return '未获得有效回复'
+        else:
+            raise Exception(f"API请求失败 ({status}): {text}")
+    
+    async def _stream_openai_api(self, prompt: str, api_key: str, api_base_url: str, model_name: str):
+        """流式调用OpenAI兼容API（stream=true，SSE格式）"""
+        url, headers, data = self._openai_request(prompt, api_key, api_base_url, model_name, stream=True)
+        
+        async for event in _iter_sse_events(self.http.stream_lines(url, headers, data)):
+            for choice in event.get('choices', [])[:1]:
+                yield (choice.get('delta') or {}).get('content') or ''
     
     async def _call_generic_api(self, prompt: str, api_key: str, api_base_url: str, model_name: str) -> str:
         """调用通用API"""
-        import aiohttp
-        import json
-        
         # 尝试OpenAI格式
-        try:
-            return await self._call_openai_api(prompt, api_key, api_base_url, model_name)
-        except Exception as e:
-            logger.error(f"通用API调用失败: {e}")
-            return f"API调用失败：{str(e)}"
+        return await self._call_openai_api(prompt, api_key, api_base_url, model_name)
     
     async def generate_response(self, prompt: str, context: str = "") -> Dict:
         """生成回答并返回详细信息"""
@@ -602,7 +987,7 @@ class LLMInterface:
         
         try:
             # 注意：这里不传递context，因为prompt已经包含了完整的提示词
-            answer = await self.generate(prompt, "")
+            answer = await self.complete(prompt, "")
             response_time = round((time.time() - start_time), 3)  # 保持为秒，保留3位小数
             
             logger.info(f"LLM 回答生成成功，耗时: {response_time}秒")
@@ -633,444 +1018,473 @@ class RAGSystem:
         self.document_processor = DocumentProcessor()
         self.text_splitter = TextSplitter()
         self.knowledge_bases = {}  # 存储每个知识库的向量存储
+        self.index_versions = {}  # 每个知识库内存索引对应的数据库版本号
+        self.store_generations = {}  # 每个知识库内存索引被整体替换的次数，用于判断增量写入的索引是否仍在使用
         self.llm_configs = {}  # 存储LLM配置
+        self.retrieval_cache = RetrievalCache()
+        self.answer_cache = AnswerCache()
+        self.context_builder = ContextBuilder()
+        self._index_locks = {}
+        self._locks_guard = threading.Lock()
         
     def get_or_create_vector_store(self, kb_id: int) -> VectorStore:
         """获取或创建知识库的向量存储"""
         if kb_id not in self.knowledge_bases:
-            self.knowledge_bases[kb_id] = VectorStore()
+            storage_path = self._resolve_vector_store_path(kb_id)
+            self._install_vector_store(kb_id, VectorStore(storage=MmapVectorStorage(storage_path)))
             # 注意：不在这里自动加载文档，由ask_question方法控制加载时机
         return self.knowledge_bases[kb_id]
     
-    def _load_existing_documents(self, kb_id: int):
-        """从数据库加载已有的文档数据到向量存储"""
-        try:
-            from apps.knowledge.models import DocumentChunk
-            import asyncio
+    def _install_vector_store(self, kb_id: int, vector_store: VectorStore):
+        """设置知识库的内存索引并递增其替换次数"""
+        self.knowledge_bases[kb_id] = vector_store
+        self.store_generations[kb_id] = self.store_generations.get(kb_id, 0) + 1
+    
+    def ensure_index_loaded(self, kb_id: int) -> VectorStore:
+        """确保知识库的内存索引与数据库版本一致
+        
+        仅比较 KnowledgeBase.index_version，版本未变化时直接复用内存索引；
+        文档新增、删除或重新处理后版本号递增，才会触发一次完整重建。
+        """
+        current_version = self._fetch_index_version(kb_id)
+        if kb_id in self.knowledge_bases and self.index_versions.get(kb_id) == current_version:
+            return self.knowledge_bases[kb_id]
+        
+        with self._get_index_lock(kb_id):
+            # 等待锁期间可能已被其他请求加载
+            if kb_id in self.knowledge_bases and self.index_versions.get(kb_id) == current_version:
+                return self.knowledge_bases[kb_id]
             
-            # 检查是否在异步环境中
+            logger.info(f"知识库 {kb_id} 索引版本变化 ({self.index_versions.get(kb_id)} -> {current_version})，重新加载")
             try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 在异步环境中，使用同步方式强制加载
-                    logger.info(f"在异步环境中强制加载知识库 {kb_id} 的数据")
-                    # 创建新的线程来执行同步数据库操作
-                    import threading
-                    import queue
-                    
-                    result_queue = queue.Queue()
-                    
-                    def sync_load():
-                        try:
-                            # 获取知识库中所有已完成的文档块
-                            chunks = DocumentChunk.objects.filter(
-                                document__knowledge_base_id=kb_id,
-                                document__status='completed'
-                            ).select_related('document')
-                            
-                            chunk_data = []
-                            for chunk in chunks:
-                                chunk_data.append({
-                                    'content': chunk.content,
-                                    'metadata': {
-                                        'document_id': chunk.document.id,
-                                        'chunk_index': chunk.chunk_index,
-                                        'source': chunk.document.file_path,
-                                        'type': chunk.document.file_type,
-                                        **chunk.metadata
-                                    }
-                                })
-                            result_queue.put(chunk_data)
-                        except Exception as e:
-                            result_queue.put(e)
-                    
-                    thread = threading.Thread(target=sync_load)
-                    thread.start()
-                    thread.join()
-                    
-                    chunk_data = result_queue.get()
-                    if isinstance(chunk_data, Exception):
-                        raise chunk_data
-                    
-                    vector_store = self.knowledge_bases[kb_id]
-                    for chunk_info in chunk_data:
-                        vector_store.chunks.append(chunk_info['content'])
-                        vector_store.metadata.append(chunk_info['metadata'])
-                    
-                    # 重建向量
-                    if vector_store.chunks:
-                        vector_store._update_vectors()
-                    
-                    logger.info(f"从数据库加载知识库 {kb_id} 的文档数据: {len(vector_store.chunks)} 个块")
-                    return
-                    
-            except RuntimeError:
-                # 没有事件循环，可以进行同步操作
-                pass
-            
-            # 同步环境中的正常加载
-            # 获取知识库中所有已完成的文档块
-            chunks = DocumentChunk.objects.filter(
-                document__knowledge_base_id=kb_id,
-                document__status='completed'
-            ).select_related('document')
-            
-            vector_store = self.knowledge_bases[kb_id]
-            
-            for chunk in chunks:
-                # 添加文档内容和元数据
-                vector_store.chunks.append(chunk.content)
-                vector_store.metadata.append({
+                self.manually_load_documents(kb_id)
+            except Exception:
+                # 重建失败时不记录版本号，下次问答时重试；已有旧索引则暂时继续使用
+                if kb_id not in self.knowledge_bases:
+                    raise
+                logger.warning(f"知识库 {kb_id} 重建失败，暂时使用版本 {self.index_versions.get(kb_id)} 的索引")
+                return self.knowledge_bases[kb_id]
+            self.index_versions[kb_id] = current_version
+        
+        return self.knowledge_bases[kb_id]
+    
+    def commit_index_change(self, kb_id: int, store_generation: Optional[int] = None) -> int:
+        """提交知识库索引变更：递增数据库中的版本号
+        
+        如果本进程的内存索引在变更前已是最新版本（并且已经增量应用了本次变更），
+        则直接跟进到新版本；否则丢弃版本记录，下次问答时重新加载。
+        store_generation 为增量写入时内存索引的替换次数（process_document/copy_document 结果中的
+        store_generation），写入后内存索引被重新加载替换过时，本次变更不在当前索引中，同样丢弃版本记录。
+        """
+        from apps.knowledge.models import KnowledgeBase
+        
+        with self._get_index_lock(kb_id):
+            previous_version = self.index_versions.get(kb_id)
+            new_version = KnowledgeBase.bump_index_version(kb_id)
+            if (previous_version is not None and new_version == previous_version + 1
+                    and store_generation in (None, self.store_generations.get(kb_id))):
+                self.index_versions[kb_id] = new_version
+            else:
+                self.index_versions.pop(kb_id, None)
+        return new_version
+    
+    def invalidate_index(self, kb_id: int):
+        """使本进程中知识库的内存索引失效，下次问答时重新加载"""
+        self.index_versions.pop(kb_id, None)
+    
+    def remove_document(self, kb_id: int, document_id: int) -> int:
+        """从内存索引中移除文档的全部分块"""
+        if kb_id not in self.knowledge_bases:
+            return 0
+        with self._get_index_lock(kb_id):
+            return self.knowledge_bases[kb_id].remove_document(document_id)
+    
+    def drop_knowledge_base(self, kb_id: int):
+        """释放知识库的内存索引"""
+        self.knowledge_bases.pop(kb_id, None)
+        self.store_generations.pop(kb_id, None)
+        self.index_versions.pop(kb_id, None)
+        self.retrieval_cache.clear(kb_id)
+    
+    def _get_index_lock(self, kb_id: int) -> threading.Lock:
+        """获取知识库级别的索引锁"""
+        with self._locks_guard:
+            if kb_id not in self._index_locks:
+                self._index_locks[kb_id] = threading.Lock()
+            return self._index_locks[kb_id]
+    
+    @staticmethod
+    def _fetch_index_version(kb_id: int) -> int:
+        """从数据库读取知识库当前的索引版本"""
+        from apps.knowledge.models import KnowledgeBase
+        
+        return KnowledgeBase.objects.filter(id=kb_id).values_list('index_version', flat=True).first() or 0
+    
+    @staticmethod
+    def _resolve_vector_store_path(kb_id: int) -> str:
+        """获取知识库向量文件目录，未设置时使用默认目录并写回 KnowledgeBase.vector_store_path"""
+        from django.conf import settings
+        from apps.knowledge.models import KnowledgeBase
+        
+        path = KnowledgeBase.objects.filter(id=kb_id).values_list('vector_store_path', flat=True).first()
+        if not path:
+            path = os.path.join(str(settings.MEDIA_ROOT), 'knowledge_bases', str(kb_id), 'vectors')
+            KnowledgeBase.objects.filter(id=kb_id).update(vector_store_path=path)
+        return path
+    
+    @staticmethod
+    def _fetch_completed_chunks(kb_id: int) -> List[Dict]:
+        """从数据库读取知识库中所有已完成文档的分块"""
+        from apps.knowledge.models import DocumentChunk
+        
+        chunks = DocumentChunk.objects.filter(
+            document__knowledge_base_id=kb_id,
+            document__status='completed'
+        ).select_related('document').order_by('id')
+        
+        return [
+            {
+                'id': chunk.id,
+                'content': chunk.content,
+                'metadata': {
                     'document_id': chunk.document.id,
                     'chunk_index': chunk.chunk_index,
                     'source': chunk.document.file_path,
                     'type': chunk.document.file_type,
                     **chunk.metadata
-                })
-            
-            # 重建向量
-            if vector_store.chunks:
-                vector_store._update_vectors()
-                
-            logger.info(f"从数据库加载知识库 {kb_id} 的文档数据: {len(vector_store.chunks)} 个块")
-            
-        except Exception as e:
-            logger.error(f"加载知识库 {kb_id} 的文档数据失败: {e}")
-            import traceback
-            traceback.print_exc()
+                }
+            }
+            for chunk in chunks
+        ]
     
     def manually_load_documents(self, kb_id: int):
-        """手动加载知识库文档数据（同步方法）- 确保每次都能成功加载"""
+        """从数据库完整重建知识库的内存索引（同步方法）
+        
+        新索引构建完成后整体替换旧索引，重建期间的并发检索仍使用旧索引。
+        加载失败时抛出异常，不替换旧索引。
+        
+        Returns:
+            int: 加载的分块数
+        """
         try:
-            from apps.knowledge.models import DocumentChunk, Document
+            logger.info(f"开始加载知识库 {kb_id} 的文档数据")
             
-            logger.info(f"开始强制加载知识库 {kb_id} 的文档数据")
+            chunk_data = self._fetch_completed_chunks(kb_id)
+            storage_path = self._resolve_vector_store_path(kb_id)
             
-            # 首先检查数据库中是否有文档 - 使用线程安全的方式
-            doc_count = 0
-            try:
-                import threading
-                count_holder = [0]
-                exception_holder = [None]
-                
-                def count_docs():
-                    try:
-                        count = Document.objects.filter(
-                            knowledge_base_id=kb_id,
-                            status='completed'
-                        ).count()
-                        count_holder[0] = count
-                    except Exception as e:
-                        exception_holder[0] = e
-                
-                thread = threading.Thread(target=count_docs)
-                thread.start()
-                thread.join()
-                
-                if exception_holder[0]:
-                    raise exception_holder[0]
-                    
-                doc_count = count_holder[0]
-                
-            except Exception as e:
-                logger.error(f"查询文档数量失败: {e}")
-                return 0
-            
-            logger.info(f"数据库中知识库 {kb_id} 有 {doc_count} 个已完成文档")
-            
-            if doc_count == 0:
+            vector_store = VectorStore(storage=MmapVectorStorage(storage_path))
+            vector_store.load_chunks(chunk_data)
+            if not vector_store.chunks:
                 logger.info(f"知识库 {kb_id} 中没有已完成的文档")
-                return 0
-            
-            # 确保向量存储已初始化
-            if kb_id not in self.knowledge_bases:
-                self.knowledge_bases[kb_id] = VectorStore()
-                logger.info(f"为知识库 {kb_id} 创建新的向量存储")
-            
-            vector_store = self.knowledge_bases[kb_id]
-            
-            # 强制清空现有数据，重新加载以确保数据同步
-            vector_store.chunks.clear()
-            vector_store.metadata.clear()
-            logger.info(f"清空知识库 {kb_id} 的现有向量数据")
             
-            # 获取知识库中所有已完成的文档块 - 简化查询并包装为线程安全
-            try:
-                # 在新线程中执行数据库查询以避免异步上下文问题
-                import threading
-                chunks_list = []
-                exception_holder = [None]
-                
-                def fetch_chunks():
-                    try:
-                        chunks = DocumentChunk.objects.filter(
-                            document__knowledge_base_id=kb_id,
-                            document__status='completed'
-                        ).select_related('document').order_by('id')
-                        chunks_list.extend(list(chunks))
-                    except Exception as e:
-                        exception_holder[0] = e
-                
-                thread = threading.Thread(target=fetch_chunks)
-                thread.start()
-                thread.join()
-                
-                if exception_holder[0]:
-                    raise exception_holder[0]
-                    
-                chunks = chunks_list
-                
-            except Exception as e:
-                logger.error(f"数据库查询失败: {e}")
-                return 0
-            
-            chunk_count = 0
-            for chunk in chunks:
-                try:
-                    # 添加文档内容和元数据
-                    vector_store.chunks.append(chunk.content)
-                    vector_store.metadata.append({
-                        'document_id': chunk.document.id,
-                        'chunk_index': chunk.chunk_index,
-                        'source': chunk.document.file_path,
-                        'type': chunk.document.file_type,
-                        **chunk.metadata
-                    })
-                    chunk_count += 1
-                    
-                    # 每处理10个chunk记录一次日志
-                    if chunk_count % 10 == 0:
-                        logger.info(f"已处理 {chunk_count} 个文档块")
-                        
-                except Exception as e:
-                    logger.error(f"处理文档块 {chunk.id} 时出错: {e}")
-                    continue
-            
-            logger.info(f"总共处理了 {chunk_count} 个文档块")
-            
-            # 验证数据加载
-            if vector_store.chunks:
-                logger.info(f"向量存储中现在有 {len(vector_store.chunks)} 个块")
-                logger.info(f"第一个块内容预览: {vector_store.chunks[0][:100]}...")
-                
-                # 重建向量
-                try:
-                    vector_store._update_vectors()
-                    logger.info(f"知识库 {kb_id} 成功重建向量索引")
-                except Exception as e:
-                    logger.error(f"重建向量索引失败: {e}")
-            else:
-                logger.error(f"知识库 {kb_id} 加载后仍然没有任何数据块！")
-            
-            logger.info(f"成功强制加载知识库 {kb_id} 的文档数据: {chunk_count} 个块")
-            return chunk_count
+            self._install_vector_store(kb_id, vector_store)
+            logger.info(f"成功加载知识库 {kb_id} 的文档数据: {len(vector_store.chunks)} 个块")
+            return len(vector_store.chunks)
             
         except Exception as e:
-            logger.error(f"强制加载知识库 {kb_id} 的文档数据失败: {e}")
+            logger.error(f"加载知识库 {kb_id} 的文档数据失败: {e}")
             import traceback
             traceback.print_exc()
-            return 0
+            raise
 
     def configure_llm(self, config_id: int, model_config: Dict):
-        """配置大语言模型"""
-        self.llm_configs[config_id] = LLMInterface(model_config)
+        """配置大语言模型，参数未变化时沿用已有接口及其连接池"""
+        llm = LLMInterface(model_config)
+        current = self.llm_configs.get(config_id)
+        if current is not None and current.model_config == llm.model_config:
+            return
+        self.llm_configs[config_id] = llm
+        if current is not None:
+            current.close()
+
+    def llm_stats(self) -> Dict:
+        """各模型配置的大模型请求指标（请求数、合并数、排队深度和等待时间）"""
+        return {config_id: llm.http.stats() for config_id, llm in list(self.llm_configs.items())}
     
-    def process_document(self, kb_id: int, file_path: str, document_id: Optional[int] = None) -> Dict:
-        """处理文档"""
+    def process_document(self, kb_id: int, file_path: str, document_id: Optional[int] = None,
+                         progress=None) -> Dict:
+        """处理文档
+        
+        progress 为可选的进度回调 progress(stage=None, **counts)，由入库队列用于记录处理进度。
+        文本按块流式解析、分块，每攒够一批分块就编码写入索引，解析未完成时即可开始编码；
+        多个文档可以并行解析和分块，写入索引时持有知识库锁。
+        """
+        from django.conf import settings
+        
+        progress = progress or (lambda stage=None, **counts: None)
+        index_touched = False
         try:
             # 处理文档
-            content, metadata = self.document_processor.process_file(file_path)
+            progress('parsing')
+            blocks, metadata = self.document_processor.iter_blocks_parallel(file_path, progress)
             
             # 为每个块添加document_id到元数据中
             if document_id:
                 metadata['document_id'] = document_id
             
-            # 分块
-            chunks = self.text_splitter.split_text(content, metadata)
+            content_length = 0
             
-            # 获取向量存储并添加文档
-            vector_store = self.get_or_create_vector_store(kb_id)
-            vector_store.add_documents(chunks)
+            def counted_blocks():
+                nonlocal content_length
+                for block in blocks:
+                    content_length += len(block)
+                    yield block
+            
+            # 分块，按批增量添加到向量存储
+            with self._get_index_lock(kb_id):
+                vector_store = self.get_or_create_vector_store(kb_id)
+                store_generation = self.store_generations[kb_id]
+            batch_size = getattr(settings, 'KNOWLEDGE_CHUNK_BATCH_SIZE', 500)
+            chunk_stream = self.text_splitter.split_stream(counted_blocks(), metadata)
+            chunk_count = 0
+            stored_count = 0
+            while True:
+                chunks = list(itertools.islice(chunk_stream, batch_size))
+                if not chunks:
+                    break
+                with self._get_index_lock(kb_id):
+                    progress('embedding', chunks_embedded=chunk_count)
+                    index_touched = True
+                    stored_count += vector_store.add_documents(
+                        chunks,
+                        lambda chunks_embedded, chunks_total, base=chunk_count: progress(
+                            chunks_embedded=base + chunks_embedded
+                        )
+                    )
+                chunk_count += len(chunks)
+            progress(chunks_total=chunk_count)
+            metadata['size'] = content_length
             
             return {
                 'success': True,
-                'chunk_count': len(chunks),
-                'content_length': len(content),
-                'metadata': metadata
+                'chunk_count': stored_count,
+                'content_length': content_length,
+                'metadata': metadata,
+                'store_generation': store_generation
             }
             
         except Exception as e:
             logger.error(f"处理文档失败: {e}")
+            # 内存索引可能已部分写入，下次问答时重新加载
+            if index_touched:
+                self.invalidate_index(kb_id)
             return {
                 'success': False,
                 'error': str(e),
                 'chunk_count': 0
             }
     
-    async def ask_question(self, kb_id: int, question: str, config_id: Optional[int] = None, 
-                          top_k: int = 5, threshold: float = 0.5) -> Dict:
-        """智能问答"""
-        import time
-        start_time = time.time()
+    def copy_document(self, kb_id: int, document_id: int, source_document_id: int, progress=None) -> Dict:
+        """从文件内容相同（content_hash 一致）的已处理文档复制分块，跳过解析和编码
+        
+        源知识库向量文件中的向量与当前嵌入模型一致时直接复用，否则重新编码分块文本。
+        """
+        from apps.knowledge.models import Document, DocumentChunk
         
+        progress = progress or (lambda stage=None, **counts: None)
+        index_touched = False
         try:
-            # 获取向量存储
-            vector_store = self.get_or_create_vector_store(kb_id)
-            
-            # 每次问答都重新检查并加载文档，确保文档数据是最新的
-            logger.info(f"知识库 {kb_id} 开始检查文档状态")
-            
-            # 强制重新加载文档数据以确保数据完整性
-            loaded_count = self.manually_load_documents(kb_id)
-            logger.info(f"知识库 {kb_id} 重新加载了 {loaded_count} 个文档块")
-            
-            # 重新获取向量存储（确保获取最新数据）
-            vector_store = self.get_or_create_vector_store(kb_id)
+            progress('copying')
+            source = Document.objects.get(id=source_document_id)
+            file_path = Document.objects.values_list('file_path', flat=True).get(id=document_id)
+            rows = list(
+                DocumentChunk.objects.filter(document_id=source_document_id)
+                .order_by('chunk_index').values_list('id', 'content', 'metadata')
+            )
+            chunks = [
+                {'content': content, 'metadata': {**metadata, 'source': file_path, 'document_id': document_id}}
+                for _, content, metadata in rows
+            ]
             
-            # 检索相关文档 - 使用更低的阈值确保能检索到文档
-            relevant_docs = vector_store.similarity_search(question, top_k=top_k, threshold=max(threshold, 0.1))
+            with self._get_index_lock(kb_id):
+                vector_store = self.get_or_create_vector_store(kb_id)
+                store_generation = self.store_generations[kb_id]
+            vectors, meta = MmapVectorStorage(
+                self._resolve_vector_store_path(source.knowledge_base_id)
+            ).read_vectors([chunk_id for chunk_id, _, _ in rows])
+            if vectors is not None and (meta or {}).get('embedding') != vector_store.embedding_model.get_state():
+                vectors = None
             
-            logger.info(f"检索到 {len(relevant_docs)} 个相关文档片段，阈值: {max(threshold, 0.1)}")
+            with self._get_index_lock(kb_id):
+                index_touched = True
+                stored_count = vector_store.add_documents(chunks, vectors=vectors) if chunks else 0
             
-            # 如果没有检索到文档，尝试降低阈值再次检索
-            if not relevant_docs and threshold > 0.0:
-                logger.info("未找到相关文档，尝试降低阈值重新检索")
-                relevant_docs = vector_store.similarity_search(question, top_k=top_k, threshold=0.0)
-                logger.info(f"降低阈值后检索到 {len(relevant_docs)} 个文档片段")
-            
-            # 构建上下文 - 强制使用知识库内容，确保总是有内容
-            context = ""
-            context_info = ""
+            return {
+                'success': True,
+                'chunk_count': stored_count,
+                'content_length': (source.metadata or {}).get('size', 0),
+                'metadata': {**(source.metadata or {}), 'source': file_path, 'document_id': document_id},
+                'store_generation': store_generation
+            }
             
-            # 首先尝试使用检索到的相关文档
-            if relevant_docs:
-                context = "\n".join([doc['content'] for doc in relevant_docs])
-                context_info = f"基于知识库中的 {len(relevant_docs)} 个相关文档片段："
-                logger.info(f"使用相关文档构建上下文，长度: {len(context)} 字符")
+        except Exception as e:
+            logger.error(f"复制文档分块失败: {e}")
+            if index_touched:
+                self.invalidate_index(kb_id)
+            return {
+                'success': False,
+                'error': str(e),
+                'chunk_count': 0
+            }
+    
+    @staticmethod
+    def _hybrid_search(vector_store: VectorStore, question: str, top_k: int, threshold: float) -> List[Dict]:
+        """向量检索（受阈值约束）与BM25关键词检索按倒数排名融合；关闭混合检索时只用向量检索"""
+        config = vector_store.hybrid_config
+        if not config['enabled']:
+            return vector_store.similarity_search(question, top_k=top_k, threshold=threshold)
+        candidates = max(top_k, config['candidates'])
+        vector_docs = vector_store.similarity_search(question, top_k=candidates, threshold=threshold)
+        keyword_docs = vector_store.keyword_search(question, top_k=candidates)
+        return reciprocal_rank_fusion([vector_docs, keyword_docs], top_k, k=config['rrf_k'])
+    
+    def _retrieve(self, kb_id: int, vector_store: VectorStore, question: str, top_k: int,
+                  threshold: float) -> List[Dict]:
+        """检索相关文档，结果按 (知识库, 索引版本, top_k, 阈值, 规范化问题) 缓存
+        
+        未找到结果时降低阈值重新检索；重复的问题直接由缓存的分块id还原结果。
+        """
+        key = self.retrieval_cache.make_key(kb_id, self.index_versions.get(kb_id), top_k, threshold, question)
+        cached = self.retrieval_cache.get(key)
+        if cached is not None:
+            relevant_docs = vector_store.results_for_chunk_ids(cached)
+            if relevant_docs is not None:
+                logger.info(f"检索缓存命中，{len(relevant_docs)} 个文档片段")
+                return relevant_docs
+            self.retrieval_cache.record_miss()
+        
+        # 检索相关文档 - 使用更低的阈值确保能检索到文档
+        relevant_docs = self._hybrid_search(vector_store, question, top_k, max(threshold, 0.1))
+        
+        logger.info(f"检索到 {len(relevant_docs)} 个相关文档片段，阈值: {max(threshold, 0.1)}")
+        
+        # 如果没有检索到文档，尝试降低阈值再次检索
+        if not relevant_docs and threshold > 0.0:
+            logger.info("未找到相关文档，尝试降低阈值重新检索")
+            relevant_docs = self._hybrid_search(vector_store, question, top_k, 0.0)
+            logger.info(f"降低阈值后检索到 {len(relevant_docs)} 个文档片段")
+        
+        chunk_ids = [vector_store.chunk_ids[doc['index']] for doc in relevant_docs]
+        if None not in chunk_ids:
+            self.retrieval_cache.put(key, [
+                (chunk_id, {name: value for name, value in doc.items() if name not in ('content', 'metadata', 'index')})
+                for chunk_id, doc in zip(chunk_ids, relevant_docs)
+            ])
+        return relevant_docs
+    
+    def _prepare_answer(self, kb_id: int, question: str, config_id: Optional[int],
+                        top_k: int, threshold: float) -> Dict:
+        """检索、构建提示词并查询回答缓存（ask_question 与 ask_question_stream 共用）
+        
+        同步方法，访问数据库，异步调用方通过 run_db 在数据库线程池中执行。返回 relevant_docs、source_docs（内容装入提示词的片段，
+        未配置大模型时为全部 relevant_docs）、llm（未配置时为None）、prompt、context_chunk_ids、question_vector
+        及 cached（命中的缓存回答或None）。
+        """
+        # 获取向量存储，仅在知识库索引版本变化时重新加载
+        vector_store = self.ensure_index_loaded(kb_id)
+        logger.info(f"知识库 {kb_id} 索引版本 {self.index_versions.get(kb_id)}，共 {len(vector_store.chunks)} 个文档块")
+        
+        relevant_docs = self._retrieve(kb_id, vector_store, question, top_k, threshold)
+        
+        # 选取上下文片段 - 强制使用知识库内容，确保总是有内容
+        context_info = ""
+        
+        # 首先尝试使用检索到的相关文档
+        if relevant_docs:
+            context_info = f"基于知识库中的 {len(relevant_docs)} 个相关文档片段："
+        
+        # 如果没有相关文档但有知识库内容，强制使用前几个块
+        elif vector_store.chunks:
+            logger.info("没有找到相关文档，强制使用知识库前几个文档块")
+            context_info = f"基于知识库中的前 {min(10, len(vector_store.chunks))} 个文档片段："
             
-            # 如果没有相关文档但有知识库内容，强制使用前几个块
-            if not context and vector_store.chunks:
-                logger.info("没有找到相关文档，强制使用知识库前几个文档块")
-                context = "\n".join(vector_store.chunks[:min(10, len(vector_store.chunks))])
-                context_info = f"基于知识库中的前 {min(10, len(vector_store.chunks))} 个文档片段："
-                logger.info(f"强制构建的上下文长度: {len(context)} 字符")
+            # 将前几个块当作relevant_docs处理，保证后续逻辑正确
+            relevant_docs = []
+            for i, chunk in enumerate(vector_store.chunks[:min(10, len(vector_store.chunks))]):
+                relevant_docs.append({
+                    'content': chunk,
+                    'score': 0.1,  # 给一个默认分数
+                    'metadata': vector_store.metadata[i] if i < len(vector_store.metadata) else {},
+                    'index': i
+                })
+        
+        # 最后的保险：如果仍然没有片段，检查是否真的没有数据
+        if not relevant_docs:
+            # 再次尝试直接从数据库获取一些内容
+            try:
+                from apps.knowledge.models import DocumentChunk
+                
+                db_chunks_data = list(DocumentChunk.objects.filter(
+                    document__knowledge_base_id=kb_id,
+                    document__status='completed'
+                ).select_related('document')[:5])
+                db_content = [chunk.content for chunk in db_chunks_data]
                 
-                # 同时将前几个块当作relevant_docs处理，保证后续逻辑正确
-                relevant_docs = []
-                for i, chunk in enumerate(vector_store.chunks[:min(10, len(vector_store.chunks))]):
-                    relevant_docs.append({
-                        'content': chunk,
-                        'score': 0.1,  # 给一个默认分数
-                        'metadata': vector_store.metadata[i] if i < len(vector_store.metadata) else {},
-                        'index': i
-                    })
+                if db_content:
+                    logger.warning("向量存储为空但数据库有数据，直接从数据库获取")
+                    context_info = f"直接从数据库获取的 {len(db_content)} 个文档片段："
+                    
+                    # 构造相应的relevant_docs
+                    relevant_docs = []
+                    for i, chunk in enumerate(db_chunks_data):
+                        relevant_docs.append({
+                            'content': chunk.content,
+                            'score': 0.05,  # 更低的分数表示这是直接获取的
+                            'metadata': {'document_id': chunk.document.id, 'chunk_index': chunk.chunk_index},
+                            'index': i
+                        })
+                else:
+                    context_info = "知识库中没有找到任何文档"
+                    logger.error(f"知识库 {kb_id} 数据库中也没有任何文档内容")
+            except Exception as e:
+                logger.error(f"从数据库获取备用内容失败: {e}")
+                context_info = "知识库读取失败"
+        
+        logger.info(f"上下文片段: {len(relevant_docs)} 个, 信息={context_info}")
+        
+        # 生成回答 - 确保总是将知识库内容传递给大模型
+        context = ""
+        context_docs = []
+        enhanced_question = None
+        context_chunk_ids = None
+        question_vector = None
+        cached = None
+        llm = self.llm_configs.get(config_id) if config_id else None
+        if llm:
+            logger.info(f"使用LLM配置ID: {config_id}")
+            # 合并重叠分块、去重后按模型配置的上下文预算装入
+            packed = self.context_builder.build(relevant_docs, llm.model_config.get('context_max_tokens'))
+            context, context_docs = packed['context'], packed['docs']
+            logger.info(
+                f"构建上下文: {packed['tokens']} 词元, {len(context)} 字符, 使用 {len(context_docs)}/{len(relevant_docs)} 个片段"
+                + ("（超出预算已截断）" if packed['truncated'] else "")
+            )
             
-            # 最后的保险：如果仍然没有context，检查是否真的没有数据
+            # 最后的强制保险：如果context仍然为空，直接从数据库强制获取
             if not context:
-                # 再次尝试直接从数据库获取一些内容
+                logger.error("严重警告: context为空，执行最终兜底操作")
                 try:
                     from apps.knowledge.models import DocumentChunk
-                    import threading
-                    
-                    db_content = []
-                    db_chunks_data = []
-                    exception_holder = [None]
                     
-                    def fetch_db_chunks():
-                        try:
-                            db_chunks = DocumentChunk.objects.filter(
-                                document__knowledge_base_id=kb_id,
-                                document__status='completed'
-                            ).select_related('document')[:5]
-                            
-                            for chunk in db_chunks:
-                                db_content.append(chunk.content)
-                                db_chunks_data.append(chunk)
-                        except Exception as e:
-                            exception_holder[0] = e
+                    emergency_content = list(DocumentChunk.objects.filter(
+                        document__knowledge_base_id=kb_id,
+                        document__status='completed'
+                    ).values_list('content', flat=True)[:3])
                     
-                    thread = threading.Thread(target=fetch_db_chunks)
-                    thread.start()
-                    thread.join()
-                    
-                    if exception_holder[0]:
-                        raise exception_holder[0]
-                    
-                    if db_content:
-                        logger.warning("向量存储为空但数据库有数据，直接从数据库获取")
-                        context = "\n".join(db_content)
-                        context_info = f"直接从数据库获取的 {len(db_content)} 个文档片段："
-                        logger.info(f"从数据库直接获取的上下文长度: {len(context)} 字符")
-                        
-                        # 构造相应的relevant_docs
-                        relevant_docs = []
-                        for i, chunk in enumerate(db_chunks_data):
-                            relevant_docs.append({
-                                'content': chunk.content,
-                                'score': 0.05,  # 更低的分数表示这是直接获取的
-                                'metadata': {'document_id': chunk.document.id, 'chunk_index': chunk.chunk_index},
-                                'index': i
-                            })
-                    else:
-                        context = ""
-                        context_info = "知识库中没有找到任何文档"
-                        logger.error(f"知识库 {kb_id} 数据库中也没有任何文档内容")
-                except Exception as e:
-                    logger.error(f"从数据库获取备用内容失败: {e}")
-                    context = ""
-                    context_info = "知识库读取失败"
+                    if emergency_content:
+                        context = self.context_builder.build(
+                            [{'content': content, 'score': 0.0, 'metadata': {}} for content in emergency_content],
+                            llm.model_config.get('context_max_tokens')
+                        )['context']
+                        logger.error(f"紧急兜底: 从数据库获取到 {len(emergency_content)} 个块")
+                except Exception as emergency_e:
+                    logger.error(f"紧急兜底也失败: {emergency_e}")
             
-            # 记录最终的context状态
-            logger.info(f"最终context状态: 长度={len(context)}, 信息={context_info}")
+            # 现在context应该总是有内容（除非知识库真的为空）
             if context:
-                logger.info(f"Context前200字符: {context[:200]}...")
-            
-            # 生成回答 - 确保总是将知识库内容传递给大模型
-            llm = self.llm_configs.get(config_id) if config_id else None
-            if llm:
-                logger.info(f"使用LLM配置ID: {config_id}")
-                logger.info(f"检查上下文状态: context长度={len(context) if context else 0}, vector_store.chunks数量={len(vector_store.chunks)}, relevant_docs数量={len(relevant_docs)}")
-                
-                # 最后的强制保险：如果context仍然为空，直接从数据库强制获取
-                if not context:
-                    logger.error("严重警告: context为空，执行最终兜底操作")
-                    try:
-                        from apps.knowledge.models import DocumentChunk
-                        import threading
-                        
-                        emergency_content = []
-                        exception_holder = [None]
-                        
-                        def fetch_emergency_chunks():
-                            try:
-                                emergency_chunks = DocumentChunk.objects.filter(
-                                    document__knowledge_base_id=kb_id,
-                                    document__status='completed'
-                                )[:3]
-                                
-                                for chunk in emergency_chunks:
-                                    emergency_content.append(chunk.content)
-                            except Exception as e:
-                                exception_holder[0] = e
-                        
-                        thread = threading.Thread(target=fetch_emergency_chunks)
-                        thread.start()
-                        thread.join()
-                        
-                        if exception_holder[0]:
-                            raise exception_holder[0]
-                        
-                        if emergency_content:
-                            context = "\n".join(emergency_content)
-                            logger.error(f"紧急兜底: 从数据库获取到 {len(emergency_content)} 个块")
-                    except Exception as emergency_e:
-                        logger.error(f"紧急兜底也失败: {emergency_e}")
-                
-                # 现在context应该总是有内容（除非知识库真的为空）
-                if context:
-                    logger.info(f"使用有内容的context构建提示词，context前100字符: {context[:100]}")
-                    # 构建极其明确的提示，强制大模型按格式回答
-                    enhanced_question = f"""【严格指令 - 必须遵守】你是专业知识库助手，必须严格按照以下格式回答，不得违反：
+                logger.info(f"使用有内容的context构建提示词，context前100字符: {context[:100]}")
+                # 构建极其明确的提示，强制大模型按格式回答
+                enhanced_question = f"""【严格指令 - 必须遵守】你是专业知识库助手，必须严格按照以下格式回答，不得违反：
 
 🔴 强制要求：
 1. 第一句话必须是："基于知识库内容，我为您回答："
@@ -1089,10 +1503,10 @@ class RAGSystem:
 ⚠️ 重要提醒：无论如何都必须以"基于知识库内容，我为您回答："开头，这是不可违反的规则！
 
 现在请严格按照格式开始回答："""
-                else:
-                    # 这种情况现在应该极少发生
-                    logger.error("即使经过所有兜底措施，context仍然为空！这不应该发生。")
-                    enhanced_question = f"""【严格指令】知识库助手必须回答：
+            else:
+                # 这种情况现在应该极少发生
+                logger.error("即使经过所有兜底措施，context仍然为空！这不应该发生。")
+                enhanced_question = f"""【严格指令】知识库助手必须回答：
 
 第一句话必须是："基于知识库内容，我为您回答："
 然后说明："当前知识库系统出现问题，无法读取文档内容。"
@@ -1100,62 +1514,195 @@ class RAGSystem:
 用户问题：{question}
 
 请严格按照上述格式回答。"""
-                
-                logger.info(f"发送给大模型的完整提示长度: {len(enhanced_question)} 字符")
-                logger.info(f"上下文内容预览: {context[:300]}..." if context else "上下文为空")
-                
+            
+            logger.info(f"发送给大模型的完整提示长度: {len(enhanced_question)} 字符")
+            logger.info(f"上下文内容预览: {context[:300]}..." if context else "上下文为空")
+            
+            # 上下文来自内存索引时，按上下文分块集合查找可复用的回答
+            if context and context_docs and all(
+                doc.get('index', -1) < len(vector_store.chunks) and vector_store.chunks[doc['index']] == doc['content']
+                for doc in context_docs
+            ):
+                context_chunk_ids = [vector_store.chunk_ids[doc['index']] for doc in context_docs]
+                if None in context_chunk_ids:
+                    context_chunk_ids = None
+            if context_chunk_ids is not None and self.answer_cache.enabled:
+                if self.answer_cache.semantic:
+                    question_vector = normalize_rows(vector_store.embedding_model.encode([normalize_question(question)]))[0]
+                try:
+                    cached = self.answer_cache.lookup(
+                        config_id, llm.signature, enhanced_question, context_chunk_ids, question_vector
+                    )
+                except Exception as e:
+                    logger.warning(f"查询回答缓存失败: {e}")
+        else:
+            logger.warning(f"没有找到LLM配置，配置ID: {config_id}")
+        
+        return {
+            'relevant_docs': relevant_docs,
+            'source_docs': context_docs if llm else relevant_docs,
+            'llm': llm,
+            'prompt': enhanced_question,
+            'context_chunk_ids': context_chunk_ids,
+            'question_vector': question_vector,
+            'cached': cached,
+        }
+    
+    async def ask_question(self, kb_id: int, question: str, config_id: Optional[int] = None,
+                          top_k: int = 5, threshold: float = 0.5) -> Dict:
+        """智能问答"""
+        import time
+        start_time = time.time()
+        
+        try:
+            plan = await run_db(self._prepare_answer, kb_id, question, config_id, top_k, threshold)
+            relevant_docs, llm, cached = plan['relevant_docs'], plan['llm'], plan['cached']
+            cache_hit = False
+            
+            if llm and cached:
+                logger.info(f"回答缓存命中（{cached['match']}，相似度 {cached['similarity']:.3f}）")
+                answer = cached['answer']
+                model_used = cached['model_used']
+                cache_hit = True
+            elif llm:
                 # 使用构建好的完整提示词
-                llm_result = await llm.generate_response(enhanced_question, "")
+                llm_result = await llm.generate_response(plan['prompt'], "")
                 answer = llm_result.get('answer', '生成回答失败')
                 model_used = llm_result.get('model_used', f"config_{config_id}" if config_id else "default")
-            else:
-                logger.warning(f"没有找到LLM配置，配置ID: {config_id}")
+                if llm_result.get('success'):
+                    await self._store_answer(plan, kb_id, config_id, question, answer, model_used)
+            elif not relevant_docs:
                 # 如果没有配置LLM，才返回"未找到相关信息"的提示
-                if not relevant_docs:
-                    response_time = round((time.time() - start_time), 3)
-                    return {
-                        'answer': '抱歉，我在知识库中没有找到相关信息，且未配置大语言模型。请配置模型以获得智能回答。',
-                        'sources': [],
-                        'confidence': 0.0,
-                        'retrieved_chunks': [],
-                        'model_used': f"config_{config_id}" if config_id else "default",
-                        'response_time': response_time
-                    }
-                else:
-                    answer = f"基于知识库内容，找到了 {len(relevant_docs)} 个相关片段，但未配置大语言模型。请配置模型以获得智能回答。"
-                    model_used = f"config_{config_id}" if config_id else "default"
+                response_time = round((time.time() - start_time), 3)
+                return {
+                    'answer': '抱歉，我在知识库中没有找到相关信息，且未配置大语言模型。请配置模型以获得智能回答。',
+                    'sources': [],
+                    'confidence': 0.0,
+                    'retrieved_chunks': [],
+                    'model_used': f"config_{config_id}" if config_id else "default",
+                    'response_time': response_time
+                }
+            else:
+                answer = f"基于知识库内容，找到了 {len(relevant_docs)} 个相关片段，但未配置大语言模型。请配置模型以获得智能回答。"
+                model_used = f"config_{config_id}" if config_id else "default"
             
             response_time = round((time.time() - start_time), 3)  # 保持为秒，保留3位小数
             
-            logger.info(f"问答完成: 回答长度={len(answer)}, 源文档数={len(relevant_docs)}, 使用模型={model_used}, 响应时间={response_time}秒")
-            
-            return {
-                'answer': answer,
-                'sources': [
-                    {
-                        'content': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
-                        'score': doc['score'],
-                        'metadata': doc['metadata']
-                    }
-                    for doc in relevant_docs
-                ],
-                'confidence': relevant_docs[0]['score'] if relevant_docs else 0.0,
-                'retrieved_chunks': relevant_docs,
-                'model_used': model_used,
-                'response_time': response_time
-            }
+            logger.info(f"问答完成: 回答长度={len(answer)}, 源文档数={len(plan['source_docs'])}, 使用模型={model_used}, 响应时间={response_time}秒")
             
+            return self._answer_result(answer, plan['source_docs'], relevant_docs, model_used, response_time, cache_hit)
+        
         except Exception as e:
             logger.error(f"问答失败: {e}")
             response_time = round((time.time() - start_time), 3)  # 保持为秒，保留3位小数
-            return {
-                'answer': f'查询过程中出现错误: {str(e)}',
-                'sources': [],
-                'confidence': 0.0,
-                'retrieved_chunks': [],
-                'model_used': "error",
-                'response_time': response_time
+            return self._error_result(e, response_time)
+    
+    async def ask_question_stream(self, kb_id: int, question: str, config_id: Optional[int] = None,
+                                  top_k: int = 5, threshold: float = 0.5):
+        """流式智能问答，依次产生 (事件, 数据)：
+            
+            ('sources', {'sources', 'confidence'})   检索完成后立即产生，只含装入提示词的片段
+            ('token', 文本片段)                       回答片段，大模型流式返回时逐段产生
+            ('done', 结果字典)                        与 ask_question 的返回值相同
+        """
+        import time
+        start_time = time.time()
+        
+        try:
+            plan = await run_db(self._prepare_answer, kb_id, question, config_id, top_k, threshold)
+        except Exception as e:
+            logger.error(f"问答失败: {e}")
+            yield 'done', self._error_result(e, round((time.time() - start_time), 3))
+            return
+        
+        relevant_docs, llm, cached = plan['relevant_docs'], plan['llm'], plan['cached']
+        yield 'sources', {
+            'sources': self._format_sources(plan['source_docs']),
+            'confidence': self._confidence(plan['source_docs']),
+        }
+        
+        cache_hit = False
+        model_used = f"config_{config_id}" if config_id else "default"
+        if llm and cached:
+            logger.info(f"回答缓存命中（{cached['match']}，相似度 {cached['similarity']:.3f}）")
+            answer, model_used, cache_hit = cached['answer'], cached['model_used'], True
+            yield 'token', answer
+        elif llm:
+            parts = []
+            model_used = llm.model_name
+            try:
+                async for text in llm.stream(plan['prompt']):
+                    parts.append(text)
+                    yield 'token', text
+                answer = ''.join(parts)
+                await self._store_answer(plan, kb_id, config_id, question, answer, model_used)
+            except Exception as e:
+                logger.error(f"LLM 流式生成失败: {e}")
+                error_text = ('\n\n' if parts else '') + f"生成回答时出错: {str(e)}"
+                answer = ''.join(parts) + error_text
+                yield 'token', error_text
+        elif relevant_docs:
+            answer = f"基于知识库内容，找到了 {len(relevant_docs)} 个相关片段，但未配置大语言模型。请配置模型以获得智能回答。"
+            yield 'token', answer
+        else:
+            answer = '抱歉，我在知识库中没有找到相关信息，且未配置大语言模型。请配置模型以获得智能回答。'
+            yield 'token', answer
+        
+        response_time = round((time.time() - start_time), 3)
+        logger.info(f"流式问答完成: 回答长度={len(answer)}, 源文档数={len(plan['source_docs'])}, 使用模型={model_used}, 响应时间={response_time}秒")
+        yield 'done', self._answer_result(answer, plan['source_docs'], relevant_docs, model_used, response_time, cache_hit)
+    
+    async def _store_answer(self, plan: Dict, kb_id: int, config_id: Optional[int], question: str,
+                            answer: str, model_used: str):
+        """把大模型成功生成的回答写入回答缓存（仅上下文来自内存索引时）"""
+        if plan['context_chunk_ids'] is None or not self.answer_cache.enabled:
+            return
+        try:
+            await run_db(
+                self.answer_cache.store, config_id, kb_id, plan['llm'].signature, plan['prompt'],
+                plan['context_chunk_ids'], question, answer, model_used, plan['question_vector']
+            )
+        except Exception as e:
+            logger.warning(f"写入回答缓存失败: {e}")
+    
+    @staticmethod
+    def _format_sources(relevant_docs: List[Dict]) -> List[Dict]:
+        return [
+            {
+                'content': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
+                'score': doc['score'],
+                'metadata': doc['metadata']
             }
+            for doc in relevant_docs
+        ]
+    
+    @staticmethod
+    def _confidence(source_docs: List[Dict]) -> float:
+        return max((doc['score'] for doc in source_docs), default=0.0)
+    
+    def _answer_result(self, answer: str, source_docs: List[Dict], relevant_docs: List[Dict], model_used: str,
+                       response_time: float, cache_hit: bool) -> Dict:
+        """问答结果：sources 为装入提示词的片段，retrieved_chunks 为全部检索结果"""
+        return {
+            'answer': answer,
+            'sources': self._format_sources(source_docs),
+            'confidence': self._confidence(source_docs),
+            'retrieved_chunks': relevant_docs,
+            'model_used': model_used,
+            'response_time': response_time,
+            'cache_hit': cache_hit
+        }
+    
+    @staticmethod
+    def _error_result(error: Exception, response_time: float) -> Dict:
+        return {
+            'answer': f'查询过程中出现错误: {str(error)}',
+            'sources': [],
+            'confidence': 0.0,
+            'retrieved_chunks': [],
+            'model_used': "error",
+            'response_time': response_time
+        }
     
     def get_knowledge_base_stats(self, kb_id: int) -> Dict:
         """获取知识库统计信息"""
@@ -1164,11 +1711,13 @@ class RAGSystem:
             return {
                 'total_chunks': len(vector_store.chunks),
                 'total_documents': len(set(chunk.get('document_id', 0) for chunk in vector_store.metadata)),
-                'vector_dimension': vector_store.vectors.shape[1] if vector_store.vectors is not None else 0
+                'vector_dimension': vector_store.vectors.shape[1] if vector_store.vectors is not None else 0,
+                'index_version': self.index_versions.get(kb_id)
             }
         else:
             return {
                 'total_chunks': 0,
                 'total_documents': 0,
-                'vector_dimension': 0
+                'vector_dimension': 0,
+                'index_version': None
             }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+知识库检索结果缓存 - 重复的问题直接复用上次的检索结果，跳过问题编码和索引扫描
+
+键为 (知识库id, 索引版本, top_k, 阈值, 规范化后的问题)，值为命中分块的 DocumentChunk id 及得分。
+知识库的文档新增、删除或重新处理都会递增 KnowledgeBase.index_version，旧版本的条目不会再被命中，
+随 LRU 淘汰或过期自然清除，因此无需显式失效。
+"""
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_RETRIEVAL_CACHE_CONFIG = {
+    'enabled': True,
+    'max_entries': 1024,   # 最多缓存的问题数（LRU淘汰）
+    'ttl_seconds': 600,    # 条目有效期（秒）
+}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = ' ?？!！。.'
+
+
+def get_retrieval_cache_config() -> Dict:
+    """读取 settings.KNOWLEDGE_RETRIEVAL_CACHE，缺省项使用默认值"""
+    config = dict(DEFAULT_RETRIEVAL_CACHE_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_RETRIEVAL_CACHE', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：全角转半角、小写、合并空白、去掉末尾的问号句号"""
+    question = unicodedata.normalize('NFKC', question).lower()
+    return _WHITESPACE_RE.sub(' ', question).strip().rstrip(_TRAILING_PUNCTUATION)
+
+
+class RetrievalCache:
+    """线程安全的 LRU + TTL 检索结果缓存"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or get_retrieval_cache_config()
+        self.enabled = bool(config['enabled'])
+        self.max_entries = int(config['max_entries'])
+        self.ttl_seconds = float(config['ttl_seconds'])
+        self._entries = OrderedDict()  # key -> (过期时间, 结果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kb_id: int, generation: Optional[int], top_k: int, threshold: float, question: str) -> Tuple:
+        return kb_id, generation, top_k, float(threshold), normalize_question(question)
+
+    def get(self, key: Tuple) -> Optional[List[Tuple[int, Dict]]]:
+        """返回缓存的 [(分块id, 得分字段)]，未命中或已过期返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, results: List[Tuple[int, Dict]]):
+        if not self.enabled or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_miss(self):
+        """命中的条目无法还原（分块已不在内存索引中）时计为未命中"""
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def clear(self, kb_id: Optional[int] = None):
+        """清除缓存（指定知识库时只清除该知识库的条目）"""
+        with self._lock:
+            if kb_id is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == kb_id]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
@@ -45,7 +45,7 @@ class QASessionSchema(ModelSchema):
 class QARecordSchema(ModelSchema):
     class Meta:
         model = QARecord
-        fields = ['id', 'question', 'answer', 'model_used', 'response_time', 'created_at', 'feedback_score']
+        fields = ['id', 'question', 'answer', 'model_used', 'response_time', 'created_at', 'feedback_score', 'cache_hit']
 
 
 class QARequestSchema(Schema):
@@ -87,6 +87,7 @@ class ModelConfigCreateSchema(Schema):
     api_base_url: str = Field(..., description="API基础URL")
     model_path: str = Field("", description="本地模型路径")
     max_tokens: int = Field(4096, description="最大Token数")
+    context_max_tokens: Optional[int] = Field(None, description="上下文最大Token数，为空时使用系统默认值")
     temperature: float = Field(0.7, description="温度参数")
     is_default: bool = Field(False, description="是否为默认配置")
 
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+知识库向量索引 - 精确检索(Flat)与近似最近邻检索(IVF-Flat)
+
+所有向量均为按行归一化的 float32，内积即余弦相似度。索引本身不持有向量矩阵，
+检索时由 VectorStore 传入（可以是内存映射矩阵），索引只维护行号级别的结构。
+
+- FlatIndex: 一次矩阵乘法对全部向量打分，结果精确，耗时随语料线性增长。
+- IVFFlatIndex: 球面 k-means 粗量化，每个向量归入最近的质心形成倒排列表；
+  检索时只扫描与问题最接近的 nprobe 个列表。nprobe 越大召回越高、延迟越高。
+"""
+
+import os
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_CONFIG = {
+    'backend': 'auto',        # auto: 向量数达到 ivf_min_vectors 后使用IVF；flat: 始终精确检索；ivf: 始终使用IVF
+    'ivf_min_vectors': 20000,
+    'nlist': None,            # 倒排列表数，None 表示按 4*sqrt(N) 自动选择
+    'nprobe': 16,             # 检索时探查的倒排列表数
+    'retrain_growth': 4.0,    # 向量数增长到训练时的若干倍后重新训练质心
+}
+
+
+def get_index_config() -> Dict:
+    """读取 settings.KNOWLEDGE_VECTOR_INDEX，缺省项使用默认值"""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, 'KNOWLEDGE_VECTOR_INDEX', {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """将向量按行归一化为单位长度，返回新的连续 float32 矩阵（零向量保持为零）"""
+    matrix = np.array(matrix, dtype=np.float32, order='C')
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """用 argpartition 选出得分最高的 top_k 个下标（按得分降序），支持一维或二维得分矩阵"""
+    n = scores.shape[-1]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10,
+                     sample_size: Optional[int] = None, seed: int = 0) -> np.ndarray:
+    """球面 k-means（质心归一化，按内积分配），返回 (n_clusters, dim) 质心矩阵"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    if sample_size and n > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+    n_clusters = min(n_clusters, len(sample))
+
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_to_centroids(sample, centroids)
+        counts = np.bincount(assign, minlength=n_clusters)
+        nonempty = np.flatnonzero(counts)
+        order = np.argsort(assign, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        centroids[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+        # 空簇用随机样本重新初始化
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 16384) -> np.ndarray:
+    """把每个向量分配到内积最大的质心，分批计算以限制内存占用"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+class FlatIndex:
+    """精确检索：对全部向量做一次矩阵乘法"""
+
+    kind = 'flat'
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (行号, 得分)，形状均为 (n_queries, k)"""
+        scores = queries @ vectors.T
+        rows = top_k_indices(scores, top_k)
+        return rows, np.take_along_axis(scores, rows, axis=1)
+
+    def add(self, new_vectors: np.ndarray):
+        pass
+
+    def remove(self, keep_mask: np.ndarray):
+        pass
+
+    def save(self, directory: str, chunk_ids: List[Optional[int]]):
+        pass
+
+
+class IVFFlatIndex:
+    """IVF-Flat 近似最近邻索引"""
+
+    kind = 'ivf'
+    FILE_PREFIX = 'ivf'
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, nprobe: int = 16,
+                 trained_size: Optional[int] = None):
+        self.centroids = normalize_rows(centroids)
+        self.assignments = np.asarray(assignments, dtype=np.int32)  # 与存储行一一对应
+        self.nprobe = nprobe
+        self.trained_size = trained_size or len(assignments)
+        self._list_rows = None
+        self._list_offsets = None
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: Optional[int] = None, nprobe: int = 16,
+              n_iter: int = 10, seed: int = 0) -> 'IVFFlatIndex':
+        """在给定向量上训练质心并建立倒排列表"""
+        n = len(vectors)
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        centroids = spherical_kmeans(vectors, nlist, n_iter=n_iter, sample_size=nlist * 128, seed=seed)
+        assignments = assign_to_centroids(vectors, centroids)
+        logger.info(f"IVF索引训练完成: {n} 个向量, {len(centroids)} 个倒排列表")
+        return cls(centroids, assignments, nprobe=nprobe, trained_size=n)
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, top_k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """只扫描最接近的 nprobe 个倒排列表，返回 (行号, 得分)，不足 k 个时以 -1 / -inf 填充"""
+        list_rows, list_offsets = self._inverted_lists()
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe_lists = top_k_indices(queries @ self.centroids.T, nprobe)
+
+        rows_out = np.full((len(queries), top_k), -1, dtype=np.intp)
+        scores_out = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            # 候选行排序后再读取，对内存映射矩阵更友好
+            candidates = np.sort(np.concatenate([
+                list_rows[list_offsets[l]:list_offsets[l + 1]] for l in probe_lists[i]
+            ]))
+            if not len(candidates):
+                continue
+            candidate_scores = vectors[candidates] @ query
+            best = top_k_indices(candidate_scores, top_k)
+            rows_out[i, :len(best)] = candidates[best]
+            scores_out[i, :len(best)] = candidate_scores[best]
+        return rows_out, scores_out
+
+    def add(self, new_vectors: np.ndarray):
+        """增量插入：新向量归入最近的已有质心"""
+        if len(new_vectors):
+            self.assignments = np.concatenate([self.assignments, assign_to_centroids(new_vectors, self.centroids)])
+            self._list_rows = None
+
+    def remove(self, keep_mask: np.ndarray):
+        """删除行后保持分配数组与存储行对齐"""
+        self.assignments = self.assignments[keep_mask]
+        self._list_rows = None
+
+    def needs_retrain(self, growth: float) -> bool:
+        """语料相对训练时增长过多时，质心不再具有代表性"""
+        return len(self.assignments) > self.trained_size * growth
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按质心分组的行号（CSR 形式），在增删后惰性重建"""
+        if self._list_rows is None:
+            self._list_rows = np.argsort(self.assignments, kind='stable')
+            counts = np.bincount(self.assignments, minlength=self.nlist)
+            self._list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        return self._list_rows, self._list_offsets
+
+    def save(self, directory: str, chunk_ids: List[Optional[int]]):
+        """持久化质心和按分块id记录的列表分配，保存在知识库向量文件旁"""
+        os.makedirs(directory, exist_ok=True)
+        ids = np.array([-1 if chunk_id is None else chunk_id for chunk_id in chunk_ids], dtype=np.int64)
+        np.save(os.path.join(directory, f'{self.FILE_PREFIX}_centroids.npy'), self.centroids)
+        np.save(os.path.join(directory, f'{self.FILE_PREFIX}_assignments.npy'), self.assignments)
+        np.save(os.path.join(directory, f'{self.FILE_PREFIX}_chunk_ids.npy'), ids)
+        tmp_path = os.path.join(directory, f'{self.FILE_PREFIX}.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'nlist': self.nlist, 'trained_size': self.trained_size, 'count': len(ids)}, f)
+        os.replace(tmp_path, os.path.join(directory, f'{self.FILE_PREFIX}.json'))
+
+    @classmethod
+    def load(cls, directory: str, vectors: np.ndarray, chunk_ids: List[Optional[int]],
+             nprobe: int = 16) -> Optional['IVFFlatIndex']:
+        """加载已持久化的索引；按分块id对齐当前存储行，缺失的行重新分配到最近的质心"""
+        try:
+            with open(os.path.join(directory, f'{cls.FILE_PREFIX}.json'), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            centroids = np.load(os.path.join(directory, f'{cls.FILE_PREFIX}_centroids.npy'))
+            saved_assignments = np.load(os.path.join(directory, f'{cls.FILE_PREFIX}_assignments.npy'))
+            saved_ids = np.load(os.path.join(directory, f'{cls.FILE_PREFIX}_chunk_ids.npy'))
+        except (OSError, ValueError):
+            return None
+        if (centroids.ndim != 2 or vectors is None or centroids.shape[1] != vectors.shape[1]
+                or len(saved_ids) != len(saved_assignments)):
+            return None
+
+        ids = np.array([-1 if chunk_id is None else chunk_id for chunk_id in chunk_ids], dtype=np.int64)
+        assignments = np.full(len(ids), -1, dtype=np.int32)
+        if len(saved_ids):
+            order = np.argsort(saved_ids)
+            sorted_ids = saved_ids[order]
+            positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+            found = (ids >= 0) & (sorted_ids[positions] == ids)
+            assignments[found] = saved_assignments[order[positions[found]]]
+        missing = np.flatnonzero(assignments < 0)
+        if len(missing):
+            assignments[missing] = assign_to_centroids(vectors[missing], centroids)
+        return cls(centroids, assignments, nprobe=nprobe, trained_size=info.get('trained_size'))
+
+    @classmethod
+    def remove_files(cls, directory: str):
+        """删除持久化文件（退回精确检索时使用）"""
+        for suffix in ('.json', '_centroids.npy', '_assignments.npy', '_chunk_ids.npy'):
+            try:
+                os.remove(os.path.join(directory, f'{cls.FILE_PREFIX}{suffix}'))
+            except OSError:
+                pass
+
+
+def select_index_kind(n_vectors: int, config: Dict) -> str:
+    """根据配置和向量数决定索引类型"""
+    if n_vectors == 0:
+        return FlatIndex.kind
+    if config['backend'] == 'ivf' or (config['backend'] == 'auto' and n_vectors >= config['ivf_min_vectors']):
+        return IVFFlatIndex.kind
+    return FlatIndex.kind
+
+
+def build_index(vectors: Optional[np.ndarray], chunk_ids: List[Optional[int]],
+                directory: Optional[str] = None, config: Optional[Dict] = None):
+    """按配置为给定向量选择并构建索引；目录中已有可用的IVF索引时直接加载"""
+    config = config or get_index_config()
+    n = 0 if vectors is None else len(vectors)
+    if select_index_kind(n, config) == FlatIndex.kind:
+        if directory:
+            IVFFlatIndex.remove_files(directory)
+        return FlatIndex()
+
+    index = IVFFlatIndex.load(directory, vectors, chunk_ids, nprobe=config['nprobe']) if directory else None
+    if index is None or index.needs_retrain(config['retrain_growth']):
+        index = IVFFlatIndex.train(vectors, nlist=config['nlist'], nprobe=config['nprobe'])
+    if directory:
+        index.save(directory, chunk_ids)
+    return index
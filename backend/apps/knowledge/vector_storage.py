@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+知识库向量文件存储 - 以内存映射的二进制文件保存分块向量
+
+目录结构（位于 KnowledgeBase.vector_store_path 下）：
+    meta.json                 元数据：维度、已提交行数、当前段文件名、嵌入模型状态
+    embeddings-<seq>.f32      按行存放的归一化 float32 向量 (count, dim)
+    chunk_ids-<seq>.i64       与向量逐行对应的 DocumentChunk id（int64）
+
+加载时通过 np.memmap 只读映射向量文件，无需反序列化，多个工作进程可共享同一份页缓存。
+追加写入只扩展文件尾部，再原子替换 meta.json 提交行数；删除文档时整体重写为新的段文件，
+旧段文件在不再被映射后删除。
+"""
+
+import os
+import json
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPE = np.float32
+ID_DTYPE = np.int64
+
+
+@contextmanager
+def _file_lock(lock_path: str):
+    """跨进程文件锁，防止多个进程同时写入同一知识库的向量文件"""
+    with open(lock_path, 'a+b') as lock_file:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class MmapVectorStorage:
+    """单个知识库的向量文件存储"""
+
+    META_FILE = 'meta.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, self.META_FILE)
+
+    def exists(self) -> bool:
+        """向量文件是否已存在"""
+        return os.path.exists(self.meta_path)
+
+    def read_meta(self) -> Optional[Dict]:
+        """读取元数据，不存在或损坏时返回None"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            logger.warning(f"向量文件元数据损坏，将重建: {self.meta_path}: {e}")
+            return None
+
+    def load(self) -> Tuple[Optional[np.ndarray], np.ndarray, Optional[Dict]]:
+        """以只读内存映射方式加载向量
+
+        Returns:
+            tuple: (向量矩阵memmap或None, 分块id数组, 元数据)
+        """
+        meta = self.read_meta()
+        if not meta or not meta.get('count'):
+            return None, np.empty(0, dtype=ID_DTYPE), meta
+
+        count, dim = int(meta['count']), int(meta['dim'])
+        vectors = np.memmap(
+            os.path.join(self.directory, meta['vectors_file']),
+            dtype=VECTOR_DTYPE, mode='r', shape=(count, dim)
+        )
+        chunk_ids = np.fromfile(
+            os.path.join(self.directory, meta['ids_file']), dtype=ID_DTYPE, count=count
+        )
+        return vectors, chunk_ids, meta
+
+    def append(self, vectors: np.ndarray, chunk_ids, embedding_state: Optional[Dict] = None) -> Dict:
+        """在文件尾部追加向量（必须已归一化）及其分块id"""
+        vectors = np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE)
+        chunk_ids = np.ascontiguousarray(chunk_ids, dtype=ID_DTYPE)
+        if len(vectors) != len(chunk_ids):
+            raise ValueError("向量行数与分块id数量不一致")
+
+        os.makedirs(self.directory, exist_ok=True)
+        with _file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            meta = self.read_meta()
+            if not meta or (len(vectors) and int(meta['dim']) != vectors.shape[1]):
+                return self._write_segment(vectors, chunk_ids, embedding_state, previous=meta)
+
+            count, dim = int(meta['count']), int(meta['dim'])
+            # 从已提交的行数处写入，覆盖可能因异常中断残留的未提交数据
+            self._write_at(meta['vectors_file'], count * dim * VECTOR_DTYPE().itemsize, vectors)
+            self._write_at(meta['ids_file'], count * ID_DTYPE().itemsize, chunk_ids)
+
+            meta['count'] = count + len(vectors)
+            if embedding_state is not None:
+                meta['embedding'] = embedding_state
+            self._write_meta(meta)
+            return meta
+
+    def rewrite(self, vectors: Optional[np.ndarray], chunk_ids, embedding_state: Optional[Dict] = None) -> Dict:
+        """用给定的全部向量重写为新的段文件（删除文档或嵌入模型变化时使用）"""
+        if vectors is None:
+            vectors = np.empty((0, 0), dtype=VECTOR_DTYPE)
+        vectors = np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE)
+        chunk_ids = np.ascontiguousarray(chunk_ids, dtype=ID_DTYPE)
+
+        os.makedirs(self.directory, exist_ok=True)
+        with _file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            return self._write_segment(vectors, chunk_ids, embedding_state, previous=self.read_meta())
+
+    def read_vectors(self, chunk_ids) -> Tuple[Optional[np.ndarray], Optional[Dict]]:
+        """按分块id顺序读取向量（复制到内存），有任意id不在文件中时返回 (None, 元数据)"""
+        vectors, file_ids, meta = self.load()
+        chunk_ids = np.asarray(list(chunk_ids), dtype=ID_DTYPE)
+        if vectors is None or not len(chunk_ids):
+            return None, meta
+        order = np.argsort(file_ids, kind='stable')
+        positions = np.searchsorted(file_ids, chunk_ids, sorter=order)
+        positions = np.minimum(positions, len(file_ids) - 1)
+        rows = order[positions]
+        if not np.array_equal(file_ids[rows], chunk_ids):
+            return None, meta
+        return np.array(vectors[rows]), meta
+
+    def remove_ids(self, chunk_ids) -> int:
+        """删除指定分块id对应的行并重写段文件，返回删除的行数"""
+        if not self.exists():
+            return 0
+        with _file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            vectors, file_ids, meta = self.load()
+            if vectors is None:
+                return 0
+            keep = ~np.isin(file_ids, np.asarray(list(chunk_ids), dtype=ID_DTYPE))
+            removed = int(len(file_ids) - keep.sum())
+            if removed:
+                self._write_segment(np.ascontiguousarray(vectors[keep]), file_ids[keep], None, previous=meta)
+            return removed
+
+    def _write_segment(self, vectors: np.ndarray, chunk_ids: np.ndarray,
+                       embedding_state: Optional[Dict], previous: Optional[Dict]) -> Dict:
+        """写入新的段文件并提交元数据，随后清理旧段文件"""
+        seq = int(previous.get('segment', 0)) + 1 if previous else 1
+        vectors_file = f"embeddings-{seq:06d}.f32"
+        ids_file = f"chunk_ids-{seq:06d}.i64"
+
+        vectors.tofile(os.path.join(self.directory, vectors_file))
+        chunk_ids.tofile(os.path.join(self.directory, ids_file))
+
+        if embedding_state is None and previous:
+            embedding_state = previous.get('embedding')
+        meta = {
+            'segment': seq,
+            'vectors_file': vectors_file,
+            'ids_file': ids_file,
+            'dim': int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            'count': int(len(vectors)),
+            'dtype': 'float32',
+            'embedding': embedding_state,
+        }
+        self._write_meta(meta)
+
+        # 清理旧段文件（包括之前因仍被映射而未能删除的）
+        for name in os.listdir(self.directory):
+            if name.startswith(('embeddings-', 'chunk_ids-')) and name not in (vectors_file, ids_file):
+                self._remove_quietly(os.path.join(self.directory, name))
+        return meta
+
+    def _write_at(self, file_name: str, offset: int, array: np.ndarray):
+        """在文件指定偏移处写入数组"""
+        path = os.path.join(self.directory, file_name)
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        with open(path, mode) as f:
+            f.seek(offset)
+            f.write(array.tobytes())
+
+    def _write_meta(self, meta: Dict):
+        """原子替换元数据文件"""
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+    @staticmethod
+    def _remove_quietly(path: str):
+        """删除旧段文件；在Windows上文件仍被映射时会失败，留待下次重写时清理"""
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.debug(f"暂时无法删除旧向量段文件 {path}: {e}")
@@ -8,23 +8,23 @@ from ninja import Router, UploadedFile, File
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from apps.user.models import User
 from django.core.paginator import Paginator
 from typing import List, Dict, Optional
 import json
 import os
+import hashlib
 import sys
 import traceback
-import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 import uuid
 from datetime import datetime
 
-from apps.core import auth, R
+from apps.core import auth, async_auth, R
 from .models import (
     KnowledgeBase, Document, QASession, QARecord, 
     ModelConfig, EmbeddingConfig
@@ -37,6 +37,8 @@ from .schemas import (
 
 # 导入RAG系统
 from .rag_system_simple import RAGSystem
+from .ingestion import IngestionQueue
+from .db_executor import run_db
 
 # 创建路由器
 router = Router()
@@ -52,6 +54,33 @@ def get_rag_system():
     return _rag_system
 
 
+# 全局文档入库队列
+_ingestion_queue = None
+
+def get_ingestion_queue():
+    """获取文档入库队列"""
+    global _ingestion_queue
+    if _ingestion_queue is None:
+        _ingestion_queue = IngestionQueue(get_rag_system())
+    return _ingestion_queue
+
+
+def start_ingestion():
+    """服务进程启动时调用（edu/wsgi.py、edu/asgi.py）：创建入库队列并在后台重新提交未完成的文档"""
+    get_ingestion_queue().start_recovery()
+
+
+def save_uploaded_file(file, file_path: str) -> str:
+    """分块写入上传文件，同时计算内容的SHA-256（用于识别重复上传）"""
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        # 分块写入，减少内存使用
+        for chunk in file.chunks(chunk_size=8192):  # 8KB chunks
+            f.write(chunk)
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def get_user_from_request(request):
     """从请求中获取用户，如果用户不存在则抛出异常"""
     try:
@@ -195,6 +224,7 @@ def delete_knowledge_base(request, kb_id: int):
         # 软删除（设置为不活跃）
         kb.is_active = False
         kb.save()
+        get_rag_system().drop_knowledge_base(kb_id)
         
         return {"success": True, "message": "知识库已删除"}
         
@@ -230,6 +260,8 @@ def get_documents(request, kb_id: int, page: int = 1, size: int = 10):
                 "file_type": doc.file_type,
                 "file_size": doc.file_size,
                 "status": doc.status,
+                "progress": doc.progress,
+                "error_message": doc.error_message,
                 "chunk_count": doc.chunk_count,
                 "processed_at": doc.processed_at.isoformat() if doc.processed_at else None,
                 "uploaded_at": doc.uploaded_at.isoformat() if doc.uploaded_at else None,
@@ -265,6 +297,8 @@ def get_document_detail(request, doc_id: int):
             "file_type": document.file_type,
             "file_size": document.file_size,
             "status": document.status,
+            "progress": document.progress,
+            "error_message": document.error_message,
             "chunk_count": document.chunk_count,
             "metadata": document.metadata,
             "uploaded_by": document.uploaded_by.username if document.uploaded_by else None,
@@ -288,6 +322,31 @@ def get_document_detail(request, doc_id: int):
         logger.error(f"获取文档详情失败: {e}")
         return {"success": False, "error": str(e)}
 
+
+@router.get("/documents/{doc_id}/progress", summary="获取文档处理进度")
+def get_document_progress(request, doc_id: int):
+    """获取文档处理状态和进度（已解析页数、已编码分块数等）"""
+    try:
+        document = Document.objects.only(
+            'id', 'status', 'progress', 'error_message', 'chunk_count', 'processed_at'
+        ).get(id=doc_id)
+        return {
+            "success": True,
+            "data": {
+                "document_id": document.id,
+                "status": document.status,
+                "progress": document.progress,
+                "error_message": document.error_message,
+                "chunk_count": document.chunk_count,
+                "processed_at": document.processed_at.isoformat() if document.processed_at else None,
+            }
+        }
+    except Document.DoesNotExist:
+        return {"success": False, "error": "文档不存在"}
+    except Exception as e:
+        logger.error(f"获取文档进度失败: {e}")
+        return {"success": False, "error": str(e)}
+
 @router.delete("/documents/{doc_id}", summary="删除文档", **auth)
 def delete_document(request, doc_id: int):
     """删除文档"""
@@ -304,8 +363,17 @@ def delete_document(request, doc_id: int):
             os.remove(document.file_path)
         
         # 删除数据库记录
+        kb_id = document.knowledge_base_id
+        doc_id = document.id
+        was_indexed = document.status == 'completed'
         document.delete()
         
+        # 同步内存索引并递增知识库索引版本
+        if was_indexed:
+            rag_system = get_rag_system()
+            rag_system.remove_document(kb_id, doc_id)
+            rag_system.commit_index_change(kb_id)
+        
         return {"success": True, "message": "文档已删除"}
         
     except Document.DoesNotExist:
@@ -349,10 +417,7 @@ def upload_document(request, kb_id: int, file: UploadedFile = File(...)):
         # 保存文件 - 优化大文件处理
         logger.info(f"开始保存文件: {file.name}, 大小: {file.size} bytes")
         try:
-            with open(file_path, 'wb') as f:
-                # 分块写入，减少内存使用
-                for chunk in file.chunks(chunk_size=8192):  # 8KB chunks
-                    f.write(chunk)
+            content_hash = save_uploaded_file(file, file_path)
         except Exception as e:
             logger.error(f"文件保存失败: {e}")
             return {"success": False, "error": f"文件保存失败: {str(e)}"}
@@ -367,45 +432,24 @@ def upload_document(request, kb_id: int, file: UploadedFile = File(...)):
             file_name=file.name,
             file_type=file_extension[1:],  # 去掉点号
             file_size=file.size,
+            content_hash=content_hash,
             uploaded_by=user,
             status='pending'
         )
         
-        # 异步处理文档
-        try:
-            rag_system = get_rag_system()
-            logger.info(f"开始处理文档: {file.name}, 文件大小: {file.size}")
-            result = rag_system.process_document(kb_id, file_path, document.id)
-            logger.info(f"文档处理结果: {result}")
-            
-            if result.get('success', False):
-                # 更新文档状态
-                document.status = 'completed'
-                document.chunk_count = result.get('chunk_count', 0)
-                document.processed_at = datetime.now()
-                document.save()
-                
-                return {
-                    "success": True,
-                    "data": {
-                        "document_id": document.id,
-                        "chunk_count": result.get('chunk_count', 0),
-                        "status": "completed",
-                        "file_size": file.size,
-                        "file_name": file.name
-                    }
-                }
-            else:
-                document.status = 'failed'
-                document.save()
-                logger.error(f"文档处理失败: {result.get('error', '未知错误')}")
-                return {"success": False, "error": f"文档处理失败: {result.get('error', '未知错误')}"}
-            
-        except Exception as e:
-            document.status = 'failed'
-            document.save()
-            logger.error(f"文档处理异常: {str(e)}", exc_info=True)
-            return {"success": False, "error": f"文档处理失败: {str(e)}"}
+        # 提交到后台入库队列，立即返回
+        get_ingestion_queue().submit(document.id)
+        
+        return {
+            "success": True,
+            "data": {
+                "document_id": document.id,
+                "chunk_count": 0,
+                "status": "pending",
+                "file_size": file.size,
+                "file_name": file.name
+            }
+        }
             
     except KnowledgeBase.DoesNotExist:
         return {"success": False, "error": "知识库不存在"}
@@ -468,10 +512,7 @@ def batch_upload_documents(request, kb_id: int):
                 # 保存文件 - 优化大文件处理
                 logger.info(f"开始批量保存文件: {file.name}, 大小: {file.size} bytes")
                 try:
-                    with open(file_path, 'wb') as f:
-                        # 分块写入，减少内存使用
-                        for chunk in file.chunks(chunk_size=8192):  # 8KB chunks
-                            f.write(chunk)
+                    content_hash = save_uploaded_file(file, file_path)
                 except Exception as e:
                     logger.error(f"批量文件保存失败: {e}")
                     results.append({
@@ -491,39 +532,21 @@ def batch_upload_documents(request, kb_id: int):
                     file_name=file.name,
                     file_type=file_extension[1:],  # 去掉点号
                     file_size=file.size,
+                    content_hash=content_hash,
                     uploaded_by=user,
                     status='pending'
                 )
                 
-                # 处理文档
-                rag_system = get_rag_system()
-                logger.info(f"开始批量处理文档: {file.name}, 文件大小: {file.size}")
-                result = rag_system.process_document(kb_id, file_path, document.id)
-                logger.info(f"批量文档处理结果: {result}")
+                # 提交到后台入库队列，多个文件由工作线程并行处理
+                get_ingestion_queue().submit(document.id)
                 
-                if result.get('success', False):
-                    # 更新文档状态
-                    document.status = 'completed'
-                    document.chunk_count = result.get('chunk_count', 0)
-                    document.processed_at = datetime.now()
-                    document.save()
-                    
-                    results.append({
-                        "file_name": file.name,
-                        "success": True,
-                        "document_id": document.id,
-                        "chunk_count": result.get('chunk_count', 0),
-                        "file_size": file.size
-                    })
-                else:
-                    document.status = 'failed'
-                    document.save()
-                    logger.error(f"批量文档处理失败: {result.get('error', '未知错误')}")
-                    results.append({
-                        "file_name": file.name,
-                        "success": False,
-                        "error": f"文档处理失败: {result.get('error', '未知错误')}"
-                    })
+                results.append({
+                    "file_name": file.name,
+                    "success": True,
+                    "document_id": document.id,
+                    "status": "pending",
+                    "file_size": file.size
+                })
                 
             except Exception as e:
                 logger.error(f"批量文档处理异常 {file.name}: {str(e)}", exc_info=True)
@@ -561,140 +584,116 @@ def batch_upload_documents(request, kb_id: int):
 
 # ==================== 问答功能 ====================
 
-@router.post("/qa/ask", summary="智能问答", **auth)
-def ask_question(request, data: QARequestSchema):
-    """智能问答接口"""
-    try:
-        # 检查知识库
-        kb = KnowledgeBase.objects.get(id=data.kb_id, is_active=True)
-        user = get_user_from_request(request)
-        
-        # 获取或创建会话
-        if data.session_id:
-            try:
-                session = QASession.objects.get(session_id=data.session_id, user=user)
-            except QASession.DoesNotExist:
-                session = QASession.objects.create(
-                    knowledge_base=kb,
-                    user=user,
-                    session_id=data.session_id,
-                    title=data.question[:50] + "..." if len(data.question) > 50 else data.question
-                )
-        else:
-            # 创建新会话
-            session_id = str(uuid.uuid4())
-            session = QASession.objects.create(
+def _get_or_create_qa_session(data: QARequestSchema, user, kb) -> QASession:
+    """获取问答请求所属的会话，不存在时创建"""
+    title = data.question[:50] + "..." if len(data.question) > 50 else data.question
+    if data.session_id:
+        try:
+            return QASession.objects.get(session_id=data.session_id, user=user)
+        except QASession.DoesNotExist:
+            return QASession.objects.create(
                 knowledge_base=kb,
                 user=user,
-                session_id=session_id,
-                title=data.question[:50] + "..." if len(data.question) > 50 else data.question
+                session_id=data.session_id,
+                title=title
             )
+    # 创建新会话
+    return QASession.objects.create(
+        knowledge_base=kb,
+        user=user,
+        session_id=str(uuid.uuid4()),
+        title=title
+    )
+
+
+def _model_config_dict(model_config: ModelConfig) -> Dict:
+    return {
+        'model_type': model_config.model_type,
+        'model_name': model_config.model_name,
+        'api_key': model_config.api_key,
+        'api_base_url': model_config.api_base_url,
+        'max_tokens': model_config.max_tokens,
+        'context_max_tokens': model_config.context_max_tokens,
+        'temperature': model_config.temperature
+    }
+
+
+def _configure_qa_llm(rag_system, config_id: Optional[int]) -> Optional[int]:
+    """配置问答使用的LLM - 优先使用指定的配置，否则使用默认的Gemini配置，返回实际使用的配置ID"""
+    if config_id:
+        try:
+            model_config = ModelConfig.objects.get(id=config_id, is_active=True)
+            rag_system.configure_llm(config_id, _model_config_dict(model_config))
+            return config_id
+        except ModelConfig.DoesNotExist:
+            pass
+    
+    # 如果没有指定配置ID或指定的配置不存在，使用默认的Gemini配置
+    try:
+        # 查找激活的Gemini配置
+        gemini_config = ModelConfig.objects.filter(
+            model_name__icontains='gemini',
+            is_active=True
+        ).first()
+        
+        if gemini_config:
+            rag_system.configure_llm(gemini_config.id, _model_config_dict(gemini_config))
+            logger.info(f"使用默认Gemini配置: {gemini_config.model_name}")
+            return gemini_config.id
+        logger.warning("未找到激活的Gemini配置")
+    except Exception as e:
+        logger.warning(f"无法配置默认Gemini配置: {e}")
+    return None
+
+
+def _save_qa_record(session: QASession, question: str, result: Dict) -> QARecord:
+    return QARecord.objects.create(
+        session=session,
+        question=question,
+        answer=result['answer'],
+        retrieved_chunks=result.get('retrieved_chunks', []),
+        model_used=result['model_used'],
+        response_time=result['response_time'],
+        tokens_used=result.get('tokens_used', 0),
+        cache_hit=result.get('cache_hit', False)
+    )
+
+
+def _begin_qa(request, data: QARequestSchema):
+    """检查知识库、获取会话并配置LLM（同步，访问数据库），返回 (会话, 实际使用的配置ID)"""
+    # 检查知识库
+    kb = KnowledgeBase.objects.get(id=data.kb_id, is_active=True)
+    user = get_user_from_request(request)
+    
+    # 获取或创建会话
+    session = _get_or_create_qa_session(data, user, kb)
+    
+    # 配置LLM - 优先使用指定的配置，否则使用默认的Gemini配置
+    config_id_to_use = _configure_qa_llm(get_rag_system(), data.model_config_id)
+    return session, config_id_to_use
+
+
+@router.post("/qa/ask", summary="智能问答", **async_auth)
+async def ask_question(request, data: QARequestSchema):
+    """智能问答接口"""
+    try:
+        session, config_id_to_use = await run_db(_begin_qa, request, data)
         
         # 调用RAG系统进行问答
         rag_system = get_rag_system()
         
-        # 配置LLM - 优先使用指定的配置，否则使用默认的Gemini配置
-        config_id_to_use = data.model_config_id
-        
-        if config_id_to_use:
-            try:
-                model_config = ModelConfig.objects.get(id=config_id_to_use, is_active=True)
-                llm_config = {
-                    'model_type': model_config.model_type,
-                    'model_name': model_config.model_name,
-                    'api_key': model_config.api_key,
-                    'api_base_url': model_config.api_base_url,
-                    'max_tokens': model_config.max_tokens,
-                    'temperature': model_config.temperature
-                }
-                rag_system.configure_llm(config_id_to_use, llm_config)
-            except ModelConfig.DoesNotExist:
-                config_id_to_use = None
-        
-        # 如果没有指定配置ID或指定的配置不存在，使用默认的Gemini配置
-        if not config_id_to_use:
-            try:
-                # 查找激活的Gemini配置
-                gemini_config = ModelConfig.objects.filter(
-                    model_name__icontains='gemini',
-                    is_active=True
-                ).first()
-                
-                if gemini_config:
-                    config_id_to_use = gemini_config.id
-                    llm_config = {
-                        'model_type': gemini_config.model_type,
-                        'model_name': gemini_config.model_name,
-                        'api_key': gemini_config.api_key,
-                        'api_base_url': gemini_config.api_base_url,
-                        'max_tokens': gemini_config.max_tokens,
-                        'temperature': gemini_config.temperature
-                    }
-                    rag_system.configure_llm(config_id_to_use, llm_config)
-                    logger.info(f"使用默认Gemini配置: {gemini_config.model_name}")
-                else:
-                    logger.warning("未找到激活的Gemini配置")
-            except Exception as e:
-                logger.warning(f"无法配置默认Gemini配置: {e}")
-        
         # 添加调试日志
         logger.info(f"最终使用的配置ID: {config_id_to_use}")
         logger.info(f"RAG系统中的LLM配置: {list(rag_system.llm_configs.keys())}")
         
-        # 执行问答
-        async def run_qa():
-            from asgiref.sync import sync_to_async
-            
-            @sync_to_async
-            def get_doc_count():
-                return Document.objects.filter(
-                    knowledge_base_id=data.kb_id,
-                    status='completed'
-                ).count()
-            
-            try:
-                # 获取知识库的文档数量
-                doc_count = await get_doc_count()
-                
-                # 检查RAG系统中是否已有文档
-                vector_store = rag_system.get_or_create_vector_store(data.kb_id)
-                
-                # 如果向量存储为空但数据库中有文档，则手动加载
-                if len(vector_store.chunks) == 0 and doc_count > 0:
-                    logger.info(f"知识库 {data.kb_id} 的向量存储为空，开始手动加载文档数据")
-                    loaded_count = rag_system.manually_load_documents(data.kb_id)
-                    logger.info(f"成功加载 {loaded_count} 个文档块")
-                else:
-                    logger.info(f"知识库 {data.kb_id} 中已有 {len(vector_store.chunks)} 个文档块")
-                    
-            except Exception as e:
-                logger.error(f"加载文档时出错: {e}")
-                # 继续执行，即使加载失败也允许问答（可能返回通用回答）
-            
-            return await rag_system.ask_question(
-                kb_id=data.kb_id,
-                question=data.question,
-                config_id=config_id_to_use,
-                top_k=data.top_k or 5,
-                threshold=data.threshold or 0.1  # 降低默认阈值，确保能检索到文档
-            )
-        
-        # 在同步环境中运行异步函数
-        try:
-            # 尝试获取当前事件循环
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # 如果事件循环正在运行，使用asyncio.run_coroutine_threadsafe
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(asyncio.run, run_qa())
-                    result = future.result()
-            else:
-                # 如果事件循环没有运行，直接运行
-                result = loop.run_until_complete(run_qa())
-        except RuntimeError:
-            # 如果没有事件循环，创建新的
-            result = asyncio.run(run_qa())
+        # 执行问答（RAG系统仅在知识库索引版本变化时重新加载文档）
+        result = await rag_system.ask_question(
+            kb_id=data.kb_id,
+            question=data.question,
+            config_id=config_id_to_use,
+            top_k=data.top_k or 5,
+            threshold=data.threshold or 0.1  # 降低默认阈值，确保能检索到文档
+        )
         
         # 验证返回的结果包含所有必要字段
         required_fields = ['answer', 'sources', 'model_used', 'response_time']
@@ -706,15 +705,7 @@ def ask_question(request, data: QARequestSchema):
             return {"success": False, "error": f"系统内部错误: 缺少必要字段 {missing_fields}"}
         
         # 保存问答记录
-        qa_record = QARecord.objects.create(
-            session=session,
-            question=data.question,
-            answer=result['answer'],
-            retrieved_chunks=result.get('retrieved_chunks', []),
-            model_used=result['model_used'],
-            response_time=result['response_time'],
-            tokens_used=result.get('tokens_used', 0)
-        )
+        qa_record = await run_db(_save_qa_record, session, data.question, result)
         
         return {
             "success": True,
@@ -724,6 +715,7 @@ def ask_question(request, data: QARequestSchema):
                 "sources": result['sources'],
                 "model_used": result['model_used'],
                 "response_time": result['response_time'],
+                "cache_hit": qa_record.cache_hit,
                 "qa_record_id": qa_record.id
             }
         }
@@ -740,6 +732,63 @@ def ask_question(request, data: QARequestSchema):
         return {"success": False, "error": str(e)}
 
 
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/qa/ask/stream", summary="智能问答（流式）", **async_auth)
+async def ask_question_stream(request, data: QARequestSchema):
+    """流式智能问答接口（Server-Sent Events，需要以ASGI方式部署才能逐段输出）
+    
+    依次发送事件：
+        sources  检索到的来源片段 {session_id, sources, confidence}
+        token    回答片段 {text}
+        done     问答记录已保存 {session_id, qa_record_id, answer, model_used, response_time, cache_hit}
+        error    出错 {error}
+    """
+    try:
+        session, config_id_to_use = await run_db(_begin_qa, request, data)
+    except KnowledgeBase.DoesNotExist:
+        return {"success": False, "error": "知识库不存在"}
+    except ValueError as e:
+        # 用户不存在的错误
+        return {"success": False, "error": str(e)}
+    
+    async def events():
+        try:
+            answer_events = get_rag_system().ask_question_stream(
+                kb_id=data.kb_id,
+                question=data.question,
+                config_id=config_id_to_use,
+                top_k=data.top_k or 5,
+                threshold=data.threshold or 0.1
+            )
+            async for event, payload in answer_events:
+                if event == 'sources':
+                    yield _sse_event('sources', {"session_id": session.session_id, **payload})
+                elif event == 'token':
+                    yield _sse_event('token', {"text": payload})
+                elif event == 'done':
+                    # 流结束时保存问答记录
+                    qa_record = await run_db(_save_qa_record, session, data.question, payload)
+                    yield _sse_event('done', {
+                        "session_id": session.session_id,
+                        "qa_record_id": qa_record.id,
+                        "answer": payload['answer'],
+                        "model_used": payload['model_used'],
+                        "response_time": payload['response_time'],
+                        "cache_hit": qa_record.cache_hit,
+                    })
+        except Exception as e:
+            logger.error(f"流式问答异常: {traceback.format_exc()}")
+            yield _sse_event('error', {"error": str(e)})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 关闭 nginx 缓冲
+    return response
+
+
 @router.get("/qa/sessions", summary="获取问答会话列表", **auth)
 def get_qa_sessions(request, kb_id: int = None, page: int = 1, size: int = 10):
     """获取用户的问答会话列表"""
@@ -804,6 +853,7 @@ def get_qa_records(request, session_id: str, page: int = 1, size: int = 20):
                 "confidence": float(record.confidence) if record.confidence else 0.0,
                 "feedback_score": record.feedback_score,
                 "feedback_comment": record.feedback_comment,
+                "cache_hit": record.cache_hit,
                 "created_at": record.created_at.isoformat() if record.created_at else None,
             })
         
@@ -937,40 +987,20 @@ def delete_model_config(request, config_id: int):
         return {"success": False, "error": str(e)}
 
 
-@router.get("/models/test", summary="测试模型配置", **auth)
-def test_model_config(request, config_id: int):
+@router.get("/models/test", summary="测试模型配置", **async_auth)
+async def test_model_config(request, config_id: int):
     """测试模型配置"""
     try:
-        config = ModelConfig.objects.get(id=config_id, is_active=True)
-        
-        # 创建测试用的RAG系统实例
-        rag_system = get_rag_system()
+        config = await run_db(ModelConfig.objects.get, id=config_id, is_active=True)
         
         # 配置LLM
-        llm_config = {
-            'model_type': config.model_type,
-            'model_name': config.model_name,
-            'api_key': config.api_key,
-            'api_base_url': config.api_base_url,
-            'max_tokens': config.max_tokens,
-            'temperature': config.temperature
-        }
-        
-        rag_system.configure_llm(config_id, llm_config)
+        rag_system = get_rag_system()
+        rag_system.configure_llm(config_id, _model_config_dict(config))
         
         # 发送测试问题
-        async def test_llm():
-            return await rag_system.llm_configs[config_id].generate_response(
-                "你好，请简单介绍一下你自己。", ""
-            )
-        
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        result = loop.run_until_complete(test_llm())
+        result = await rag_system.llm_configs[config_id].generate_response(
+            "你好，请简单介绍一下你自己。", ""
+        )
         
         return {
             "success": True,
@@ -1008,6 +1038,8 @@ def get_system_stats(request):
             "success": True,
             "data": {
                 "stats": stats,
+                "retrieval_cache": get_rag_system().retrieval_cache.stats(),
+                "llm": get_rag_system().llm_stats(),
                 "recent_qa": [
                     {
                         "question": qa.question[:50] + "..." if len(qa.question) > 50 else qa.question,
@@ -1023,40 +1055,39 @@ def get_system_stats(request):
         return {"success": False, "error": str(e)}
 
 
+def _check_database():
+    """检查数据库连接，返回 (数据库状态, 激活的模型配置数)"""
+    db_status = "ok"
+    try:
+        KnowledgeBase.objects.first()
+    except Exception as e:
+        db_status = f"error: {str(e)}"
+    
+    # 检查模型配置
+    active_models = ModelConfig.objects.filter(is_active=True).count()
+    return db_status, active_models
+
+
 @router.get("/health", summary="系统健康检查")
-def health_check(request):
+async def health_check(request):
     """系统健康检查"""
     try:
         # 检查RAG系统
         rag_system = get_rag_system()
         
         # 检查数据库连接
-        db_status = "ok"
-        try:
-            KnowledgeBase.objects.first()
-        except Exception as e:
-            db_status = f"error: {str(e)}"
-        
-        # 检查模型配置
-        active_models = ModelConfig.objects.filter(is_active=True).count()
+        db_status, active_models = await run_db(_check_database)
         
         # 测试问答系统基本功能
         qa_test_status = "ok"
         try:
-            import asyncio
-            async def test_qa():
-                return await rag_system.ask_question(
-                    kb_id=1,
-                    question="健康检查测试",
-                    config_id=None,
-                    top_k=1,
-                    threshold=0.5
-                )
-            
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            test_result = loop.run_until_complete(test_qa())
-            loop.close()
+            test_result = await rag_system.ask_question(
+                kb_id=1,
+                question="健康检查测试",
+                config_id=None,
+                top_k=1,
+                threshold=0.5
+            )
             
             # 检查返回结果是否包含必要字段
             required_fields = ['answer', 'sources', 'model_used', 'response_time']
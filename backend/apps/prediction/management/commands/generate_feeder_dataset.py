@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成多馈线负荷数据集的Django管理命令（用于预测服务压测）
+
+按批流式生成多条馈线多年的数据，逐批写入 settings.PREDICTION_DATASETS 配置的数据集存储，
+内存占用与数据总量无关。
+"""
+
+import os
+import time
+
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_prediction.data_generator import DataGenerator
+
+
+class Command(BaseCommand):
+    help = '流式生成多馈线负荷数据集'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='数据集名称')
+        parser.add_argument('--feeders', type=int, default=100, help='馈线数，编号为 feeder-0000 起')
+        parser.add_argument('--start', default='2024-01-01', help='开始日期')
+        parser.add_argument('--years', type=int, default=1, help='生成的年数')
+        parser.add_argument('--batch-days', type=int, default=30, help='每批的天数')
+        parser.add_argument('--processes', type=int, default=0, help='生成进程数，0 表示在当前进程生成')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        from ai_prediction.dataset_store import DatasetStore, PYARROW_AVAILABLE
+
+        if not PYARROW_AVAILABLE:
+            raise CommandError('数据集存储需要安装 pyarrow')
+        config = getattr(settings, 'PREDICTION_DATASETS', {})
+        store = DatasetStore(
+            config.get('root', os.path.join(str(settings.MEDIA_ROOT), 'prediction', 'datasets')),
+            file_format=config.get('format', 'parquet'),
+            partition=config.get('partition', 'month'),
+        )
+
+        start = pd.Timestamp(options['start'])
+        end = start + pd.DateOffset(years=options['years'])
+        feeders = [f"feeder-{i:04d}" for i in range(options['feeders'])]
+        self.stdout.write(f"生成 {len(feeders)} 条馈线 {start:%Y-%m-%d} ~ {end:%Y-%m-%d} 的数据...")
+
+        begin = time.perf_counter()
+        manifest = DataGenerator(seed=options['seed']).write_feeder_dataset(
+            store, options['name'], feeders, start, end,
+            batch_size=96 * options['batch_days'], processes=options['processes'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ 数据集 {options['name']} 已保存: {manifest['rows']} 行, {len(manifest['partitions'])} 个分区, "
+            f"耗时 {time.perf_counter() - begin:.1f} s"
+        ))
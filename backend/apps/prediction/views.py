@@ -13,10 +13,9 @@ from django.views.decorators.http import require_http_methods
 import json
 import sys
 import os
+import time
 import traceback
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
 
 # 添加AI预测模块路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -29,6 +28,9 @@ _data_preprocessor = None
 _model_manager = None
 _predictor = None
 _visualizer = None
+_dataset_store = None
+_artifact_store = None
+_model_load_info = {}
 _system_initialized = False
 
 def check_system_ready():
@@ -44,9 +46,78 @@ def check_system_ready():
     
     return _system_initialized
 
+def _get_dataset_store():
+    """训练数据集存储，未安装 pyarrow 时返回 None"""
+    global _dataset_store
+    if _dataset_store is None:
+        from django.conf import settings
+        from ai_prediction.dataset_store import DatasetStore, PYARROW_AVAILABLE
+        
+        if not PYARROW_AVAILABLE:
+            return None
+        config = getattr(settings, 'PREDICTION_DATASETS', {})
+        _dataset_store = DatasetStore(
+            config.get('root', os.path.join(str(settings.MEDIA_ROOT), 'prediction', 'datasets')),
+            file_format=config.get('format', 'parquet'),
+            partition=config.get('partition', 'month'),
+        )
+    return _dataset_store
+
+def _load_training_data(data_generator, data_preprocessor, days):
+    """读取训练数据集（只读取预处理需要的列），不存在时生成并保存"""
+    name = f"training_{days}d_seed{data_generator.seed}"
+    try:
+        store = _get_dataset_store()
+        if store is not None:
+            if not store.exists(name):
+                store.write(name, data_generator.generate_training_data(days=days))
+                print(f"💾 训练数据集已保存: {name}")
+            return data_preprocessor.load_dataset(store, name)
+    except Exception as e:
+        print(f"⚠️ 训练数据集读写失败，改为直接生成: {e}")
+    return data_generator.generate_training_data(days=days)
+
+def _get_artifact_store():
+    """模型制品存储，配置中关闭时返回 None"""
+    global _artifact_store
+    if _artifact_store is None:
+        from django.conf import settings
+        from ai_prediction.artifact_store import ModelArtifactStore
+        
+        config = getattr(settings, 'PREDICTION_ARTIFACTS', {})
+        if not config.get('enabled', True):
+            return None
+        _artifact_store = ModelArtifactStore(
+            config.get('root', os.path.join(str(settings.MEDIA_ROOT), 'prediction', 'artifacts')),
+            keep=config.get('keep', 5),
+        )
+    return _artifact_store
+
+def _load_model_artifact(fingerprint):
+    """加载用指纹相同的训练数据训练的最新模型制品，返回版本信息，没有时返回 None"""
+    try:
+        store = _get_artifact_store()
+        if store is not None:
+            return store.load(_model_manager, _data_preprocessor, data_fingerprint=fingerprint)
+    except Exception as e:
+        print(f"⚠️ 模型制品加载失败，改为重新训练: {e}")
+    return None
+
+def _save_model_artifact(fingerprint, training):
+    """保存训练好的模型制品，返回版本号，保存失败不影响使用"""
+    try:
+        store = _get_artifact_store()
+        if store is not None:
+            return store.save(_model_manager, _data_preprocessor, data_fingerprint=fingerprint,
+                              training=training)['version']
+    except Exception as e:
+        print(f"⚠️ 模型制品保存失败: {e}")
+    return None
+
 def initialize_ai_system():
     """初始化AI预测系统"""
     global _data_generator, _data_preprocessor, _model_manager, _predictor, _visualizer, _system_initialized
+    global _model_load_info
     
     if _system_initialized:
         print("✅ AI系统已初始化")
@@ -71,40 +142,71 @@ def initialize_ai_system():
         from ai_prediction.model_manager import ModelManager
         from ai_prediction.predictor import LoadPredictor
         from ai_prediction.visualizer import Visualizer
+        from ai_prediction.artifact_store import data_fingerprint
         
-        # 1. 初始化数据生成器
+        # 1. 初始化数据生成器和预处理器
         print("📊 初始化数据生成器...")
         _data_generator = DataGenerator()
-        
-        # 2. 生成训练数据 (使用较少的数据量以加快速度)
-        print("📊 生成训练数据...")
-        train_data = _data_generator.generate_training_data(days=14)  # 2周数据
-        print(f"✅ 生成数据完成，数据量: {len(train_data)}")
-        
-        # 3. 初始化数据预处理器
-        print("🔧 初始化数据预处理器...")
         _data_preprocessor = DataPreprocessor()
-        X_train, X_test, y_train, y_test = _data_preprocessor.fit_transform(train_data)
-        print(f"✅ 数据预处理完成，训练集: {X_train.shape}, 测试集: {X_test.shape}")
-        
-        # 4. 初始化模型管理器并训练
-        print("🤖 初始化模型管理器...")
         _model_manager = ModelManager()
         
-        print("📚 开始训练核心模型...")
-        training_success = _model_manager.train_core_models(X_train, y_train, X_test, y_test)
-        
-        if not training_success:
-            print("❌ 模型训练失败")
-            return False
+        # 2. 读取训练数据 (使用较少的数据量以加快速度)，首次运行时生成并保存
+        print("📊 读取训练数据...")
+        train_data = _load_training_data(_data_generator, _data_preprocessor, days=14)  # 2周数据
+        fingerprint = data_fingerprint(train_data, _data_preprocessor.feature_columns + ['load'])
+        print(f"✅ 训练数据就绪，数据量: {len(train_data)}")
+        
+        # 3. 加载用相同数据训练的模型制品，没有有效制品时重新训练
+        start_time = time.perf_counter()
+        manifest = _load_model_artifact(fingerprint)
+        if manifest:
+            _model_load_info = {
+                'source': 'artifact',
+                'version': manifest['version'],
+                'trained_at': manifest['created_at'],
+                'load_time': round(time.perf_counter() - start_time, 4),
+            }
+            print(f"📂 已加载模型制品 {manifest['version']}，耗时 {_model_load_info['load_time'] * 1000:.1f} ms")
+        else:
+            X_train, X_test, y_train, y_test = _data_preprocessor.fit_transform(train_data)
+            print(f"✅ 数据预处理完成，训练集: {X_train.shape}, 测试集: {X_test.shape}")
+            
+            print("📚 开始训练核心模型...")
+            from django.conf import settings
+            training_config = getattr(settings, 'PREDICTION_TRAINING', {})
+            training_success = _model_manager.train_core_models(
+                X_train, y_train, X_test, y_test,
+                processes=training_config.get('processes', 0),
+                cpu_budget=training_config.get('cpu_budget'),
+                deadline=training_config.get('deadline_seconds'),
+            )
+            
+            if not training_success:
+                print("❌ 模型训练失败")
+                return False
+            
+            training_time = round(time.perf_counter() - start_time, 4)
+            _model_load_info = {
+                'source': 'trained',
+                'version': _save_model_artifact(fingerprint, {
+                    'days': 14,
+                    'rows': len(train_data),
+                    'train_rows': len(X_train),
+                    'test_rows': len(X_test),
+                    'training_time': training_time,
+                }),
+                'trained_at': datetime.now().isoformat(),
+                'load_time': training_time,
+                'training_time': training_time,
+            }
         
-        print(f"✅ 模型训练完成，最佳模型: {_model_manager.best_model_name}")
+        print(f"✅ 模型就绪，最佳模型: {_model_manager.best_model_name}")
         
-        # 5. 初始化预测器
+        # 4. 初始化预测器
         print("🔮 初始化预测器...")
         _predictor = LoadPredictor(_model_manager, _data_preprocessor)
         
-        # 6. 初始化可视化工具
+        # 5. 初始化可视化工具
         print("📊 初始化可视化工具...")
         _visualizer = Visualizer()
         
@@ -187,7 +289,8 @@ def initialize_system(request):
                 "data": {
                     "best_model": _model_manager.best_model_name if _model_manager else None,
                     "available_models": list(_model_manager.models.keys()) if _model_manager else [],
-                    "training_status": _model_manager.is_trained if _model_manager else False
+                    "training_status": _model_manager.is_trained if _model_manager else False,
+                    "model_load": _model_load_info
                 }
             }
         else:
@@ -227,13 +330,15 @@ def get_system_status(request):
         status.update({
             "available_models": list(_model_manager.models.keys()),
             "best_model": _model_manager.best_model_name,
-            "models_trained": _model_manager.is_trained
+            "models_trained": _model_manager.is_trained,
+            "model_load": _model_load_info
         })
     else:
         status.update({
             "available_models": [],
             "best_model": None,
-            "models_trained": False
+            "models_trained": False,
+            "model_load": {}
         })
     
     return {"success": True, "data": status}
@@ -258,7 +363,8 @@ def debug_info(request):
             "models_list": list(_model_manager.models.keys()) if hasattr(_model_manager, 'models') else [],
             "is_trained": _model_manager.is_trained if hasattr(_model_manager, 'is_trained') else False,
             "best_model": _model_manager.best_model_name if hasattr(_model_manager, 'best_model_name') else None,
-            "performance_data": len(_model_manager.performance) if hasattr(_model_manager, 'performance') else 0
+            "performance_data": len(_model_manager.performance) if hasattr(_model_manager, 'performance') else 0,
+            "model_load": _model_load_info
         })
     
     return {"success": True, "data": debug_data}
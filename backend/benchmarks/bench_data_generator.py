@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+负荷训练数据生成基准测试 - 比较旧的逐时间点循环生成与按列向量化生成
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_data_generator.py --days 365
+    python benchmarks/bench_data_generator.py --days 3650 --repeat 1 --skip-legacy
+
+除耗时外还对比两种实现输出的统计特征（各列均值/标准差、分时段负荷均值、温湿度相关系数、
+降雨比例、节假日比例），两者应只有随机抽样带来的差异。
+
+参考结果（单核）:
+    365 天 35041 行     legacy row loop   1040.9 ms   vectorized  14.9 ms  (69.8x)
+    3650 天 350401 行   legacy row loop  11183.5 ms   vectorized 170.6 ms  (65.6x)
+向量化实现中约三分之一的时间用于从时间索引取时、星期、月、日字段。
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_prediction.data_generator import DataGenerator  # noqa: E402
+
+
+def legacy_generate(days, seed=42):
+    """旧实现：逐个15分钟时间点抽取标量随机数、构造字典，最后转为DataFrame（仅用于对比）"""
+    np.random.seed(seed)
+    random.seed(seed)
+    monthly_temp = {1: 5, 2: 8, 3: 12, 4: 18, 5: 23, 6: 28, 7: 32, 8: 31, 9: 27, 10: 21, 11: 14, 12: 7}
+    start_date = datetime(2024, 1, 1)
+    time_points = pd.date_range(start=start_date, end=start_date + timedelta(days=days), freq='15min')
+
+    data = []
+    for timestamp in time_points:
+        hour = timestamp.hour
+        weekday = timestamp.weekday()
+        if 6 <= hour <= 8 or 18 <= hour <= 20:
+            base_load = 120 + np.random.normal(0, 10)
+        elif 9 <= hour <= 17:
+            base_load = 90 + np.random.normal(0, 8)
+        else:
+            base_load = 60 + np.random.normal(0, 5)
+        if weekday >= 5:
+            base_load *= 0.8
+
+        if 6 <= hour <= 14:
+            temp_adj = (hour - 6) * 2
+        elif 15 <= hour <= 18:
+            temp_adj = 16 - (hour - 14) * 2
+        else:
+            temp_adj = -5
+        temperature = max(-10, min(40, monthly_temp[timestamp.month] + temp_adj + np.random.normal(0, 2)))
+        humidity = max(20, min(100, 80 - (temperature - 10) * 1.5 + np.random.normal(0, 10)))
+        wind_speed = np.random.uniform(0, 15)
+        rainfall = np.random.exponential(0.1) if np.random.random() < 0.3 else 0
+
+        if temperature > 25:
+            base_load += (temperature - 25) * 2
+        elif temperature < 10:
+            base_load += (10 - temperature) * 1.5
+        if humidity > 80:
+            base_load += 5
+        load = max(20, base_load + np.random.normal(0, 3))
+
+        is_holiday = 1 if (timestamp.month == 1 and timestamp.day <= 3) or \
+                        (timestamp.month == 5 and timestamp.day == 1) or \
+                        (timestamp.month == 10 and timestamp.day <= 3) else 0
+        data.append({
+            'timestamp': timestamp, 'hour': hour, 'minute': timestamp.minute, 'weekday': weekday,
+            'is_weekend': 1 if weekday >= 5 else 0, 'is_holiday': is_holiday,
+            'temperature': round(temperature, 1), 'humidity': round(humidity, 1),
+            'wind_speed': round(wind_speed, 1), 'rainfall': round(rainfall, 1), 'load': round(load, 2)
+        })
+    return pd.DataFrame(data)
+
+
+def vectorized_generate(days, seed=42):
+    return DataGenerator(seed).generate_training_data(days=days)
+
+
+def summarize(df):
+    """输出的统计特征"""
+    stats = {}
+    for column in ['temperature', 'humidity', 'wind_speed', 'rainfall', 'load']:
+        stats[f'{column} mean'] = df[column].mean()
+        stats[f'{column} std'] = df[column].std()
+    for name, hours in [('peak', [6, 7, 8, 18, 19, 20]), ('day', list(range(9, 18))), ('night', [0, 1, 2, 3, 4, 5, 21, 22, 23])]:
+        stats[f'load mean ({name})'] = df.loc[df['hour'].isin(hours), 'load'].mean()
+    stats['load mean (weekend)'] = df.loc[df['is_weekend'] == 1, 'load'].mean()
+    stats['corr(temperature, humidity)'] = df['temperature'].corr(df['humidity'])
+    stats['corr(temperature, load)'] = df['temperature'].corr(df['load'])
+    stats['rainfall > 0 ratio'] = (df['rainfall'] > 0).mean()
+    stats['is_holiday ratio'] = df['is_holiday'].mean()
+    return stats
+
+
+def measure(func, days, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = func(days)
+        best = min(best, time.perf_counter() - start)
+    return best, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='负荷训练数据生成基准测试')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy', action='store_true', help='只测试向量化实现（天数很大时）')
+    args = parser.parse_args()
+
+    candidates = [('vectorized', vectorized_generate)]
+    if not args.skip_legacy:
+        candidates.insert(0, ('legacy row loop', legacy_generate))
+
+    baseline = None
+    frames = {}
+    for name, func in candidates:
+        seconds, df = measure(func, args.days, args.repeat)
+        baseline = baseline or seconds
+        frames[name] = df
+        print(f"{name:<18}{seconds * 1000:10.1f} ms  {len(df) / seconds / 1e3:10.1f} K行/s  ({baseline / seconds:6.1f}x)")
+
+    if len(frames) == 2:
+        legacy, vectorized = (summarize(df) for df in frames.values())
+        print(f"\n{'统计量':<30}{'legacy':>12}{'vectorized':>12}")
+        for key in legacy:
+            print(f"{key:<32}{legacy[key]:12.3f}{vectorized[key]:12.3f}")
+        assert list(frames['legacy row loop'].columns) == list(frames['vectorized'].columns)
+        assert (frames['legacy row loop'].dtypes == frames['vectorized'].dtypes).all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多馈线流式数据生成基准测试 - 检查 iter_feeder_batches / write_feeder_dataset 的峰值内存不随数据量增长
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_feeder_stream.py --feeders 20 --years 1 3
+    python benchmarks/bench_feeder_stream.py --feeders 50 --years 3 --write --format feather
+    python benchmarks/bench_feeder_stream.py --feeders 20 --years 1 --processes 2
+    python benchmarks/bench_feeder_stream.py --feeders 20 --years 1 3 --materialize
+
+对每个年数分别流式生成（--write 时同时写入临时目录中的 DatasetStore 数据集；--materialize
+时作为对照把全部批合并为一个 DataFrame），用 tracemalloc 记录 Python/numpy 分配的峰值内存，
+用 pyarrow 内存池记录 Arrow 分配的峰值，并与全部数据的大小对比。--processes 大于0时只统计主进程。
+
+参考结果（单核，20 条馈线，批大小30天）:
+    流式生成          1 年  70 万行   75 MB    1.7 s   tracemalloc 峰值   0.8 MB
+                      3 年 210 万行  225 MB    3.6 s   tracemalloc 峰值   0.8 MB
+    --write parquet   1 年  70 万行   75 MB   13.1 s   tracemalloc 峰值   1.5 MB   Arrow 峰值 0.6 MB
+                      3 年 210 万行  225 MB   40.3 s   tracemalloc 峰值   1.5 MB   Arrow 峰值 0.6 MB
+    --materialize     1 年  70 万行   75 MB    3.1 s   tracemalloc 峰值 126.0 MB
+                      3 年 210 万行  225 MB    9.7 s   tracemalloc 峰值 376.5 MB
+流式生成和逐批写入的峰值内存只与批大小有关，数据量增至3倍时不变；合并为一个 DataFrame 时随数据量线性增长。
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_prediction.data_generator import DataGenerator, feeder_batch_frame  # noqa: E402
+
+try:
+    import pyarrow as pa
+    from ai_prediction.dataset_store import DatasetStore  # noqa: E402
+except ImportError:
+    pa = None
+
+
+def run(feeders, years, args, root):
+    generator = DataGenerator(seed=42)
+    start = pd.Timestamp('2024-01-01')
+    end = start + pd.DateOffset(years=years)
+    feeder_ids = [f'feeder-{i:04d}' for i in range(feeders)]
+    batch_size = 96 * args.batch_days
+
+    tracemalloc.start()
+    begin = time.perf_counter()
+    if args.write:
+        store = DatasetStore(root, file_format=args.format)
+        manifest = generator.write_feeder_dataset(
+            store, 'feeders', feeder_ids, start, end, batch_size, processes=args.processes
+        )
+        rows = manifest['rows']
+    elif args.materialize:
+        rows = len(pd.concat([
+            feeder_batch_frame(batch)
+            for batch in generator.iter_feeder_batches(feeder_ids, start, end, batch_size, processes=args.processes)
+        ], ignore_index=True))
+    else:
+        rows = 0
+        for batch in generator.iter_feeder_batches(feeder_ids, start, end, batch_size, processes=args.processes):
+            rows += len(batch['columns']['timestamp'])
+    elapsed = time.perf_counter() - begin
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sample = feeder_batch_frame(next(generator.iter_feeder_batches(feeder_ids[:1], start, end, 96)))
+    data_bytes = rows * sample.memory_usage(index=False).sum() / len(sample)
+    # 内存池只记录进程内的最大值，按年数从小到大运行时即为截至本轮的峰值
+    arrow = f"   Arrow 峰值 {pa.default_memory_pool().max_memory() / 1e6:.1f} MB" if args.write else ''
+    print(f"RESULT {feeders} 馈线 x {years} 年 {rows / 1e4:6.0f} 万行 {data_bytes / 1e6:6.0f} MB 数据 "
+          f"{elapsed:7.1f} s   tracemalloc 峰值 {traced_peak / 1e6:.1f} MB{arrow}")
+    return traced_peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多馈线流式数据生成基准测试')
+    parser.add_argument('--feeders', type=int, default=20)
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 3], help='按从小到大的顺序给出')
+    parser.add_argument('--batch-days', type=int, default=30)
+    parser.add_argument('--processes', type=int, default=0)
+    parser.add_argument('--write', action='store_true', help='同时逐批写入 DatasetStore 数据集')
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'feather'])
+    parser.add_argument('--materialize', action='store_true', help='对照：把全部批合并为一个 DataFrame')
+    args = parser.parse_args()
+    if args.write and pa is None:
+        parser.error('--write 需要安装 pyarrow')
+
+    root = tempfile.mkdtemp(prefix='bench-feeders-')
+    try:
+        peaks = [run(args.feeders, years, args, root) for years in args.years]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    if len(peaks) > 1:
+        print(f"\n峰值内存 {args.years[-1]} 年 / {args.years[0]} 年: {peaks[-1] / peaks[0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
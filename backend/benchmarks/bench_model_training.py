@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+核心模型训练基准测试 - 比较 train_core_models 在当前进程依次训练与在 loky 进程池中并行训练
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_model_training.py --days 14
+    python benchmarks/bench_model_training.py --days 90 --processes 4 --cpu-budget 8
+    python benchmarks/bench_model_training.py --days 14 --deadline 0.5
+
+并行训练测两轮：第一轮包含进程池启动（每个工作进程导入 scikit-learn 等），第二轮复用已启动的
+工作进程。输出总耗时、各模型的训练耗时（training_time）和最佳模型。服务进程初始化时只训练一次，
+对应第一轮（cold pool）的耗时；是否开启 settings.PREDICTION_TRAINING['processes'] 应按这一轮
+与依次训练的对比决定。
+
+参考结果（单核，14 天 1345 行）:
+    sequential                  0.79 s  RandomForest 0.68 s, 其余模型合计 0.08 s
+    parallel x3 (cold pool)     8.48 s  工作进程导入 scikit-learn 约 2.3 s/个，在单核上依次进行
+    parallel x3 (warm pool)     1.07 s  单核上各模型争用同一个核
+    parallel x3, deadline 0.3s  0.30 s  返回期限内完成的 LinearRegression/GradientBoosting
+默认数据量下依次训练最快，因此默认 processes=0；多核机器上的收益未测量。
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_prediction.data_generator import DataGenerator  # noqa: E402
+from ai_prediction.data_preprocessor import DataPreprocessor  # noqa: E402
+from ai_prediction.model_manager import ModelManager  # noqa: E402
+
+
+def run(name, data, **kwargs):
+    manager = ModelManager()
+    start = time.perf_counter()
+    manager.train_core_models(*data, **kwargs)
+    elapsed = time.perf_counter() - start
+    times = ', '.join(f"{model} {metrics['training_time']:.3f}s" for model, metrics in manager.performance.items())
+    print(f"RESULT {name:<28}{elapsed:8.2f} s  最佳 {manager.best_model_name}  [{times}]")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='核心模型训练基准测试')
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--processes', type=int, default=3)
+    parser.add_argument('--cpu-budget', type=int, default=None)
+    parser.add_argument('--deadline', type=float, default=None, help='另外测试一轮带训练期限的并行训练')
+    args = parser.parse_args()
+
+    preprocessor = DataPreprocessor()
+    X_train, X_test, y_train, y_test = preprocessor.fit_transform(
+        DataGenerator().generate_training_data(days=args.days)
+    )
+    data = (X_train, y_train, X_test, y_test)
+
+    results = [
+        run('sequential', data, processes=0),
+        run(f'parallel x{args.processes} (cold pool)', data, processes=args.processes, cpu_budget=args.cpu_budget),
+        run(f'parallel x{args.processes} (warm pool)', data, processes=args.processes, cpu_budget=args.cpu_budget),
+    ]
+    if args.deadline is not None:
+        run(f'parallel, deadline {args.deadline}s', data,
+            processes=args.processes, cpu_budget=args.cpu_budget, deadline=args.deadline)
+    print(f"\n复用进程池的并行训练 / 依次训练: {results[2] / results[0]:.2f}x 耗时")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文本分块吞吐基准测试 - 比较旧的按字符窗口分块与按句子边界、词元预算分块
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_splitter.py --mb 100
+    python benchmarks/bench_splitter.py --mb 10 --chunk-tokens 256 --overlap 1
+
+语料由样例段落（含标题、中英文混排）重复拼接而成。流式分块按 64K 字的文本块输入，
+并校验与整体分块的结果一致。
+
+参考结果（100 MB 语料，单核，chunk_tokens=512，overlap_sentences=2）:
+    legacy char window          0.55 s   182.59 MB/s     65524 块
+    boundary scan only          3.33 s    30.06 MB/s   1572568 块
+    sentence/token split       10.14 s     9.86 MB/s     43684 块
+    streaming (64K blocks)     11.89 s     8.41 MB/s     43684 块
+分块按 estimate_tokens 估计词元数，不调用 jieba（逐句调用 jieba 计数时约 0.53 MB/s）；
+抽样 200 块: 估计词元数平均 472，count_tokens 平均 450、最大 473，均不超过 chunk_tokens。
+"""
+
+import os
+import sys
+import time
+import argparse
+from itertools import zip_longest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.knowledge.rag_system_simple import TextSplitter  # noqa: E402
+from apps.knowledge.tokenizer import count_tokens  # noqa: E402
+
+SAMPLE = (
+    "# 第{n}章 变电运维\n"
+    "电力系统继电保护是保证电网安全稳定运行的重要措施。变压器差动保护、线路距离保护和母线保护"
+    "构成了主保护体系！配电网自动化通过馈线终端实现故障定位、隔离和非故障区域恢复供电。\n"
+    "Smart grid SCADA systems collect telemetry at 2s intervals? 电压等级包括10kV、35kV、110kV和220kV。\n\n"
+    "## 巡视要求\n"
+    "值班人员应每班巡视一次，检查油位、油温、声音及冷却装置运行情况，发现异常立即汇报。\n"
+)
+
+
+def legacy_split(text, chunk_size=1000, chunk_overlap=200):
+    """旧实现：固定字符窗口，窗口内 rfind 句号（仅用于对比）"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunk = text[start:end]
+        if end < len(text):
+            last_period = chunk.rfind('。')
+            if last_period > chunk_size // 2:
+                chunk = chunk[:last_period + 1]
+                end = start + last_period + 1
+        chunks.append({'content': chunk.strip(), 'chunk_word_count': len(chunk.split())})
+        start = end - chunk_overlap
+    return chunks
+
+
+def make_corpus(megabytes):
+    """拼接样例段落直到 UTF-8 编码达到指定大小"""
+    target = int(megabytes * 1024 * 1024)
+    parts, size, n = [], 0, 0
+    while size < target:
+        n += 1
+        part = SAMPLE.format(n=n)
+        parts.append(part)
+        size += len(part.encode('utf-8'))
+    return ''.join(parts)
+
+
+def iter_blocks(text, block_chars=1 << 16):
+    for start in range(0, len(text), block_chars):
+        yield text[start:start + block_chars]
+
+
+def report(name, seconds, megabytes, chunks):
+    print(f"{name:<24}{seconds:9.2f} s  {megabytes / seconds:8.2f} MB/s  {chunks:>9} 块")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文本分块吞吐基准测试')
+    parser.add_argument('--mb', type=float, default=100.0, help='语料大小（MB，UTF-8）')
+    parser.add_argument('--chunk-tokens', type=int, default=None)
+    parser.add_argument('--overlap', type=int, default=None, help='重叠句子数')
+    args = parser.parse_args()
+
+    text = make_corpus(args.mb)
+    megabytes = len(text.encode('utf-8')) / 1024 / 1024
+    splitter = TextSplitter(chunk_tokens=args.chunk_tokens, overlap_sentences=args.overlap)
+    print(f"语料: {megabytes:.1f} MB, {len(text)} 字; "
+          f"chunk_tokens={splitter.chunk_tokens}, overlap_sentences={splitter.overlap_sentences}")
+
+    start = time.perf_counter()
+    chunks = legacy_split(text)
+    report('legacy char window', time.perf_counter() - start, megabytes, len(chunks))
+    del chunks
+
+    start = time.perf_counter()
+    sentences = sum(1 for _ in splitter._iter_sentences([text]))
+    report('boundary scan only', time.perf_counter() - start, megabytes, sentences)
+
+    start = time.perf_counter()
+    chunks = splitter.split_text(text)
+    report('sentence/token split', time.perf_counter() - start, megabytes, len(chunks))
+
+    start = time.perf_counter()
+    identical = all(a == b for a, b in zip_longest(splitter.split_stream(iter_blocks(text)), chunks))
+    report('streaming (64K blocks)', time.perf_counter() - start, megabytes, len(chunks))
+    print(f"流式结果与整体一致: {identical}")
+
+    # 分块使用估计的词元数，抽样对比 count_tokens（安装 jieba 时为 jieba 分词）的实际词元数
+    sample = chunks[:200]
+    actual = [count_tokens(chunk['content']) for chunk in sample]
+    estimated = [chunk['metadata']['chunk_tokens'] for chunk in sample]
+    print(f"抽样 {len(sample)} 块: 估计词元数平均 {sum(estimated) / len(sample):.0f}, "
+          f"count_tokens 平均 {sum(actual) / len(sample):.0f}、最大 {max(actual)}")
+
+
+if __name__ == '__main__':
+    main()
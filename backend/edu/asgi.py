@@ -3,6 +3,17 @@ ASGI config for edu project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The knowledge Q&A endpoints (/api/knowledge/qa/ask, /qa/ask/stream, /models/test,
+/health) are async views. Served through this module, concurrent questions share
+one event loop and overlap their LLM waits; ORM access runs in the bounded thread
+pool configured by KNOWLEDGE_DB_EXECUTOR, and /qa/ask/stream sends answer tokens as
+they arrive. Run it with an ASGI server, e.g.:
+
+    uvicorn edu.asgi:application --host 0.0.0.0 --port 8000
+
+``manage.py runserver`` (WSGI) still serves every endpoint, but runs each async
+view on its own event loop and buffers the streaming response until it completes.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -14,3 +25,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'edu.settings')
 
 application = get_asgi_application()
+
+# Resume unfinished knowledge-base document ingestion in this server process
+from apps.knowledge.views import start_ingestion  # noqa: E402
+
+start_ingestion()
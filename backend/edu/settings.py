@@ -171,3 +171,124 @@ FILE_UPLOAD_TEMP_DIR = None  # 使用系统默认临时目录
 
 # 上传文件权限
 FILE_UPLOAD_PERMISSIONS = 0o644
+
+# 知识库文档入库队列：上传后由后台线程池处理
+KNOWLEDGE_INGESTION = {
+    'workers': 4,              # 并行处理的文档数
+    'progress_interval': 1.0,  # 进度写库的最小间隔（秒）
+    'stale_seconds': 600,      # processing 状态超过该时间无心跳视为中断，重启后重新入队
+    'heartbeat_interval': 30,  # 处理中文档的心跳间隔（秒）
+}
+
+# 知识库文档解析进程池：PDF/DOCX/Markdown 解析在独立进程中执行，大PDF按页范围拆分
+KNOWLEDGE_PARSING = {
+    'processes': None,         # None 表示CPU核数；0 表示不使用进程池
+    'pdf_pages_per_task': 32,
+}
+
+# 知识库文本分块：按句子边界切分，块大小以估计的词元数计（中文约2字、英文约4字符一个词元）
+KNOWLEDGE_TEXT_SPLITTER = {
+    'chunk_tokens': 512,
+    'overlap_sentences': 2,
+    'max_segment_chars': 2000,
+}
+
+# 知识库检索结果缓存：重复的问题复用检索结果，知识库索引版本变化后自动失效
+KNOWLEDGE_RETRIEVAL_CACHE = {
+    'enabled': True,
+    'max_entries': 1024,
+    'ttl_seconds': 600,
+}
+
+# 大模型回答缓存（数据库表 CachedAnswer）：同一模型配置和上下文下重复的问题复用回答
+KNOWLEDGE_ANSWER_CACHE = {
+    'enabled': True,
+    'semantic': False,             # 开启后问题向量相似度达到阈值即可复用
+    'similarity_threshold': 0.95,
+    'max_entries': 5000,
+    'max_age_seconds': 7 * 24 * 3600,
+}
+
+# 大模型API连接池：每个模型配置一个常驻 aiohttp 会话，跨问题复用 TCP/TLS 连接
+KNOWLEDGE_LLM_HTTP = {
+    'pool_size': 100,          # 每个模型配置的最大连接数
+    'limit_per_host': 20,
+    'keepalive_timeout': 60,   # 空闲连接保持时间（秒）
+    'connect_timeout': 10,
+    'request_timeout': 30,     # 单次请求总超时（秒）
+}
+
+# 大模型请求限流与合并（每个模型配置独立计数）
+KNOWLEDGE_LLM_LIMITS = {
+    'max_concurrency': 8,        # 同时进行的上游请求数，None 表示不限
+    'requests_per_minute': None, # 令牌桶速率，None 表示不限
+    'burst': None,               # 令牌桶容量，None 表示等于每分钟请求数
+    'max_wait_seconds': 60,      # 排队超过该时间的请求直接失败
+    'coalesce': True,            # 相同提示词同时请求时只调用一次上游
+}
+
+# 异步问答视图访问数据库的线程池（ASGI 部署时所有并发问题共享）
+KNOWLEDGE_DB_EXECUTOR = {
+    'workers': 8,
+}
+
+# 问答上下文构建：合并重叠分块、去重后按词元预算装入提示词
+KNOWLEDGE_CONTEXT = {
+    'max_tokens': 3000,          # 模型配置未设置上下文最大Token数时的默认预算
+    'min_fragment_tokens': 64,   # 剩余预算至少有这么多词元时才截断装入最后一段
+    'separator': '\n\n',
+}
+
+# 知识库入库时每批 bulk_create 写入的分块行数
+KNOWLEDGE_CHUNK_BATCH_SIZE = 500
+
+# 知识库文本嵌入（哈希字符 n-gram）
+# 修改维度或分词特征后，各知识库的向量文件会在下次加载时自动重新编码
+KNOWLEDGE_EMBEDDING = {
+    'vector_size': 512,
+    'word_features': False,  # 额外加入 jieba 分词特征，编码速度约下降40倍
+    'batch_size': 1024,
+}
+
+# 知识库向量检索索引
+# backend: auto 在向量数达到 ivf_min_vectors 后使用IVF近似索引；flat 始终精确检索；ivf 始终使用IVF
+# nprobe 越大召回越高、检索越慢，可用 benchmarks/bench_vector_index.py 评估
+KNOWLEDGE_VECTOR_INDEX = {
+    'backend': 'auto',
+    'ivf_min_vectors': 20000,
+    'nlist': None,          # 倒排列表数，None 表示按 4*sqrt(N) 自动选择
+    'nprobe': 16,
+    'retrain_growth': 4.0,  # 向量数增长到训练时的4倍后重新训练质心
+}
+
+# 知识库混合检索：向量检索与 BM25 关键词检索按倒数排名融合(RRF)
+KNOWLEDGE_HYBRID_SEARCH = {
+    'enabled': True,
+    'k1': 1.5,
+    'b': 0.75,
+    'rrf_k': 60,
+    'candidates': 20,  # 每路检索参与融合的候选数
+}
+
+# AI负荷预测训练数据集：按月分区的列式文件（format 为 parquet 或 feather），首次初始化时生成并保存
+PREDICTION_DATASETS = {
+    'root': MEDIA_ROOT / 'prediction' / 'datasets',
+    'format': 'parquet',
+    'partition': 'month',
+}
+
+# AI负荷预测模型制品：训练后保存模型和预处理器的版本目录，启动时加载与训练数据指纹一致的最新有效版本
+PREDICTION_ARTIFACTS = {
+    'enabled': True,
+    'root': MEDIA_ROOT / 'prediction' / 'artifacts',
+    'keep': 5,                 # 保留的版本数
+}
+
+# AI负荷预测模型训练：processes 大于0时各模型在 loky 进程池中并行训练
+# 启动进程池时每个工作进程需导入 scikit-learn（单核约 2.3 s），默认的14天数据依次训练只需约 0.8 s，
+# 训练数据较大时再开启，可用 benchmarks/bench_model_training.py 评估
+PREDICTION_TRAINING = {
+    'processes': 0,            # 0 表示在当前进程依次训练；None 表示CPU核数（单核时不使用进程池）
+    'cpu_budget': None,        # 所有模型共用的CPU核数，None 表示CPU核数
+    'deadline_seconds': None,  # 训练期限，到期后使用已完成的模型中最好的一个；None 表示不限
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'edu.settings')
 
 application = get_wsgi_application()
+
+# Resume unfinished knowledge-base document ingestion in this server process
+from apps.knowledge.views import start_ingestion  # noqa: E402
+
+start_ingestion()
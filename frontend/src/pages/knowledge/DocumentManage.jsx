@@ -223,7 +223,8 @@ const DocumentManage = () => {
       width: 120,
       render: (status) => {
         const statusMap = {
-          'pending': { color: 'orange', text: '处理中' },
+          'pending': { color: 'orange', text: '排队中' },
+          'processing': { color: 'blue', text: '处理中' },
           'completed': { color: 'green', text: '已完成' },
           'failed': { color: 'red', text: '失败' }
         };
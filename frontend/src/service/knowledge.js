@@ -20,6 +20,7 @@ export const knowledgeApi = {
     params: { kb_id: kbId, ...params } 
   }),
   getDocument: (documentId) => api.get(`${API_BASE}/documents/${documentId}`),
+  getDocumentProgress: (documentId) => api.get(`${API_BASE}/documents/${documentId}/progress`),
   uploadDocument: (kbId, formData) => api.post(`${API_BASE}/documents/upload`, formData, {
     params: { kb_id: kbId },
     headers: {